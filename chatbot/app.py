@@ -11,7 +11,12 @@ from dotenv import load_dotenv
 
 # Import database and authentication
 from database.config import create_database_config, init_database
+from commands import register_commands
 from services.auth.auth_manager import init_login_manager, get_user_role
+from services.webhook_queue import init_webhook_pipeline, is_async_mode_enabled, enqueue_webhook
+from services.export_jobs import init_export_workers
+from services.query_metrics import init_query_metrics
+from services.batch_loader import init_template_loaders, get_template_loaders, document_id
 from flask_login import current_user
 
 # Import routes
@@ -97,6 +102,9 @@ def create_app():
     # Database configuration
     app = create_database_config(app)
     
+    # Per-request Mongo query counts, X-DB-* headers / logs and /metrics
+    init_query_metrics(app)
+    
     # Initialize Flask-Login
     init_login_manager(app)
     
@@ -119,33 +127,29 @@ def create_app():
     def inject_current_user():
         return dict(current_user=current_user)
     
-    # Custom template filters
+    # Custom template filters, batched per request: every business/category
+    # in the template context is resolved with one query per filter
+    init_template_loaders(app)
+    
     @app.template_filter('product_count')
     def product_count_filter(business):
         """Get the count of products for a business"""
-        from models import Product
-        count = Product.objects(business=business).count()
-        return int(count) if count is not None else 0
+        return get_template_loaders().product_count.load(document_id(business))
     
     @app.template_filter('order_count')
     def order_count_filter(business):
         """Get the count of orders for a business"""
-        from models import Order
-        count = Order.objects(business=business).count()
-        return int(count) if count is not None else 0
+        return get_template_loaders().order_count.load(document_id(business))
     
     @app.template_filter('category_count')
     def category_count_filter(business):
         """Get the count of categories for a business"""
-        from models import Category
-        count = Category.objects(business=business).count()
-        return int(count) if count is not None else 0
+        return get_template_loaders().category_count.load(document_id(business))
     
     @app.template_filter('category_products')
     def category_products_filter(category):
         """Get products for a category"""
-        from models import Product
-        return list(Product.objects(category=category))
+        return get_template_loaders().category_products.load(document_id(category))
     
     @app.template_filter('total_messages')
     def total_messages_filter(sessions):
@@ -154,7 +158,7 @@ def create_app():
             return 0
         total = 0
         for session in sessions.items:
-            total += len(session.messages) if session.messages else 0
+            total += session.message_count or 0
         return total
     
     # Register error handlers
@@ -233,6 +237,15 @@ def create_app():
     # Initialize database
     init_database(app)
     
+    # Start background webhook workers (only when WEBHOOK_ASYNC_MODE is enabled)
+    init_webhook_pipeline(app)
+    
+    # Start background export workers (unless EXPORT_WORKERS_ENABLED is false)
+    init_export_workers(app)
+    
+    # Register maintenance CLI commands
+    register_commands(app)
+    
     # Handle Incoming WhatsApp Messages (exempt from CSRF)
     @app.route('/whatsapp/message', methods=['GET', 'POST'])
     @csrf.exempt
@@ -247,6 +260,11 @@ def create_app():
                 logger.warning("Received WhatsApp webhook with no JSON data")
                 return jsonify({"status": "ok"}), 200
             
+            # Acknowledge immediately and let the worker pool do the processing
+            if is_async_mode_enabled():
+                enqueue_webhook('system', data)
+                return jsonify({"status": "ok"}), 200
+            
             return messaging_service.process_whatsapp_message(data)
         except Exception as e:
             logger.error(f"Error processing WhatsApp webhook: {str(e)}", exc_info=True)
@@ -260,9 +278,9 @@ def create_app():
             return messaging_service.verify_business_webhook(business_id)
         
         try:
-            # Get the business
-            from models import Business
-            business = Business.objects(id=business_id).first()
+            # Get the business from the routing cache
+            from services.business_cache import get_cached_business
+            business = get_cached_business(business_id)
             if not business:
                 logger.error(f"Business not found: {business_id}")
                 return jsonify({"error": "Business not found"}), 404
@@ -273,6 +291,10 @@ def create_app():
                 logger.warning(f"Received business WhatsApp webhook with no JSON data for business: {business.name}")
                 return jsonify({"status": "ok"}), 200
             
+            if is_async_mode_enabled():
+                enqueue_webhook('business', data, business_id=business.id)
+                return jsonify({"status": "ok"}), 200
+            
             # Use business-specific messaging service
             from services.business_messaging_service import process_business_whatsapp_message
             return process_business_whatsapp_message(data, business)
@@ -0,0 +1,202 @@
+"""
+Analytics benchmark
+
+Seeds a throwaway database with synthetic orders and chat sessions and times
+the per-query/Python-summing analytics against the $facet aggregations in
+AnalyticsService, for a business, a vendor (all its businesses) and the
+whole system.
+
+Usage (from the chatbot directory, needs a MongoDB server):
+    python benchmarks/analytics_benchmark.py [--uri mongodb://localhost:27017/sasabot_benchmark]
+        [--orders 1000000] [--businesses 200] [--repeat 3] [--keep]
+
+The database named in the URI is dropped before seeding and, unless --keep
+is given, afterwards. The run fails if the figures differ or if the top
+businesses / revenue chart issue more than one query each (N+1 guard).
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId
+from pymongo import monitoring
+from mongoengine import connect, Q
+
+from models import Order, ChatSession
+from services.analytics_service import AnalyticsService
+
+STATUSES = ['pending', 'paid', 'processing', 'completed', 'delivered', 'cancelled']
+PAYMENT_STATUSES = ['pending', 'paid', 'failed']
+
+def seed(db, orders, businesses, batch_size=10000):
+    """Insert synthetic businesses' orders and chat sessions, returns the business ids"""
+    business_ids = [ObjectId() for _ in range(businesses)]
+    customer_ids = [ObjectId() for _ in range(max(orders // 20, 1))]
+    now = datetime.utcnow()
+
+    batch = []
+    for i in range(orders):
+        batch.append({
+            'order_number': f"BENCH{i:09d}",
+            'business': random.choice(business_ids),
+            'customer': random.choice(customer_ids),
+            'total_amount': round(random.uniform(50, 5000), 2),
+            'status': random.choice(STATUSES),
+            'payment_status': random.choices(PAYMENT_STATUSES, weights=[3, 6, 1])[0],
+            'created_at': now - timedelta(seconds=random.randint(0, 365 * 24 * 3600)),
+            'order_items': []
+        })
+        if len(batch) >= batch_size:
+            db.orders.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        db.orders.insert_many(batch, ordered=False)
+
+    sessions = []
+    for i in range(max(orders // 10, 1)):
+        sessions.append({
+            'session_id': f"bench_{i}",
+            'business': random.choice(business_ids),
+            'customer': random.choice(customer_ids),
+            'created_at': now - timedelta(seconds=random.randint(0, 365 * 24 * 3600)),
+            'message_count': 0
+        })
+        if len(sessions) >= batch_size:
+            db.chat_sessions.insert_many(sessions, ordered=False)
+            sessions = []
+    if sessions:
+        db.chat_sessions.insert_many(sessions, ordered=False)
+
+    return business_ids
+
+# The per-query implementation the $facet aggregations replaced
+def legacy_scope_figures(business_filter, start_date):
+    base = Q(**business_filter) if business_filter else Q()
+    total_orders = Order.objects(base).count()
+    recent_orders = Order.objects(base & Q(created_at__gte=start_date)).count()
+    paid_orders = Order.objects(base & Q(payment_status='paid')).count()
+    pending_orders = Order.objects(base & Q(payment_status='pending')).count()
+    cancelled_orders = Order.objects(base & Q(status='cancelled')).count()
+    total_revenue = sum(o.total_amount or 0 for o in Order.objects(base & Q(payment_status='paid')).only('total_amount'))
+    recent_revenue = sum(o.total_amount or 0 for o in Order.objects(base & Q(payment_status='paid') & Q(created_at__gte=start_date)).only('total_amount'))
+    total_sessions = ChatSession.objects(base).count()
+    recent_sessions = ChatSession.objects(base & Q(created_at__gte=start_date)).count()
+    total_customers = len(ChatSession.objects(base).distinct('customer'))
+    recent_customers = len(ChatSession.objects(base & Q(created_at__gte=start_date)).distinct('customer'))
+    return {
+        'total_orders': total_orders, 'recent_orders': recent_orders, 'paid_orders': paid_orders,
+        'pending_orders': pending_orders, 'cancelled_orders': cancelled_orders,
+        'total_revenue': round(total_revenue, 2), 'recent_revenue': round(recent_revenue, 2),
+        'total_chat_sessions': total_sessions, 'recent_chat_sessions': recent_sessions,
+        'total_customers': total_customers, 'recent_customers': recent_customers
+    }
+
+def facet_scope_figures(match, start_date):
+    orders = AnalyticsService._get_order_facets(match, start_date)
+    chats = AnalyticsService._get_chat_facets(match, start_date)
+    return {
+        'total_orders': orders['total_orders'], 'recent_orders': orders['recent_orders'],
+        'paid_orders': orders['paid_orders'],
+        'pending_orders': orders['payment_status_breakdown'].get('pending', 0),
+        'cancelled_orders': orders['status_breakdown'].get('cancelled', 0),
+        'total_revenue': round(orders['total_revenue'], 2), 'recent_revenue': round(orders['recent_revenue'], 2),
+        'total_chat_sessions': chats['total_chat_sessions'], 'recent_chat_sessions': chats['recent_chat_sessions'],
+        'total_customers': chats['total_customers'], 'recent_customers': chats['recent_customers']
+    }
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts the queries sent to the server"""
+
+    QUERY_COMMANDS = {'find', 'aggregate', 'count', 'distinct', 'getMore'}
+
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        if event.command_name in self.QUERY_COMMANDS:
+            self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+def count_queries(counter, fn):
+    """Number of queries fn issues"""
+    before = counter.count
+    fn()
+    return counter.count - before
+
+def timed(fn, repeat):
+    """Best wall time in ms over `repeat` runs, and the last result"""
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description='Analytics aggregation benchmark')
+    parser.add_argument('--uri', default=os.getenv('BENCHMARK_MONGODB_URI', 'mongodb://localhost:27017/sasabot_benchmark'))
+    parser.add_argument('--orders', type=int, default=1000000)
+    parser.add_argument('--businesses', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--keep', action='store_true', help='Keep the benchmark database afterwards')
+    args = parser.parse_args()
+
+    counter = CommandCounter()
+    client = connect(host=args.uri, event_listeners=[counter])
+    db = client.get_default_database()
+    client.drop_database(db.name)
+    Order.ensure_indexes()
+    ChatSession.ensure_indexes()
+
+    print(f"Seeding {args.orders} orders across {args.businesses} businesses into {db.name}...")
+    started = time.perf_counter()
+    business_ids = seed(db, args.orders, args.businesses)
+    print(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+    start_date = datetime.utcnow() - timedelta(days=30)
+    vendor_businesses = business_ids[:max(len(business_ids) // 20, 1)]
+    scopes = [
+        ('business', {'business': business_ids[0]}, {'business': business_ids[0]}),
+        (f"vendor ({len(vendor_businesses)} businesses)", {'business__in': vendor_businesses}, {'business': {'$in': vendor_businesses}}),
+        ('system', {}, {})
+    ]
+
+    failed = False
+    try:
+        for label, legacy_filter, match in scopes:
+            legacy_ms, legacy = timed(lambda: legacy_scope_figures(legacy_filter, start_date), args.repeat)
+            facet_ms, facet = timed(lambda: facet_scope_figures(match, start_date), args.repeat)
+            same = legacy == facet
+            failed = failed or not same
+            print(f"{label:>28}: legacy {legacy_ms:9.1f}ms | $facet {facet_ms:9.1f}ms | "
+                  f"{legacy_ms / facet_ms if facet_ms else 0:5.1f}x | results {'match' if same else 'DIFFER'}")
+            if not same:
+                print(f"{'':>30}legacy {legacy}\n{'':>30}facet  {facet}")
+
+        # Both must stay a single aggregation however many orders match
+        for label, fn in [
+            ('top businesses', lambda: AnalyticsService._get_top_businesses(start_date)),
+            ('revenue chart', lambda: AnalyticsService._get_revenue_chart_data(30))
+        ]:
+            queries = count_queries(counter, fn)
+            failed = failed or queries > 1
+            print(f"{label:>28}: {queries} queries{'' if queries <= 1 else ' (expected 1)'}")
+    finally:
+        if not args.keep:
+            client.drop_database(db.name)
+
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+Export benchmark
+
+Seeds a throwaway database with one business's customers, products and
+orders, streams the orders export as CSV and as Excel at growing sizes, and
+reports time, query count and peak Python memory (tracemalloc) of each run.
+
+Usage (from the chatbot directory, needs a MongoDB server):
+    python benchmarks/export_benchmark.py [--uri mongodb://localhost:27017/sasabot_export_benchmark]
+        [--sizes 10000,100000,500000] [--keep]
+
+The database named in the URI is dropped before seeding and, unless --keep
+is given, afterwards. The run fails if peak memory of the largest export is
+more than twice that of the smallest, i.e. if memory grows with row count.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId
+from mongoengine import connect
+
+from services.export_service import get_export, iter_csv, iter_xlsx
+from analytics_benchmark import CommandCounter, count_queries
+
+def seed(db, orders, batch_size=10000):
+    """Insert a business with `orders` orders, returns the business id"""
+    business_id = ObjectId()
+    customers = [{'_id': ObjectId(), 'phone_number': f"2547{i:08d}", 'name': f"Customer {i}"} for i in range(max(orders // 10, 1))]
+    products = [{'_id': ObjectId(), 'business': business_id, 'name': f"Product {i}", 'price': 100.0} for i in range(200)]
+    db.customers.insert_many(customers, ordered=False)
+    db.products.insert_many(products, ordered=False)
+
+    now = datetime.utcnow()
+    batch = []
+    for i in range(orders):
+        items = [{'product': random.choice(products)['_id'], 'quantity': random.randint(1, 3), 'unit_price': 100.0, 'total_price': 100.0}
+                 for _ in range(random.randint(1, 3))]
+        batch.append({
+            'order_number': f"EXP{i:09d}",
+            'business': business_id,
+            'customer': random.choice(customers)['_id'],
+            'total_amount': 100.0 * len(items),
+            'status': 'completed',
+            'payment_status': 'paid',
+            'payment_method': 'mpesa',
+            'created_at': now - timedelta(seconds=i),
+            'order_items': items
+        })
+        if len(batch) >= batch_size:
+            db.orders.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        db.orders.insert_many(batch, ordered=False)
+    return business_id
+
+def measure(business_id, limit, writer):
+    """Wall time in ms, bytes produced and peak traced memory of one export"""
+    columns, rows = get_export('orders', business_id)
+    rows = (row for _, row in zip(range(limit), rows))
+    tracemalloc.start()
+    started = time.perf_counter()
+    size = sum(len(chunk) for chunk in writer(columns, rows))
+    elapsed = (time.perf_counter() - started) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, size, peak
+
+def main():
+    parser = argparse.ArgumentParser(description='Streaming export benchmark')
+    parser.add_argument('--uri', default=os.getenv('BENCHMARK_MONGODB_URI', 'mongodb://localhost:27017/sasabot_export_benchmark'))
+    parser.add_argument('--sizes', default='10000,100000,500000', help='Comma separated row counts')
+    parser.add_argument('--keep', action='store_true', help='Keep the benchmark database afterwards')
+    args = parser.parse_args()
+    sizes = sorted(int(size) for size in args.sizes.split(','))
+
+    counter = CommandCounter()
+    client = connect(host=args.uri, event_listeners=[counter])
+    db = client.get_default_database()
+    client.drop_database(db.name)
+
+    print(f"Seeding {sizes[-1]} orders into {db.name}...")
+    business_id = seed(db, sizes[-1])
+
+    failed = False
+    try:
+        for label, writer in [('csv', iter_csv), ('xlsx', iter_xlsx)]:
+            peaks = []
+            for size in sizes:
+                result = {}
+                queries = count_queries(counter, lambda: result.update(zip(('ms', 'bytes', 'peak'), measure(business_id, size, writer))))
+                peaks.append(result['peak'])
+                print(f"{label:>5} {size:>9} rows: {result['ms']:9.1f}ms | {result['bytes'] / 1e6:8.1f}MB out | "
+                      f"peak {result['peak'] / 1e6:6.2f}MB | {queries} queries")
+            if len(peaks) > 1 and peaks[-1] > 2 * peaks[0]:
+                failed = True
+                print(f"{label:>5}: peak memory grew with row count")
+    finally:
+        if not args.keep:
+            client.drop_database(db.name)
+
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""
+Intent engine benchmark
+
+Checks the intent engine against the labelled corpus in
+fixtures/intent_corpus.json and measures per-message latency, next to the
+keyword scans it replaced.
+
+Usage (from the chatbot directory):
+    python benchmarks/intent_benchmark.py [--iterations 2000] [--corpus path]
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import intent_engine
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'intent_corpus.json')
+
+# The checks the engine replaced, kept here as the baseline
+def legacy_determine_intent(message):
+    message_lower = message.lower()
+    if any(keyword in message_lower for keyword in ['order', 'tracking', 'track', 'status', 'delivery', 'ord']):
+        return 'order_tracking'
+    if any(keyword in message_lower for keyword in ['product', 'products', 'service', 'services', 'catalog', 'what do you sell', 'what do you offer']):
+        return 'product_inquiry'
+    if re.search(r'\b[A-Z0-9]{4,}\b', message):
+        return 'product_id'
+    return 'general'
+
+def legacy_is_business_greeting(message):
+    greeting_words = ['hello', 'hi', 'hey', 'start', 'menu', 'help', 'hola', 'hujambo', 'mambo']
+    return any(word.lower() in message.lower() for word in greeting_words)
+
+def legacy_is_platform_inquiry(message):
+    message_lower = message.lower()
+    platform_keywords = ['sasabot', 'platform', 'how does it work', 'what is this', 'help', 'support', 'features', 'benefits']
+    return any(keyword in message_lower for keyword in platform_keywords)
+
+def legacy_is_trigger_word(message):
+    return message.lower().strip() in ["hi", "hello", "sasabot"]
+
+IMPLEMENTATIONS = {
+    'legacy': {
+        'intent': legacy_determine_intent,
+        'greeting': legacy_is_business_greeting,
+        'platform_inquiry': legacy_is_platform_inquiry,
+        'trigger': legacy_is_trigger_word
+    },
+    'engine': {
+        'intent': intent_engine.determine_intent,
+        'greeting': intent_engine.is_business_greeting,
+        'platform_inquiry': intent_engine.is_platform_inquiry,
+        'trigger': intent_engine.is_trigger_word
+    }
+}
+
+def check_accuracy(corpus, checks):
+    """Correct predictions per label, and the cases that were wrong"""
+    correct = {label: 0 for label in checks}
+    errors = []
+    for case in corpus:
+        for label, check in checks.items():
+            got = check(case['message'])
+            if got == case[label]:
+                correct[label] += 1
+            else:
+                errors.append((case['message'], label, case[label], got))
+    return correct, errors
+
+def measure_latency(corpus, checks, iterations):
+    """Mean and p99 microseconds to run every check on one message"""
+    samples = []
+    for _ in range(iterations):
+        for case in corpus:
+            message = case['message']
+            # Every message is new to the engine, as in production; its
+            # checks share the one memoized scan
+            intent_engine.get_intents.cache_clear()
+            started = time.perf_counter()
+            for check in checks.values():
+                check(message)
+            samples.append(time.perf_counter() - started)
+    samples.sort()
+    mean = sum(samples) / len(samples)
+    p99 = samples[int(len(samples) * 0.99) - 1]
+    return mean * 1e6, p99 * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description='Intent engine accuracy and latency benchmark')
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--corpus', default=CORPUS_PATH)
+    args = parser.parse_args()
+
+    with open(args.corpus) as f:
+        corpus = json.load(f)
+
+    failed = False
+    for name, checks in IMPLEMENTATIONS.items():
+        correct, errors = check_accuracy(corpus, checks)
+        mean, p99 = measure_latency(corpus, checks, args.iterations)
+        accuracy = ', '.join(f"{label} {correct[label]}/{len(corpus)}" for label in checks)
+        print(f"{name:>7}: {accuracy} | {mean:.2f}us mean, {p99:.2f}us p99 per message")
+        for message, label, expected, got in errors:
+            print(f"         {label}: {message!r} expected {expected!r}, got {got!r}")
+        if name == 'engine' and errors:
+            failed = True
+
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
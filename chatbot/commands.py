@@ -0,0 +1,89 @@
+import click
+import logging
+
+logger = logging.getLogger(__name__)
+
+def register_commands(app):
+    """Register maintenance commands with the Flask CLI (flask --app app <command>)"""
+
+    @app.cli.command('migrate-chat-messages')
+    @click.option('--batch-size', default=100, show_default=True, help='Sessions loaded per batch')
+    @click.option('--dry-run', is_flag=True, help='Only report how many sessions would be migrated')
+    def migrate_chat_messages(batch_size, dry_run):
+        """Move inline ChatSession.messages into chat_message_buckets, keeping a recent tail inline"""
+        from models import ChatSession
+        from services.chat_store import migrate_session
+
+        pending = ChatSession.objects(messages_bucketed__ne=True)
+        total = pending.count()
+        click.echo(f"{total} chat sessions still hold their history inline")
+        if dry_run or not total:
+            return
+
+        sessions_done = 0
+        messages_moved = 0
+        last_id = None
+        while True:
+            # Walk by _id so the app can keep writing while we migrate
+            query = ChatSession.objects(messages_bucketed__ne=True)
+            if last_id:
+                query = query.filter(id__gt=last_id)
+            batch = list(query.order_by('id').limit(batch_size).scalar('id'))
+            if not batch:
+                break
+
+            for session_id in batch:
+                try:
+                    messages_moved += migrate_session(session_id)
+                    sessions_done += 1
+                except Exception as e:
+                    logger.error(f"Error migrating chat session {session_id}: {str(e)}")
+                last_id = session_id
+
+            click.echo(f"Migrated {sessions_done}/{total} sessions ({messages_moved} messages)")
+
+        click.echo(f"Done: {sessions_done} sessions, {messages_moved} messages moved to buckets")
+
+    @app.cli.command('ensure-indexes')
+    @click.option('--audit-only', is_flag=True, help='Only run the query-plan audit, do not build indexes')
+    def ensure_indexes(audit_only):
+        """Build the indexes declared on the models and audit hot queries for collection scans"""
+        from services.index_audit import ensure_all_indexes, audit_hot_queries
+
+        if not audit_only:
+            for collection, created in ensure_all_indexes().items():
+                if created:
+                    click.echo(f"{collection}: created {', '.join(created)}")
+            click.echo("Indexes are up to date")
+
+        collscans = 0
+        for result in audit_hot_queries():
+            if result.get('error'):
+                click.echo(f"ERROR     {result['collection']}: {result['label']} ({result['error']})")
+            elif result['collscan']:
+                collscans += 1
+                click.echo(f"COLLSCAN  {result['collection']}: {result['label']}")
+            else:
+                click.echo(f"ok        {result['collection']}: {result['label']} ({', '.join(result['indexes'])})")
+
+        click.echo(f"{collscans} hot queries still use a collection scan")
+
+    @app.cli.command('rebuild-daily-stats')
+    @click.option('--business-id', default=None, help='Only rebuild the rollups of this business')
+    @click.option('--days', type=int, default=None, help='Only rebuild the last N days (default: all history)')
+    def rebuild_daily_stats(business_id, days):
+        """Backfill or rebuild the daily business rollups from orders and chat history"""
+        from datetime import datetime, timedelta
+        from services.daily_stats import rebuild_daily_stats as rebuild
+
+        since = datetime.utcnow() - timedelta(days=days) if days else None
+        written = rebuild(business_id=business_id, since=since)
+        click.echo(f"Wrote {written} daily stats rows")
+
+    @app.cli.command('cleanup-exports')
+    def cleanup_exports():
+        """Delete expired export jobs and their files from GridFS"""
+        from services.export_jobs import cleanup_expired_exports
+
+        removed = cleanup_expired_exports()
+        click.echo(f"Removed {removed} expired export jobs")
@@ -15,7 +15,9 @@ def create_database_config(app):
     
     # Connect to MongoDB Atlas with error handling
     try:
-        connect(host=mongodb_uri)
+        # Query instrumentation has to be attached when the client is created
+        from services.query_metrics import get_query_listeners
+        connect(host=mongodb_uri, event_listeners=get_query_listeners())
         print(f"Successfully connected to MongoDB")
     except Exception as e:
         print(f"Failed to connect to MongoDB: {str(e)}")
@@ -6,6 +6,7 @@ from .mongodb_models import (
     Category, 
     Product, 
     ProductVariation, 
+    CatalogVersion,
     Customer, 
     CustomerState,
     Order, 
@@ -13,7 +14,15 @@ from .mongodb_models import (
     OrderIssue,
     ChatSession, 
     ChatMessage, 
-    OnboardingState
+    ChatMessageBucket,
+    DailyBusinessStats,
+    OnboardingState,
+    InboundWebhook,
+    ProcessedWebhookMessage,
+    Campaign,
+    CampaignRecipient,
+    SendRateWindow,
+    ExportJob
 )
 
 # Export all models
@@ -24,6 +33,7 @@ __all__ = [
     'Category', 
     'Product', 
     'ProductVariation', 
+    'CatalogVersion',
     'Customer', 
     'CustomerState',
     'Order', 
@@ -31,5 +41,13 @@ __all__ = [
     'OrderIssue',
     'ChatSession', 
     'ChatMessage', 
-    'OnboardingState'
+    'ChatMessageBucket',
+    'DailyBusinessStats',
+    'OnboardingState',
+    'InboundWebhook',
+    'ProcessedWebhookMessage',
+    'Campaign',
+    'CampaignRecipient',
+    'SendRateWindow',
+    'ExportJob'
 ]
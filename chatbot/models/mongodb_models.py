@@ -1,6 +1,9 @@
 from mongoengine import Document, EmbeddedDocument, fields
 from flask_login import UserMixin
-from datetime import datetime
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+import os
 import secrets
 import string
 import random
@@ -8,7 +11,11 @@ import gridfs
 from bson import ObjectId
 
 class Customer(Document):
-    meta = {'collection': 'customers'}
+    meta = {
+        'collection': 'customers',
+        'indexes': ['created_at'],
+        'index_background': True
+    }
     
     phone_number = fields.StringField(required=True, unique=True, max_length=20)
     name = fields.StringField(max_length=100)
@@ -16,7 +23,11 @@ class Customer(Document):
     created_at = fields.DateTimeField(default=datetime.utcnow)
 
 class CustomerState(Document):
-    meta = {'collection': 'customer_states'}
+    meta = {
+        'collection': 'customer_states',
+        'indexes': [('phone_number', 'business')],
+        'index_background': True
+    }
     
     phone_number = fields.StringField(required=True, max_length=20)
     business = fields.ReferenceField('Business', required=True)
@@ -30,7 +41,10 @@ class CustomerState(Document):
         return super(CustomerState, self).save(*args, **kwargs)
 
 class Admin(Document, UserMixin):
-    meta = {'collection': 'admins'}
+    meta = {
+        'collection': 'admins',
+        'index_background': True
+    }
     
     email = fields.EmailField(required=True, unique=True)
     password = fields.StringField(required=True, max_length=255)
@@ -43,7 +57,11 @@ class Admin(Document, UserMixin):
         return str(self.id)
 
 class Vendor(Document, UserMixin):
-    meta = {'collection': 'vendors'}
+    meta = {
+        'collection': 'vendors',
+        'indexes': [('-created_at', '-id')],
+        'index_background': True
+    }
     
     name = fields.StringField(required=True, max_length=100)
     email = fields.EmailField(required=True, unique=True)
@@ -61,7 +79,11 @@ class Vendor(Document, UserMixin):
         return ''.join(secrets.choice(characters) for _ in range(length))
 
 class Business(Document):
-    meta = {'collection': 'businesses'}
+    meta = {
+        'collection': 'businesses',
+        'indexes': [('-created_at', '-id')],
+        'index_background': True
+    }
     
     name = fields.StringField(required=True, max_length=200)
     description = fields.StringField()
@@ -79,13 +101,32 @@ class Business(Document):
     # Custom instructions for OpenAI
     custom_instructions = fields.StringField()
 
+def _catalog_changed(business):
+    """Invalidate cached catalog snapshots of a business"""
+    from services.catalog_cache import invalidate_catalog
+    invalidate_catalog(getattr(business, 'pk', None) or getattr(business, 'id', business))
+
 class Category(Document):
-    meta = {'collection': 'categories'}
+    meta = {
+        'collection': 'categories',
+        'indexes': ['business'],
+        'index_background': True
+    }
     
     name = fields.StringField(required=True, max_length=100)
     description = fields.StringField()
     business = fields.ReferenceField(Business, required=True)
     created_at = fields.DateTimeField(default=datetime.utcnow)
+    
+    def save(self, *args, **kwargs):
+        result = super(Category, self).save(*args, **kwargs)
+        _catalog_changed(self.business)
+        return result
+    
+    def delete(self, *args, **kwargs):
+        result = super(Category, self).delete(*args, **kwargs)
+        _catalog_changed(self.business)
+        return result
 
 class ProductVariation(EmbeddedDocument):
     variation_id = fields.StringField(required=True, max_length=20)
@@ -96,7 +137,16 @@ class ProductVariation(EmbeddedDocument):
     created_at = fields.DateTimeField(default=datetime.utcnow)
 
 class Product(Document):
-    meta = {'collection': 'products'}
+    meta = {
+        'collection': 'products',
+        'indexes': [
+            ('business', 'is_active'),
+            ('category', 'is_active'),
+            ('business', '-created_at', '-id'),
+            'variations.variation_id'
+        ],
+        'index_background': True
+    }
     
     product_id = fields.StringField(required=True, unique=True, max_length=20)
     name = fields.StringField(required=True, max_length=200)
@@ -122,7 +172,14 @@ class Product(Document):
     
     def save(self, *args, **kwargs):
         self.updated_at = datetime.utcnow()
-        return super(Product, self).save(*args, **kwargs)
+        result = super(Product, self).save(*args, **kwargs)
+        _catalog_changed(self.business)
+        return result
+    
+    def delete(self, *args, **kwargs):
+        result = super(Product, self).delete(*args, **kwargs)
+        _catalog_changed(self.business)
+        return result
     
     def get_image_url(self):
         """Get the appropriate image URL for this product."""
@@ -137,6 +194,27 @@ class Product(Document):
         """Check if product has an image."""
         return bool(self.image_file_id or self.image_url)
 
+class CatalogVersion(Document):
+    """Shared catalog version counter of a business, for cross-worker cache invalidation"""
+    meta = {'collection': 'catalog_versions'}
+    
+    business_id = fields.ObjectIdField(primary_key=True)
+    version = fields.IntField(default=0)
+    updated_at = fields.DateTimeField(default=datetime.utcnow)
+    
+    @classmethod
+    def bump(cls, business_id):
+        """Increment the version of a business's catalog"""
+        cls.objects(business_id=business_id).update_one(
+            inc__version=1,
+            set__updated_at=datetime.utcnow(),
+            upsert=True
+        )
+    
+    @classmethod
+    def get_version(cls, business_id):
+        return cls.objects(business_id=business_id).scalar('version').first() or 0
+
 class OrderItem(EmbeddedDocument):
     product = fields.ReferenceField(Product, required=True)
     variation_id = fields.StringField()  # Reference to variation within product
@@ -144,8 +222,29 @@ class OrderItem(EmbeddedDocument):
     unit_price = fields.FloatField(required=True)
     total_price = fields.FloatField(required=True)
 
+def _ref_id(value):
+    """ObjectId of a reference field value (document, DBRef or id) without dereferencing it"""
+    return getattr(value, 'id', value)
+
+def _order_stats_changed(order, previous):
+    """Apply an order's creation or status/amount change to the daily rollups"""
+    from services.daily_stats import record_order_change
+    record_order_change(_ref_id(order._data.get('business')), order.created_at, previous, order.to_mongo())
+
 class Order(Document):
-    meta = {'collection': 'orders'}
+    meta = {
+        'collection': 'orders',
+        'indexes': [
+            ('business', 'payment_status', '-created_at'),
+            ('customer', 'payment_status', '-created_at'),
+            ('business', '-created_at', '-id'),
+            ('business', 'status', '-created_at', '-id'),
+            ('status', '-created_at', '-id'),
+            ('-created_at', '-id'),
+            'order_items.product'
+        ],
+        'index_background': True
+    }
     
     order_number = fields.StringField(required=True, unique=True, max_length=20)
     customer = fields.ReferenceField(Customer, required=True)
@@ -171,9 +270,43 @@ class Order(Document):
     def generate_order_number():
         return f"ORD{random.randint(100000, 999999)}"
     
+    @classmethod
+    def count_by_product(cls, products):
+        """
+        Number of orders containing each product, with one aggregation
+        products may be Product documents or ids; returns {str(product id): count}
+        with 0 for products that were never ordered.
+        """
+        product_ids = [ObjectId(str(getattr(product, 'pk', product))) for product in products]
+        counts = {str(product_id): 0 for product_id in product_ids}
+        if not product_ids:
+            return counts
+        
+        pipeline = [
+            {'$match': {'order_items.product': {'$in': product_ids}}},
+            {'$unwind': '$order_items'},
+            {'$match': {'order_items.product': {'$in': product_ids}}},
+            # An order holding a product in several lines counts once
+            {'$group': {'_id': {'product': '$order_items.product', 'order': '$_id'}}},
+            {'$group': {'_id': '$_id.product', 'orders': {'$sum': 1}}}
+        ]
+        for row in cls._get_collection().aggregate(pipeline):
+            counts[str(row['_id'])] = row['orders']
+        return counts
+    
+    # Fields the daily rollups are derived from
+    STATS_FIELDS = ('status', 'payment_status', 'total_amount')
+    
     def save(self, *args, **kwargs):
         self.updated_at = datetime.utcnow()
-        return super(Order, self).save(*args, **kwargs)
+        created = self.pk is None
+        previous = None
+        if not created and any(field in self._changed_fields for field in self.STATS_FIELDS):
+            previous = self._get_collection().find_one({'_id': self.pk}, {field: 1 for field in self.STATS_FIELDS})
+        result = super(Order, self).save(*args, **kwargs)
+        if created or previous:
+            _order_stats_changed(self, previous)
+        return result
 
 class ChatMessage(EmbeddedDocument):
     sender_type = fields.StringField(required=True, choices=['customer', 'gpt', 'vendor'])
@@ -185,18 +318,252 @@ class ChatMessage(EmbeddedDocument):
     button_data = fields.DictField()
 
 class ChatSession(Document):
-    meta = {'collection': 'chat_sessions'}
+    meta = {
+        'collection': 'chat_sessions',
+        'indexes': [
+            ('customer', 'business'),
+            ('business', '-created_at', '-id'),
+            ('-created_at', '-id')
+        ],
+        'index_background': True
+    }
+    
+    # Newest messages kept inline on the session document
+    RECENT_MESSAGES = int(os.getenv('CHAT_SESSION_RECENT_MESSAGES', 50))
     
     customer = fields.ReferenceField(Customer, required=True)
     business = fields.ReferenceField(Business, required=True)
     session_id = fields.StringField(required=True, unique=True, max_length=100)
     created_at = fields.DateTimeField(default=datetime.utcnow)
     
-    # Embedded messages
+    # Message summary, kept up to date on every append
+    message_count = fields.IntField(default=0)
+    last_message_at = fields.DateTimeField()
+    last_message = fields.EmbeddedDocumentField(ChatMessage)
+    
+    # Recent messages only (capped to RECENT_MESSAGES); the full history is in
+    # chat_message_buckets. Sessions created before buckets existed hold their
+    # whole history here until `flask migrate-chat-messages` has moved it.
     messages = fields.ListField(fields.EmbeddedDocumentField(ChatMessage))
+    messages_bucketed = fields.BooleanField(default=True)
+    
+    @classmethod
+    def append_messages(cls, session_id, messages, customer=None, business=None, max_messages=None):
+        """
+        Append messages to a session with a single atomic update
+        The session is created when missing if customer and business are
+        given. messages may be ChatMessage instances or dicts of their fields.
+        Returns the appended ChatMessage objects, or None if the session does
+        not exist and could not be created.
+        """
+        messages = [m if isinstance(m, ChatMessage) else ChatMessage(**m) for m in messages]
+        if not messages:
+            return []
+        
+        now = datetime.utcnow()
+        for message in messages:
+            if not message.timestamp:
+                message.timestamp = now
+        
+        cap = cls.RECENT_MESSAGES if max_messages is None else max_messages
+        push = {'$each': [message.to_mongo() for message in messages]}
+        if cap:
+            push['$slice'] = -cap
+        
+        update = {
+            '$push': {'messages': push},
+            '$inc': {'message_count': len(messages)},
+            '$set': {
+                'last_message_at': messages[-1].timestamp,
+                'last_message': messages[-1].to_mongo()
+            },
+            '$setOnInsert': {
+                'customer': getattr(customer, 'pk', customer),
+                'business': getattr(business, 'pk', business),
+                'created_at': now
+            }
+        }
+        
+        # Only sessions whose inline history is already bucketed may be capped.
+        # An older session fails the filter (and, when upserting, collides on
+        # session_id); it is migrated first and the update retried.
+        collection = cls._get_collection()
+        upsert = customer is not None and business is not None
+        query = {'session_id': session_id, 'messages_bucketed': True}
+        try:
+            session = collection.find_one_and_update(
+                query, update,
+                projection={'_id': 1, 'business': 1, 'customer': 1, 'message_count': 1},
+                upsert=upsert,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            session = None
+        
+        if session is None:
+            legacy = collection.find_one({'session_id': session_id}, {'_id': 1})
+            if not legacy:
+                return None
+            cls.bucket_inline_messages(legacy['_id'])
+            session = collection.find_one_and_update(
+                query, update,
+                projection={'_id': 1, 'business': 1, 'customer': 1, 'message_count': 1},
+                return_document=ReturnDocument.AFTER
+            )
+            if session is None:
+                raise RuntimeError(f"Could not append messages to chat session {session_id}")
+        
+        ChatMessageBucket.push_messages(session['_id'], session.get('business'), messages)
+        
+        # A session whose count is just this batch has received its first messages
+        from services.daily_stats import record_chat_activity
+        record_chat_activity(session, messages, new_session=session.get('message_count') == len(messages))
+        return messages
+    
+    @classmethod
+    def bucket_inline_messages(cls, session_pk):
+        """
+        Move a pre-bucket session's inline history into chat_message_buckets
+        Only the newest RECENT_MESSAGES stay inline. Safe while the app is live:
+        the session is only updated if its inline list did not change during
+        the copy. Returns the number of messages moved.
+        """
+        collection = cls._get_collection()
+        raw = collection.find_one({'_id': session_pk}, {'business': 1, 'messages': 1, 'messages_bucketed': 1})
+        if not raw or raw.get('messages_bucketed'):
+            return 0
+        
+        inline = raw.get('messages') or []
+        inserted = []
+        if inline:
+            messages = [ChatMessage._from_son(message) for message in inline]
+            buckets = []
+            for i in range(0, len(messages), ChatMessageBucket.BUCKET_SIZE):
+                chunk = messages[i:i + ChatMessageBucket.BUCKET_SIZE]
+                buckets.append(ChatMessageBucket(
+                    session=session_pk,
+                    business=raw.get('business'),
+                    count=len(chunk),
+                    first_message_at=chunk[0].timestamp,
+                    last_message_at=chunk[-1].timestamp,
+                    messages=chunk
+                ))
+            inserted = ChatMessageBucket.objects.insert(buckets, load_bulk=False)
+        
+        update = {
+            '$set': {'messages_bucketed': True},
+            '$inc': {'message_count': len(inline)}
+        }
+        if inline:
+            update['$set']['messages'] = inline[-cls.RECENT_MESSAGES:] if cls.RECENT_MESSAGES else []
+            update['$max'] = {'last_message_at': inline[-1].get('timestamp')}
+        
+        result = collection.update_one(
+            {'_id': session_pk, 'messages_bucketed': {'$ne': True}, 'messages': {'$size': len(inline)}},
+            update
+        )
+        if not result.modified_count:
+            # The session changed underneath us; undo and let a later run retry
+            if inserted:
+                ChatMessageBucket.objects(id__in=inserted).delete()
+            return 0
+        
+        if inline:
+            collection.update_one({'_id': session_pk, 'last_message': None}, {'$set': {'last_message': inline[-1]}})
+        return len(inline)
+
+class ChatMessageBucket(Document):
+    """A chunk of up to BUCKET_SIZE messages of one chat session"""
+    meta = {
+        'collection': 'chat_message_buckets',
+        'indexes': [
+            ('session', 'count', 'first_message_at'),
+            ('session', '-first_message_at'),
+            ('business', 'last_message_at')
+        ],
+        'index_background': True
+    }
+    
+    BUCKET_SIZE = int(os.getenv('CHAT_BUCKET_SIZE', 200))
+    BUCKET_MAX_AGE = timedelta(hours=int(os.getenv('CHAT_BUCKET_MAX_AGE_HOURS', 24)))
+    
+    session = fields.ReferenceField(ChatSession, required=True)
+    business = fields.ReferenceField(Business)
+    count = fields.IntField(default=0)
+    first_message_at = fields.DateTimeField()
+    last_message_at = fields.DateTimeField()
+    messages = fields.ListField(fields.EmbeddedDocumentField(ChatMessage))
+    
+    @classmethod
+    def push_messages(cls, session_pk, business_pk, messages):
+        """Atomically append messages to the session's open bucket, opening a new one if needed"""
+        if not messages:
+            return
+        
+        now = datetime.utcnow()
+        
+        # Only a bucket with room for the whole batch and opened recently is
+        # reused; otherwise the upsert creates a new bucket
+        cls.objects(
+            session=session_pk,
+            count__lte=cls.BUCKET_SIZE - len(messages),
+            first_message_at__gte=now - cls.BUCKET_MAX_AGE
+        ).update_one(
+            push_all__messages=messages,
+            inc__count=len(messages),
+            set__last_message_at=messages[-1].timestamp or now,
+            set_on_insert__business=business_pk,
+            set_on_insert__first_message_at=messages[0].timestamp or now,
+            upsert=True
+        )
+
+class DailyBusinessStats(Document):
+    """Per-business per-day rollup of orders, revenue and chat activity (UTC days)"""
+    meta = {
+        'collection': 'daily_business_stats',
+        'indexes': [
+            {'fields': ('business', 'date'), 'unique': True},
+            'date'
+        ],
+        'index_background': True
+    }
+    
+    business = fields.ReferenceField(Business, required=True)
+    date = fields.DateTimeField(required=True)  # Midnight UTC of the day
+    
+    # Orders created that day, by their current status
+    orders = fields.IntField(default=0)
+    orders_by_status = fields.DictField()
+    orders_by_payment_status = fields.DictField()
+    revenue_by_status = fields.DictField()
+    paid_orders = fields.IntField(default=0)
+    paid_revenue = fields.FloatField(default=0)
+    
+    # Chat activity of that day
+    new_customers = fields.IntField(default=0)
+    sessions = fields.IntField(default=0)
+    messages = fields.IntField(default=0)
+    
+    updated_at = fields.DateTimeField(default=datetime.utcnow)
+    
+    @classmethod
+    def increment(cls, business_id, date, inc):
+        """Atomically add to a day's figures, creating the row if needed"""
+        inc = {field: value for field, value in inc.items() if value}
+        if not inc:
+            return
+        cls._get_collection().update_one(
+            {'business': business_id, 'date': date},
+            {'$inc': inc, '$set': {'updated_at': datetime.utcnow()}},
+            upsert=True
+        )
 
 class OrderIssue(Document):
-    meta = {'collection': 'order_issues'}
+    meta = {
+        'collection': 'order_issues',
+        'indexes': [('business', '-created_at', '-id')],
+        'index_background': True
+    }
     
     customer = fields.ReferenceField(Customer, required=True)
     business = fields.ReferenceField(Business, required=True)
@@ -211,7 +578,10 @@ class OrderIssue(Document):
         return super(OrderIssue, self).save(*args, **kwargs)
 
 class OnboardingState(Document):
-    meta = {'collection': 'onboarding_states'}
+    meta = {
+        'collection': 'onboarding_states',
+        'index_background': True
+    }
     
     phone_number = fields.StringField(required=True, unique=True, max_length=20)
     current_step = fields.StringField(required=True, max_length=50)
@@ -222,3 +592,191 @@ class OnboardingState(Document):
     def save(self, *args, **kwargs):
         self.updated_at = datetime.utcnow()
         return super(OnboardingState, self).save(*args, **kwargs)
+
+class InboundWebhook(Document):
+    meta = {
+        'collection': 'inbound_webhooks',
+        'indexes': [
+            ('status', 'available_at'),
+            ('status', 'locked_at'),
+            # Processed events are kept for a week for debugging, then expired
+            {'fields': ['processed_at'], 'expireAfterSeconds': 7 * 24 * 3600}
+        ],
+        'index_background': True
+    }
+    
+    source = fields.StringField(required=True, choices=['system', 'business'])
+    business_id = fields.StringField(max_length=50)
+    payload = fields.DictField()
+    status = fields.StringField(default='pending', choices=['pending', 'processing', 'done', 'failed'])
+    attempts = fields.IntField(default=0)
+    last_error = fields.StringField()
+    available_at = fields.DateTimeField(default=datetime.utcnow)
+    locked_at = fields.DateTimeField()
+    processed_at = fields.DateTimeField()
+    created_at = fields.DateTimeField(default=datetime.utcnow)
+
+class ProcessedWebhookMessage(Document):
+    """A WhatsApp message handled by a webhook, so redelivered or retried payloads skip it"""
+    meta = {
+        'collection': 'processed_webhook_messages',
+        'indexes': [
+            {'fields': ['created_at'], 'expireAfterSeconds': 7 * 24 * 3600}
+        ],
+        'index_background': True
+    }
+    
+    key = fields.StringField(primary_key=True)  # "<business key>:<wamid>"
+    status = fields.StringField(default='processing', choices=['processing', 'done'])
+    locked_at = fields.DateTimeField()
+    created_at = fields.DateTimeField(default=datetime.utcnow)
+    
+    @classmethod
+    def claim(cls, key, stale_after=300):
+        """Reserve a message for handling, False if it was handled or is being handled"""
+        now = datetime.utcnow()
+        collection = cls._get_collection()
+        try:
+            collection.insert_one({'_id': key, 'status': 'processing', 'locked_at': now, 'created_at': now})
+            return True
+        except DuplicateKeyError:
+            # Taken over only when the attempt holding it stopped without finishing
+            return collection.update_one(
+                {'_id': key, 'status': 'processing', 'locked_at': {'$lt': now - timedelta(seconds=stale_after)}},
+                {'$set': {'locked_at': now}}
+            ).modified_count == 1
+    
+    @classmethod
+    def mark_done(cls, key):
+        cls._get_collection().update_one({'_id': key}, {'$set': {'status': 'done'}})
+    
+    @classmethod
+    def release(cls, key):
+        """Forget a message whose handling failed, so a retry handles it again"""
+        cls._get_collection().delete_one({'_id': key, 'status': 'processing'})
+
+class Campaign(Document):
+    meta = {
+        'collection': 'campaigns',
+        'indexes': [('business', '-created_at')],
+        'index_background': True
+    }
+    
+    business = fields.ReferenceField(Business, required=True)
+    vendor = fields.ReferenceField(Vendor)
+    campaign_type = fields.StringField(default='text', choices=['text', 'promotional'])
+    
+    # Message content, kept so an interrupted campaign can be resumed
+    message_text = fields.StringField()
+    header = fields.StringField()
+    body = fields.StringField()
+    footer = fields.StringField()
+    buttons = fields.ListField(fields.DictField())
+    customer_filter = fields.DictField()
+    
+    # Set once every recipient has been written to campaign_recipients
+    recipients_loaded = fields.BooleanField(default=False)
+    
+    status = fields.StringField(default='queued', choices=['queued', 'running', 'completed', 'failed'])
+    phone_id = fields.StringField(max_length=100)
+    total = fields.IntField(default=0)
+    sent = fields.IntField(default=0)
+    failed = fields.IntField(default=0)
+    error = fields.StringField()
+    
+    created_at = fields.DateTimeField(default=datetime.utcnow)
+    started_at = fields.DateTimeField()
+    finished_at = fields.DateTimeField()
+    last_checkpoint_at = fields.DateTimeField()
+
+class SendRateWindow(Document):
+    """Messages sent from one WhatsApp phone number ID in one second, across processes"""
+    meta = {
+        'collection': 'send_rate_windows',
+        'indexes': [
+            {'fields': ['expires_at'], 'expireAfterSeconds': 0}
+        ],
+        'index_background': True
+    }
+    
+    key = fields.StringField(primary_key=True)  # "<phone_id>:<unix second>"
+    count = fields.IntField(default=0)
+    expires_at = fields.DateTimeField()
+    
+    @classmethod
+    def reserve(cls, phone_id, second, tokens):
+        """Add tokens to a second's window, returns the window's count including them"""
+        window = cls._get_collection().find_one_and_update(
+            {'_id': f"{phone_id}:{second}"},
+            {
+                '$inc': {'count': tokens},
+                '$setOnInsert': {'expires_at': datetime.utcfromtimestamp(second) + timedelta(minutes=1)}
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return window['count']
+
+class CampaignRecipient(Document):
+    meta = {
+        'collection': 'campaign_recipients',
+        'indexes': [
+            ('campaign', 'status'),
+            ('campaign', 'sent_at')
+        ],
+        'index_background': True
+    }
+    
+    campaign = fields.ReferenceField(Campaign, required=True)
+    phone_number = fields.StringField(required=True, max_length=20)
+    status = fields.StringField(default='pending', choices=['pending', 'sent', 'failed'])
+    whatsapp_message_id = fields.StringField()
+    error = fields.StringField()
+    attempts = fields.IntField(default=0)
+    sent_at = fields.DateTimeField()
+
+class ExportJob(Document):
+    meta = {
+        'collection': 'export_jobs',
+        'indexes': [
+            ('status', 'created_at'),
+            ('status', 'locked_at'),
+            ('requested_by', '-created_at'),
+            'expires_at'
+        ],
+        'index_background': True
+    }
+    
+    data_type = fields.StringField(required=True, max_length=50)
+    business = fields.ReferenceField(Business)  # None for a system-wide export
+    file_format = fields.StringField(default='csv', choices=['csv', 'xlsx'])
+    start_date = fields.DateTimeField()
+    end_date = fields.DateTimeField()
+    requested_by = fields.StringField(max_length=50)
+    
+    status = fields.StringField(default='pending', choices=['pending', 'running', 'completed', 'failed'])
+    attempts = fields.IntField(default=0)
+    rows_total = fields.IntField(default=0)  # Counted when the job starts
+    rows_written = fields.IntField(default=0)
+    error = fields.StringField()
+    
+    # Result file in GridFS
+    file_id = fields.ObjectIdField()
+    filename = fields.StringField()
+    file_size = fields.IntField()
+    
+    created_at = fields.DateTimeField(default=datetime.utcnow)
+    started_at = fields.DateTimeField()
+    locked_at = fields.DateTimeField()  # Refreshed while running
+    claim_id = fields.StringField(max_length=32)  # Set by each claim; only that run may finish the job
+    finished_at = fields.DateTimeField()
+    expires_at = fields.DateTimeField()  # File and job are removed after this
+    
+    @property
+    def progress(self):
+        """Percentage of rows written"""
+        if self.status == 'completed':
+            return 100
+        if not self.rows_total:
+            return 0
+        return min(99, int(self.rows_written * 100 / self.rows_total))
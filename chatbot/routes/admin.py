@@ -1,13 +1,11 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_file
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
-from models import Admin, Vendor, Business, Product, Category, Order, Customer, ChatSession, ChatMessage
+from models import Admin, Vendor, Business, Product, Category, Order, Customer, ChatSession, ChatMessage, Campaign
 from services.auth.decorators import admin_required
 from services.auth.auth_manager import get_user_role
 from werkzeug.security import generate_password_hash
 from bson import ObjectId
 from mongoengine.errors import DoesNotExist
-import csv
-import io
 import logging
 from datetime import datetime
 
@@ -39,14 +37,10 @@ def dashboard():
 def vendors():
     page = request.args.get('page', 1, type=int)
     per_page = 20
-    skip = (page - 1) * per_page
     
-    vendors_list = Vendor.objects.skip(skip).limit(per_page)
-    total = Vendor.objects.count()
-    
-    # Create pagination object with iter_pages support
-    from services.pagination import Pagination
-    vendors = Pagination(page, per_page, total, vendors_list)
+    # Keyset page: deep pages cost the same as the first
+    from services.pagination import paginate_keyset
+    vendors = paginate_keyset(Vendor.objects, request.args.get('cursor'), page, per_page)
     
     return render_template('admin/vendors.html', vendors=vendors)
 
@@ -59,14 +53,16 @@ def vendor_detail(vendor_id):
             flash('Vendor not found.', 'error')
             return redirect(url_for('admin.vendors'))
             
-        businesses = Business.objects(vendor=vendor)
+        businesses = list(Business.objects(vendor=vendor))
         
-        # Calculate total products and orders for this vendor
-        total_products = 0
-        total_orders = 0
+        # Calculate total products and orders for this vendor; the template
+        # filters reuse these batched counts
+        from services.batch_loader import get_template_loaders
+        loaders = get_template_loaders()
         for business in businesses:
-            total_products += Product.objects(business=business).count()
-            total_orders += Order.objects(business=business).count()
+            loaders.prime_business(business.pk)
+        total_products = sum(loaders.product_count.load(business.pk) for business in businesses)
+        total_orders = sum(loaders.order_count.load(business.pk) for business in businesses)
             
         return render_template('admin/vendor_detail.html', 
                              vendor=vendor, 
@@ -82,14 +78,10 @@ def vendor_detail(vendor_id):
 def businesses():
     page = request.args.get('page', 1, type=int)
     per_page = 20
-    skip = (page - 1) * per_page
-    
-    businesses_list = Business.objects.skip(skip).limit(per_page)
-    total = Business.objects.count()
     
-    # Create pagination object with iter_pages support
-    from services.pagination import Pagination
-    businesses = Pagination(page, per_page, total, businesses_list)
+    # Keyset page: deep pages cost the same as the first
+    from services.pagination import paginate_keyset
+    businesses = paginate_keyset(Business.objects, request.args.get('cursor'), page, per_page)
     
     return render_template('admin/businesses.html', businesses=businesses)
 
@@ -135,6 +127,11 @@ def edit_business(business_id):
             business.custom_instructions = request.form.get('custom_instructions')
             
             business.save()
+            
+            from services.business_cache import invalidate_business_route
+            from services.response_cache import invalidate_business_responses
+            invalidate_business_route(business.id)
+            invalidate_business_responses(business.id)
             flash('Business updated successfully!', 'success')
             return redirect(url_for('admin.business_detail', business_id=business_id))
         
@@ -148,18 +145,14 @@ def orders():
     page = request.args.get('page', 1, type=int)
     status_filter = request.args.get('status')
     per_page = 20
-    skip = (page - 1) * per_page
     
     query = Order.objects
     if status_filter:
         query = query.filter(status=status_filter)
     
-    orders_list = query.order_by('-created_at').skip(skip).limit(per_page)
-    total = query.count()
-    
-    # Create pagination object with iter_pages support
-    from services.pagination import Pagination
-    orders = Pagination(page, per_page, total, orders_list)
+    # Keyset page: deep pages cost the same as the first
+    from services.pagination import paginate_keyset
+    orders = paginate_keyset(query, request.args.get('cursor'), page, per_page)
     
     return render_template('admin/orders.html', orders=orders, status_filter=status_filter)
 
@@ -227,14 +220,10 @@ def order_details(order_id):
 def chat_sessions():
     page = request.args.get('page', 1, type=int)
     per_page = 20
-    skip = (page - 1) * per_page
-    
-    sessions_list = ChatSession.objects.order_by('-created_at').skip(skip).limit(per_page)
-    total = ChatSession.objects.count()
     
-    # Create pagination object with iter_pages support
-    from services.pagination import Pagination
-    sessions = Pagination(page, per_page, total, sessions_list)
+    # Keyset page: deep pages cost the same as the first
+    from services.pagination import paginate_keyset
+    sessions = paginate_keyset(ChatSession.objects.exclude('messages'), request.args.get('cursor'), page, per_page)
     
     return render_template('admin/chat_sessions.html', sessions=sessions)
 
@@ -296,15 +285,16 @@ def products(business_id):
             
         page = request.args.get('page', 1, type=int)
         per_page = 20
-        skip = (page - 1) * per_page
         
-        products_list = Product.objects(business=business).skip(skip).limit(per_page)
-        total = Product.objects(business=business).count()
+        # Keyset page, newest products first
+        from services.pagination import paginate_keyset
+        products = paginate_keyset(Product.objects(business=business), request.args.get('cursor'), page, per_page)
         categories = Category.objects(business=business)
         
-        # Create pagination object with iter_pages support
-        from services.pagination import Pagination
-        products = Pagination(page, per_page, total, products_list)
+        # Order counts of the whole page in one aggregation
+        order_counts = Order.count_by_product(products.items)
+        for product in products.items:
+            product.order_count = order_counts[str(product.pk)]
         
         return render_template('admin/products.html',
                              business=business,
@@ -457,7 +447,8 @@ def business_analytics(business_id):
 @admin_required
 def bulk_messaging():
     businesses = Business.objects(is_active=True)
-    return render_template('admin/bulk_messaging.html', businesses=businesses)
+    campaigns = Campaign.objects.order_by('-created_at').limit(10)
+    return render_template('admin/bulk_messaging.html', businesses=businesses, campaigns=campaigns)
 
 @admin_bp.route('/send-bulk-message', methods=['POST'])
 @admin_required
@@ -482,7 +473,7 @@ def send_bulk_message():
         result = send_bulk_message(business_id, message, customer_filter)
         
         if result.get('success'):
-            flash(f"Message sent to {result['sent']} customers. {result['failed']} failed.", 'success')
+            flash(f"Bulk message campaign {result['campaign_id']} started. Messages are being sent in the background.", 'success')
         else:
             flash(f"Error sending bulk message: {result.get('error', 'Unknown error')}", 'error')
         
@@ -492,46 +483,48 @@ def send_bulk_message():
         flash(f"Error: {str(e)}", 'error')
         return redirect(url_for('admin.bulk_messaging'))
 
+@admin_bp.route('/bulk-messaging/campaigns/<campaign_id>/progress')
+@admin_required
+def campaign_progress(campaign_id):
+    from services.bulk_messaging import get_campaign_progress
+    
+    result = get_campaign_progress(campaign_id)
+    if result.get('error'):
+        return jsonify({'success': False, 'message': result['error']}), 404
+    return jsonify(result)
+
+@admin_bp.route('/bulk-messaging/campaigns/<campaign_id>/resume', methods=['POST'])
+@admin_required
+def resume_campaign(campaign_id):
+    from services.bulk_messaging import resume_campaign
+    
+    result = resume_campaign(campaign_id)
+    if result.get('error'):
+        return jsonify({'success': False, 'message': result['error']})
+    return jsonify(result)
+
 @admin_bp.route('/export-analytics')
 @admin_required
 def export_analytics():
     data_type = request.args.get('type', 'orders')
     business_id = request.args.get('business_id')
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
+    file_format = request.args.get('format', 'csv')
     
-    from services.analytics_service import AnalyticsService
+    from services.export_service import get_export, parse_export_range, export_response
     
     try:
-        if business_id:
-            result = AnalyticsService.get_export_data(business_id, data_type, None, start_date, end_date)
-        else:
-            # System-wide export
-            result = AnalyticsService.get_system_export_data(data_type, start_date, end_date)
-        
-        if result.get('success'):
-            # Convert to CSV
-            try:
-                import pandas as pd
-                df = pd.DataFrame(result['data'])
-                
-                output = io.StringIO()
-                df.to_csv(output, index=False)
-                output.seek(0)
-                
-                filename = f"admin_{data_type}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-                
-                return send_file(
-                    io.BytesIO(output.getvalue().encode()),
-                    mimetype='text/csv',
-                    as_attachment=True,
-                    download_name=filename
-                )
-            except ImportError:
-                return jsonify({"error": "CSV export is not available due to missing dependencies"}), 500
-        else:
-            flash(f"Export failed: {result.get('error', 'Unknown error')}", 'error')
+        start_date, end_date = parse_export_range(
+            request.args.get('start_date'), request.args.get('end_date'), request.args.get('days', 30, type=int)
+        )
+        # Business export when a business is given, system-wide otherwise
+        export = get_export(data_type, business_id, start_date, end_date)
+        if not export:
+            flash('Export failed: Invalid data type', 'error')
             return redirect(url_for('admin.analytics'))
+        
+        columns, rows = export
+        filename = f"admin_{data_type}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        return export_response(columns, rows, filename, file_format)
     
     except Exception as e:
         flash(f"Error: {str(e)}", 'error')
@@ -541,43 +534,118 @@ def export_analytics():
 @admin_required
 def export_data(data_type):
     """Export system data by type"""
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
+    file_format = request.args.get('format', 'csv')
     
-    from services.analytics_service import AnalyticsService
+    from services.export_service import get_export, parse_export_range, export_response
     
     try:
         # System-wide export
-        result = AnalyticsService.get_system_export_data(data_type, start_date, end_date)
-        
-        if result.get('success'):
-            # Convert to CSV
-            try:
-                import pandas as pd
-                df = pd.DataFrame(result['data'])
-                
-                output = io.StringIO()
-                df.to_csv(output, index=False)
-                output.seek(0)
-                
-                filename = f"system_{data_type}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-                
-                return send_file(
-                    io.BytesIO(output.getvalue().encode()),
-                    mimetype='text/csv',
-                    as_attachment=True,
-                    download_name=filename
-                )
-            except ImportError:
-                return jsonify({"error": "CSV export is not available due to missing dependencies"}), 500
-        else:
-            flash(f"Export failed: {result.get('error', 'Unknown error')}", 'error')
+        start_date, end_date = parse_export_range(
+            request.args.get('start_date'), request.args.get('end_date'), request.args.get('days', 30, type=int)
+        )
+        export = get_export(data_type, None, start_date, end_date)
+        if not export:
+            flash('Export failed: Invalid data type', 'error')
             return redirect(url_for('admin.analytics'))
+        
+        columns, rows = export
+        filename = f"system_{data_type}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        return export_response(columns, rows, filename, file_format)
     
     except Exception as e:
         flash(f"Error: {str(e)}", 'error')
         return redirect(url_for('admin.analytics'))
 
+@admin_bp.route('/exports', methods=['POST'])
+@admin_required
+def create_export():
+    """Queue an export to be computed in the background"""
+    data = request.get_json(silent=True) or request.form
+    
+    from services.export_service import parse_export_range
+    from services.export_jobs import submit_export_job, job_summary
+    
+    try:
+        days = int(data.get('days') or 30)
+        start_date, end_date = parse_export_range(data.get('start_date'), data.get('end_date'), days)
+        job = submit_export_job(
+            data.get('type', 'orders'),
+            business_id=data.get('business_id') or None,
+            file_format=data.get('format', 'csv'),
+            start_date=start_date,
+            end_date=end_date,
+            requested_by=current_user.id
+        )
+        return jsonify({'success': True, 'job': job_summary(job)})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'})
+
+@admin_bp.route('/exports/<job_id>')
+@admin_required
+def export_status(job_id):
+    """Progress of an export job"""
+    from models import ExportJob
+    from services.export_jobs import job_summary
+    
+    try:
+        job = ExportJob.objects(id=ObjectId(job_id)).first()
+        if not job:
+            return jsonify({'success': False, 'message': 'Export not found'}), 404
+        return jsonify({'success': True, 'job': job_summary(job)})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'})
+
+@admin_bp.route('/exports/<job_id>/download')
+@admin_required
+def download_export(job_id):
+    """Stream a completed export from GridFS"""
+    from flask import Response
+    from models import ExportJob
+    from services.export_jobs import open_export_file
+    from services.export_service import content_disposition
+    
+    try:
+        job = ExportJob.objects(id=ObjectId(job_id)).first()
+        grid_out = open_export_file(job) if job else None
+        if not grid_out:
+            flash('Export not found or not ready yet.', 'error')
+            return redirect(url_for('admin.analytics'))
+        
+        def chunks():
+            try:
+                # Iterating a GridOut yields lines; read fixed-size blocks instead
+                while True:
+                    chunk = grid_out.read(256 * 1024)
+                    if not chunk:
+                        break
+                    yield chunk
+            finally:
+                grid_out.close()
+        
+        return Response(chunks(), mimetype=grid_out.content_type or 'application/octet-stream', headers={
+            'Content-Disposition': content_disposition(job.filename),
+            'Content-Length': str(grid_out.length),
+            'Cache-Control': 'no-store'
+        })
+    except Exception as e:
+        flash(f"Error: {str(e)}", 'error')
+        return redirect(url_for('admin.analytics'))
+
+@admin_bp.route('/api/exports')
+@admin_required
+def list_exports():
+    """Recent export jobs requested by the current admin"""
+    from models import ExportJob
+    from services.export_jobs import job_summary
+    
+    try:
+        jobs = ExportJob.objects(requested_by=str(current_user.id)).order_by('-created_at').limit(20)
+        return jsonify({'success': True, 'jobs': [job_summary(job) for job in jobs]})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'})
+
 @admin_bp.route('/system-reports')
 @admin_required
 def system_reports():
@@ -644,3 +712,43 @@ def create_category():
         
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error: {str(e)}'})
+
+@admin_bp.route('/api/conversation-shards')
+@admin_required
+def conversation_shard_metrics():
+    """Queue depth and latency per conversation shard in this worker process"""
+    try:
+        from services.sharded_executor import get_conversation_executor
+        return jsonify({'success': True, 'metrics': get_conversation_executor().get_metrics()})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'})
+
+@admin_bp.route('/api/gpt-streaming')
+@admin_required
+def gpt_streaming_metrics():
+    """Time to first message of streamed GPT replies in this worker process"""
+    try:
+        from services.gpt_streaming import get_streaming_metrics
+        return jsonify({'success': True, 'metrics': get_streaming_metrics()})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'})
+
+@admin_bp.route('/api/response-cache')
+@admin_required
+def response_cache_metrics():
+    """Hit rate and size of the GPT response cache in this worker process"""
+    try:
+        from services.response_cache import get_response_cache
+        return jsonify({'success': True, 'metrics': get_response_cache().get_metrics()})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'})
+
+@admin_bp.route('/api/query-metrics')
+@admin_required
+def query_metrics():
+    """Average Mongo queries and DB time per route in this worker process"""
+    try:
+        from services.query_metrics import get_query_metrics
+        return jsonify({'success': True, 'metrics': get_query_metrics().get_metrics()})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'})
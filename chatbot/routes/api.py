@@ -8,6 +8,7 @@ from flask_login import login_required, current_user
 from models import Order, Customer, Product, Business
 from datetime import datetime, timedelta
 from mongoengine import Q
+from bson import ObjectId
 from services.auth.auth_manager import get_user_role
 import os
 
@@ -130,6 +131,7 @@ def sales_data():
     """Get sales data for charts"""
     try:
         user_role = get_user_role(current_user)
+        from services.daily_stats import is_rollups_enabled, get_daily_series
         
         if user_role == 'vendor':
             # Get vendor's businesses
@@ -141,6 +143,7 @@ def sales_data():
             # Get sales data for last 7 days
             end_date = datetime.utcnow().date()
             start_date = end_date - timedelta(days=6)
+            scope = {'business': {'$in': [ObjectId(business_id) for business_id in business_ids]}}
             
             # Query orders for the date range and business IDs
             orders = Order.objects(
@@ -154,6 +157,7 @@ def sales_data():
             # Get all sales data
             end_date = datetime.utcnow().date()
             start_date = end_date - timedelta(days=6)
+            scope = {}
             
             orders = Order.objects(
                 status='delivered',
@@ -161,6 +165,24 @@ def sales_data():
                 created_at__lte=datetime.combine(end_date, datetime.max.time())
             )
         
+        # Daily delivered revenue from the rollups when enabled
+        if is_rollups_enabled():
+            try:
+                daily = get_daily_series(
+                    scope,
+                    datetime.combine(start_date, datetime.min.time()),
+                    datetime.combine(end_date, datetime.min.time()),
+                    'revenue_by_status.delivered'
+                )
+                dates = [start_date + timedelta(days=i) for i in range(7)]
+                return jsonify({
+                    'success': True,
+                    'labels': [date.strftime('%m/%d') for date in dates],
+                    'values': [daily.get(date, 0.0) for date in dates]
+                })
+            except Exception as e:
+                logger.error(f"Error reading sales rollups, scanning orders instead: {str(e)}")
+        
         # Create labels and values arrays
         labels = []
         values = []
@@ -200,8 +222,22 @@ def orders_data():
                 return jsonify({'success': True, 'values': [0, 0, 0, 0]})
             
             base_query = Order.objects(business__in=business_ids)
+            scope = {'business': {'$in': [ObjectId(business_id) for business_id in business_ids]}}
         else:  # admin or default case
             base_query = Order.objects()
+            scope = {}
+        
+        # Status counts from the daily rollups when enabled
+        from services.daily_stats import is_rollups_enabled, get_order_figures
+        if is_rollups_enabled():
+            try:
+                statuses = get_order_figures(scope, datetime.utcnow())['status_breakdown']
+                return jsonify({
+                    'success': True,
+                    'values': [statuses.get(status, 0) for status in ('pending', 'processing', 'delivered', 'cancelled')]
+                })
+            except Exception as e:
+                logger.error(f"Error reading order rollups, counting orders instead: {str(e)}")
         
         pending = base_query.filter(status='pending').count()
         processing = base_query.filter(status='processing').count()
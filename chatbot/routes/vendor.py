@@ -1,6 +1,6 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_file
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
-from models import Business, Product, Category, Order, Customer, ChatSession, ChatMessage, ProductVariation, OrderItem, OrderIssue, Vendor
+from models import Business, Product, Category, Order, Customer, ChatSession, ChatMessage, ProductVariation, OrderItem, OrderIssue, Vendor, Campaign
 from services.auth.decorators import vendor_required
 from services.auth.auth_manager import get_user_role
 from services.image_service import update_product_image, get_image_url, delete_image_from_gridfs
@@ -8,8 +8,6 @@ from werkzeug.utils import secure_filename
 from bson import ObjectId
 from mongoengine.errors import DoesNotExist
 from mongoengine.queryset.visitor import Q
-import csv
-import io
 import logging
 import os
 import random
@@ -117,39 +115,57 @@ def dashboard():
         if businesses:
             logger.info(f"Processing statistics for {len(businesses)} businesses")
             
-            # Use try-catch for each database query
-            try:
-                total_orders = Order.objects(business__in=businesses).count()
-                logger.info(f"Total orders: {total_orders}")
-            except Exception as e:
-                logger.error(f"Error getting total orders: {e}")
-                total_orders = 0
-            
-            try:
-                paid_orders = Order.objects(business__in=businesses, payment_status='paid').count()
-                logger.info(f"Paid orders: {paid_orders}")
-            except Exception as e:
-                logger.error(f"Error getting paid orders: {e}")
-                paid_orders = 0
-            
-            try:
-                # Calculate total revenue with safety checks
-                paid_orders_list = Order.objects(business__in=businesses, payment_status='paid')
-                total_revenue = 0
-                for order in paid_orders_list:
-                    if hasattr(order, 'total_amount') and order.total_amount:
-                        total_revenue += float(order.total_amount)
-                logger.info(f"Total revenue: {total_revenue}")
-            except Exception as e:
-                logger.error(f"Error calculating revenue: {e}")
-                total_revenue = 0
+            # Order figures come from the daily rollups when enabled
+            order_figures = None
+            from services.daily_stats import is_rollups_enabled, get_order_figures
+            if is_rollups_enabled():
+                try:
+                    order_figures = get_order_figures(
+                        {'business': {'$in': [business.id for business in businesses]}},
+                        datetime.utcnow() - timedelta(days=30)
+                    )
+                    total_orders = order_figures['total_orders']
+                    paid_orders = order_figures['paid_orders']
+                    total_revenue = order_figures['total_revenue']
+                    pending_orders = order_figures['status_breakdown'].get('pending', 0)
+                except Exception as e:
+                    logger.error(f"Error reading order rollups: {e}")
+                    order_figures = None
             
-            try:
-                pending_orders = Order.objects(business__in=businesses, status='pending').count()
-                logger.info(f"Pending orders: {pending_orders}")
-            except Exception as e:
-                logger.error(f"Error getting pending orders: {e}")
-                pending_orders = 0
+            if order_figures is None:
+                # Use try-catch for each database query
+                try:
+                    total_orders = Order.objects(business__in=businesses).count()
+                    logger.info(f"Total orders: {total_orders}")
+                except Exception as e:
+                    logger.error(f"Error getting total orders: {e}")
+                    total_orders = 0
+                
+                try:
+                    paid_orders = Order.objects(business__in=businesses, payment_status='paid').count()
+                    logger.info(f"Paid orders: {paid_orders}")
+                except Exception as e:
+                    logger.error(f"Error getting paid orders: {e}")
+                    paid_orders = 0
+                
+                try:
+                    # Calculate total revenue with safety checks
+                    paid_orders_list = Order.objects(business__in=businesses, payment_status='paid')
+                    total_revenue = 0
+                    for order in paid_orders_list:
+                        if hasattr(order, 'total_amount') and order.total_amount:
+                            total_revenue += float(order.total_amount)
+                    logger.info(f"Total revenue: {total_revenue}")
+                except Exception as e:
+                    logger.error(f"Error calculating revenue: {e}")
+                    total_revenue = 0
+                
+                try:
+                    pending_orders = Order.objects(business__in=businesses, status='pending').count()
+                    logger.info(f"Pending orders: {pending_orders}")
+                except Exception as e:
+                    logger.error(f"Error getting pending orders: {e}")
+                    pending_orders = 0
             
             try:
                 # Recent orders
@@ -233,9 +249,9 @@ def edit_profile():
 @vendor_required
 def businesses():
     if get_user_role(current_user) == 'admin':
-        businesses = Business.objects.all()
+        businesses = list(Business.objects.all())
     else:
-        businesses = Business.objects(vendor=current_user)
+        businesses = list(Business.objects(vendor=current_user))
     
     return render_template('vendor/businesses.html', businesses=businesses)
 
@@ -310,6 +326,11 @@ def edit_business(business_id):
             business.custom_instructions = request.form.get('custom_instructions')
             
             business.save()
+            
+            from services.business_cache import invalidate_business_route
+            from services.response_cache import invalidate_business_responses
+            invalidate_business_route(business.id)
+            invalidate_business_responses(business.id)
             flash('Business updated successfully!', 'success')
             return redirect(url_for('vendor.business_detail', business_id=business_id))
         
@@ -338,6 +359,9 @@ def whatsapp_config(business_id):
             business.whatsapp_phone_id = request.form.get('whatsapp_phone_id')
             
             business.save()
+            
+            from services.business_cache import invalidate_business_route
+            invalidate_business_route(business.id)
             flash('WhatsApp configuration updated successfully!', 'success')
             return redirect(url_for('vendor.business_detail', business_id=business_id))
         
@@ -416,22 +440,15 @@ def products(business_id):
         # Get pagination parameters
         page = request.args.get('page', 1, type=int)
         per_page = 10  # Number of products per page
-        skip = (page - 1) * per_page
         
-        # Get paginated products using MongoEngine skip/limit
-        products_query = Product.objects(business=business)
-        total = products_query.count()
-        products_list = products_query.skip(skip).limit(per_page)
+        # Keyset page, newest products first
+        from services.pagination import paginate_keyset
+        products = paginate_keyset(Product.objects(business=business), request.args.get('cursor'), page, per_page)
         
-        # Calculate order counts for each product
-        for product in products_list:
-            # Count orders containing this product
-            order_count = Order.objects(order_items__product=product).count()
-            product.order_count = order_count
-        
-        # Create pagination object
-        from services.pagination import Pagination
-        products = Pagination(page, per_page, total, products_list)
+        # Order counts of the whole page in one aggregation
+        order_counts = Order.count_by_product(products.items)
+        for product in products.items:
+            product.order_count = order_counts[str(product.pk)]
         
         categories = Category.objects(business=business)
         
@@ -550,8 +567,7 @@ def edit_product(product_id):
             return redirect(url_for('vendor.products', business_id=str(product.business.id)))
         
         # Calculate order count for this product
-        order_count = Order.objects(order_items__product=product).count()
-        product.order_count = order_count
+        product.order_count = Order.count_by_product([product])[str(product.pk)]
         
         return render_template('vendor/edit_product.html', 
                              business=product.business, 
@@ -690,7 +706,7 @@ def categories(business_id):
                     flash('Category not found or access denied.', 'error')
                 return redirect(url_for('vendor.categories', business_id=business_id))
         
-        categories = Category.objects(business=business)
+        categories = list(Category.objects(business=business))
         
         return render_template('vendor/categories.html',
                              business=business,
@@ -747,7 +763,6 @@ def orders(business_id):
         # Get pagination parameters
         page = request.args.get('page', 1, type=int)
         per_page = 20
-        skip = (page - 1) * per_page
         
         status_filter = request.args.get('status')
         orders_query = Order.objects(business=business)
@@ -755,13 +770,9 @@ def orders(business_id):
         if status_filter:
             orders_query = orders_query.filter(status=status_filter)
         
-        # Get paginated orders
-        total = orders_query.count()
-        orders_list = orders_query.order_by('-created_at').skip(skip).limit(per_page)
-        
-        # Create pagination object
-        from services.pagination import Pagination
-        orders = Pagination(page, per_page, total, orders_list)
+        # Keyset page: deep pages cost the same as the first
+        from services.pagination import paginate_keyset
+        orders = paginate_keyset(orders_query, request.args.get('cursor'), page, per_page)
         
         return render_template('vendor/orders.html',
                              business=business,
@@ -841,16 +852,10 @@ def order_issues(business_id):
         # Get pagination parameters
         page = request.args.get('page', 1, type=int)
         per_page = 20
-        skip = (page - 1) * per_page
-        
-        # Get order issues for this business
-        issues_query = OrderIssue.objects(business=business)
-        total = issues_query.count()
-        issues_list = issues_query.order_by('-created_at').skip(skip).limit(per_page)
         
-        # Create pagination object
-        from services.pagination import Pagination
-        issues = Pagination(page, per_page, total, issues_list)
+        # Keyset page of the order issues for this business
+        from services.pagination import paginate_keyset
+        issues = paginate_keyset(OrderIssue.objects(business=business), request.args.get('cursor'), page, per_page)
         
         return render_template('vendor/order_issues.html', 
                              business=business, 
@@ -925,20 +930,20 @@ def chat_sessions(business_id):
         # Get pagination parameters
         page = request.args.get('page', 1, type=int)
         per_page = 20
-        skip = (page - 1) * per_page
         
-        # Get paginated sessions
-        sessions_query = ChatSession.objects(business=business)
-        total = sessions_query.count()
-        sessions_list = sessions_query.order_by('-created_at').skip(skip).limit(per_page)
+        # Keyset page: deep pages cost the same as the first
+        from services.pagination import paginate_keyset
+        sessions = paginate_keyset(ChatSession.objects(business=business).exclude('messages'), request.args.get('cursor'), page, per_page)
         
-        # Create pagination object
-        from services.pagination import Pagination
-        sessions = Pagination(page, per_page, total, sessions_list)
+        # Message previews for the whole page in one query
+        from services.chat_store import get_recent_messages_for_sessions, fill_unmigrated_summaries
+        recent_messages = get_recent_messages_for_sessions([session.pk for session in sessions.items])
+        fill_unmigrated_summaries(sessions.items)
         
         return render_template('vendor/chat_sessions.html',
                              business=business,
-                             sessions=sessions)
+                             sessions=sessions,
+                             recent_messages=recent_messages)
     except Exception as e:
         flash(f'Error: {str(e)}', 'error')
         return redirect(url_for('vendor.businesses'))
@@ -978,7 +983,93 @@ def bulk_messaging():
         businesses = Business.objects.all()
     else:
         businesses = Business.objects(vendor=current_user)
-    return render_template('vendor/bulk_messaging.html', businesses=businesses)
+    campaigns = Campaign.objects(business__in=list(businesses)).order_by('-created_at').limit(10)
+    return render_template('vendor/bulk_messaging.html', businesses=businesses, campaigns=campaigns)
+
+def _bulk_message_filter():
+    """Customer filter options posted by the bulk messaging forms"""
+    customer_filter = {}
+    for key in ('start_date', 'end_date', 'phone_numbers', 'active_days'):
+        if request.form.get(key):
+            customer_filter[key] = request.form.get(key)
+    return customer_filter
+
+@vendor_bp.route('/send-bulk-message', methods=['POST'])
+@vendor_required
+def send_bulk_message():
+    from services.bulk_messaging import send_bulk_message
+    
+    try:
+        business_id = request.form.get('business_id')
+        message = request.form.get('message')
+        vendor_id = None if get_user_role(current_user) == 'admin' else current_user.id
+        
+        result = send_bulk_message(business_id, message, _bulk_message_filter(), vendor_id)
+        
+        if result.get('success'):
+            flash(f"Bulk message campaign {result['campaign_id']} started. Messages are being sent in the background.", 'success')
+        else:
+            flash(f"Error sending bulk message: {result.get('error', 'Unknown error')}", 'error')
+        
+        return redirect(url_for('vendor.bulk_messaging'))
+        
+    except Exception as e:
+        flash(f"Error: {str(e)}", 'error')
+        return redirect(url_for('vendor.bulk_messaging'))
+
+@vendor_bp.route('/send-promotional-message', methods=['POST'])
+@vendor_required
+def send_promotional_message():
+    from services.bulk_messaging import send_promotional_message
+    
+    try:
+        business_id = request.form.get('business_id')
+        header = request.form.get('header')
+        body = request.form.get('body')
+        footer = request.form.get('footer') or ''
+        vendor_id = None if get_user_role(current_user) == 'admin' else current_user.id
+        
+        buttons = []
+        for i in range(1, 4):
+            text = request.form.get(f'button_{i}_text')
+            button_id = request.form.get(f'button_{i}_id')
+            if text and button_id:
+                buttons.append({'text': text, 'id': button_id})
+        
+        result = send_promotional_message(business_id, header, body, footer, buttons or None, _bulk_message_filter(), vendor_id)
+        
+        if result.get('success'):
+            flash(f"Promotional campaign {result['campaign_id']} started. Messages are being sent in the background.", 'success')
+        else:
+            flash(f"Error sending promotional message: {result.get('error', 'Unknown error')}", 'error')
+        
+        return redirect(url_for('vendor.bulk_messaging'))
+        
+    except Exception as e:
+        flash(f"Error: {str(e)}", 'error')
+        return redirect(url_for('vendor.bulk_messaging'))
+
+@vendor_bp.route('/bulk-messaging/campaigns/<campaign_id>/progress')
+@vendor_required
+def campaign_progress(campaign_id):
+    from services.bulk_messaging import get_campaign_progress
+    
+    vendor_id = None if get_user_role(current_user) == 'admin' else current_user.id
+    result = get_campaign_progress(campaign_id, vendor_id)
+    if result.get('error'):
+        return jsonify({'success': False, 'message': result['error']}), 404
+    return jsonify(result)
+
+@vendor_bp.route('/bulk-messaging/campaigns/<campaign_id>/resume', methods=['POST'])
+@vendor_required
+def resume_campaign(campaign_id):
+    from services.bulk_messaging import resume_campaign
+    
+    vendor_id = None if get_user_role(current_user) == 'admin' else current_user.id
+    result = resume_campaign(campaign_id, vendor_id)
+    if result.get('error'):
+        return jsonify({'success': False, 'message': result['error']})
+    return jsonify(result)
 
 @vendor_bp.route('/export-data/<business_id>')
 @vendor_required
@@ -995,37 +1086,21 @@ def export_data(business_id):
             flash('Access denied.', 'error')
             return redirect(url_for('vendor.businesses'))
         
-        # Create CSV data
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write headers
-        writer.writerow(['Order Number', 'Customer Phone', 'Product Names', 'Total Amount', 'Status', 'Date'])
-        
-        # Write order data
-        orders = Order.objects(business=business)
-        for order in orders:
-            product_names = []
-            for item in order.order_items:
-                product_names.append(f"{item.product.name} (x{item.quantity})")
-            
-            writer.writerow([
-                order.order_number,
-                order.customer.phone_number,
-                ', '.join(product_names),
-                order.total_amount,
-                order.status,
-                order.created_at.strftime('%Y-%m-%d %H:%M:%S')
-            ])
-        
-        # Create response
-        output.seek(0)
-        return send_file(
-            io.BytesIO(output.getvalue().encode()),
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=f'{business.name}_orders_export.csv'
-        )
+        data_type = request.args.get('type', 'orders')
+        file_format = request.args.get('format', 'csv')
+        # Whole history unless a number of days is given
+        days = request.args.get('days', type=int)
+        start_date = datetime.utcnow() - timedelta(days=days) if days else None
+        
+        from services.export_service import get_export, export_response
+        export = get_export(data_type, business.id, start_date)
+        if not export:
+            flash('Invalid export type.', 'error')
+            return redirect(url_for('vendor.analytics', business_id=business_id))
+        
+        # Rows are streamed to the client as they are read
+        columns, rows = export
+        return export_response(columns, rows, f'{business.name}_{data_type}_export', file_format)
     except Exception as e:
         flash(f'Error: {str(e)}', 'error')
         return redirect(url_for('vendor.businesses'))
@@ -1162,7 +1237,9 @@ def chat_ui(business_id):
             return redirect(url_for('vendor.businesses'))
         
         # Get active chat sessions for this business
-        chat_sessions = ChatSession.objects(business=business).order_by('-created_at').limit(50)
+        chat_sessions = list(ChatSession.objects(business=business).exclude('messages').order_by('-created_at').limit(50))
+        from services.chat_store import fill_unmigrated_summaries
+        fill_unmigrated_summaries(chat_sessions)
         
         return render_template('vendor/chat_ui.html',
                              business=business,
@@ -1186,7 +1263,9 @@ def chat_ui_all():
                 return redirect(url_for('vendor.businesses'))
         
         # Admin can see all chat sessions
-        chat_sessions = ChatSession.objects().order_by('-created_at').limit(100)
+        chat_sessions = list(ChatSession.objects().exclude('messages').order_by('-created_at').limit(100))
+        from services.chat_store import fill_unmigrated_summaries
+        fill_unmigrated_summaries(chat_sessions)
         
         return render_template('vendor/chat_ui.html',
                              business=None,
@@ -1216,20 +1295,20 @@ def get_chat_messages(session_id):
         messages = []
         new_messages = []
         
-        if session.messages:
-            for message in session.messages:
-                message_data = {
-                    'message_text': message.message_text,
-                    'sender_type': message.sender_type,
-                    'timestamp': message.timestamp.isoformat() if message.timestamp else None,
-                    'message_type': message.message_type
-                }
-                messages.append(message_data)
-                
-                # If polling, check for messages newer than last_message_time
-                if poll and last_message_time and message.timestamp:
-                    if message.timestamp.isoformat() > last_message_time:
-                        new_messages.append(message_data)
+        from services.chat_store import get_messages
+        for message in get_messages(session):
+            message_data = {
+                'message_text': message.message_text,
+                'sender_type': message.sender_type,
+                'timestamp': message.timestamp.isoformat() if message.timestamp else None,
+                'message_type': message.message_type
+            }
+            messages.append(message_data)
+            
+            # If polling, check for messages newer than last_message_time
+            if poll and last_message_time and message.timestamp:
+                if message.timestamp.isoformat() > last_message_time:
+                    new_messages.append(message_data)
         
         # Get customer information
         customer_data = {
@@ -1282,8 +1361,7 @@ def send_chat_message(session_id):
         )
         
         # Add message to session
-        session.messages.append(message)
-        session.save()
+        ChatSession.append_messages(session.session_id, [message])
         
         # Send the message via WhatsApp
         from services.business_messaging_service import send_business_whatsapp_text_message
@@ -2,6 +2,7 @@ import logging
 from flask import jsonify
 from datetime import datetime, timedelta
 from mongoengine import Q
+from bson import ObjectId
 import json
 
 # Import models at module level to avoid repeated imports
@@ -36,20 +37,25 @@ class AnalyticsService:
             
             start_date = datetime.utcnow() - timedelta(days=days)
             
+            # One aggregation per collection returns every figure of the scope
+            scope = {'business': ObjectId(str(business_id))}
+            order_facets = AnalyticsService._get_order_facets(scope, start_date)
+            chat_facets = AnalyticsService._get_chat_facets(scope, start_date)
+            
             # Customer Analytics
-            customer_analytics = AnalyticsService._get_customer_analytics(business_id, start_date)
+            customer_analytics = AnalyticsService._get_customer_analytics(chat_facets)
             
             # Order Analytics
-            order_analytics = AnalyticsService._get_order_analytics(business_id, start_date)
+            order_analytics = AnalyticsService._get_order_analytics(order_facets)
             
             # Product Analytics
             product_analytics = AnalyticsService._get_product_analytics(business_id, start_date)
             
             # Chat Analytics
-            chat_analytics = AnalyticsService._get_chat_analytics(business_id, start_date)
+            chat_analytics = AnalyticsService._get_chat_analytics(business_id, start_date, chat_facets)
             
             # Revenue Analytics
-            revenue_analytics = AnalyticsService._get_revenue_analytics(business_id, start_date)
+            revenue_analytics = AnalyticsService._get_revenue_analytics(order_facets)
             
             return {
                 "success": True,
@@ -124,53 +130,30 @@ class AnalyticsService:
                     "message": "No active businesses found"
                 }
             
-            # Aggregate analytics across all businesses
-            total_customers_list = ChatSession.objects(business__in=business_ids).distinct('customer')
-            total_customers_qs = len(total_customers_list) if total_customers_list else 0
-            
-            recent_customers_list = ChatSession.objects(
-                Q(business__in=business_ids) & Q(created_at__gte=start_date)
-            ).distinct('customer')
-            recent_customers_qs = len(recent_customers_list) if recent_customers_list else 0
-            
-            total_orders_qs = Order.objects(business__in=business_ids).count()
-            recent_orders_qs = Order.objects(
-                Q(business__in=business_ids) & Q(created_at__gte=start_date)
-            ).count()
-            
-            # Convert QuerySet/cursor results to integers safely
-            total_customers = int(total_customers_qs) if total_customers_qs is not None else 0
-            recent_customers = int(recent_customers_qs) if recent_customers_qs is not None else 0
-            total_orders = int(total_orders_qs) if total_orders_qs is not None else 0
-            recent_orders = int(recent_orders_qs) if recent_orders_qs is not None else 0
-
-            # Calculate total revenue and count paid orders
-            paid_orders_queryset = Order.objects(
-                Q(business__in=business_ids) & Q(payment_status='paid')
-            ).only('total_amount')
-            total_revenue = sum(order.total_amount for order in paid_orders_queryset)
-            paid_orders_count_qs = Order.objects(
-                Q(business__in=business_ids) & Q(payment_status='paid')
-            ).count()
-            paid_orders_count = int(paid_orders_count_qs) if paid_orders_count_qs is not None else 0
-            
-            recent_paid_orders = Order.objects(
-                Q(business__in=business_ids) & Q(payment_status='paid') & Q(created_at__gte=start_date)
-            ).only('total_amount')
-            recent_revenue = sum(order.total_amount for order in recent_paid_orders)
+            # Aggregate analytics across all businesses, with a per-business
+            # breakdown, in one aggregation per collection
+            scope = {'business': {'$in': [ObjectId(business_id) for business_id in business_ids]}}
+            order_facets = AnalyticsService._get_order_facets(scope, start_date, by_business=True)
+            chat_facets = AnalyticsService._get_chat_facets(scope, start_date, by_business=True)
+            
+            total_customers = chat_facets['total_customers']
+            recent_customers = chat_facets['recent_customers']
+            total_orders = order_facets['total_orders']
+            recent_orders = order_facets['recent_orders']
+            total_revenue = order_facets['total_revenue']
+            recent_revenue = order_facets['recent_revenue']
             
             # Business performance breakdown
             business_performance = []
             for business in businesses:
-                business_analytics = AnalyticsService.get_business_analytics(business.id, days)
-                if business_analytics.get('success'):
-                    business_performance.append({
-                        "business_id": business.id,
-                        "business_name": business.name,
-                        "customers": business_analytics.get('customer_analytics', {}).get('total_customers', 0),
-                        "orders": business_analytics.get('order_analytics', {}).get('total_orders', 0),
-                        "revenue": business_analytics.get('revenue_analytics', {}).get('total_revenue', 0)
-                    })
+                orders = order_facets['by_business'].get(str(business.id), {})
+                business_performance.append({
+                    "business_id": business.id,
+                    "business_name": business.name,
+                    "customers": chat_facets['by_business'].get(str(business.id), 0),
+                    "orders": orders.get('orders', 0),
+                    "revenue": float(orders.get('revenue', 0))
+                })
             
             return {
                 "success": True,
@@ -217,139 +200,65 @@ class AnalyticsService:
             
             # Vendor Analytics
             try:
-                # Test database connection first
-                test_count = Vendor.objects.count()  # This will fail if DB is not connected
-                
-                total_vendors_qs = Vendor.objects(is_active=True).count()
-                recent_vendors_qs = Vendor.objects(
-                    Q(is_active=True) & Q(created_at__gte=start_date)
-                ).count()
-                
-                # Convert QuerySet/cursor results to integers safely
-                total_vendors = int(total_vendors_qs) if total_vendors_qs is not None else 0
-                recent_vendors = int(recent_vendors_qs) if recent_vendors_qs is not None else 0
-                    
+                vendor_counts = AnalyticsService._get_count_facets(Vendor, {'is_active': True}, start_date)
+                total_vendors = vendor_counts['total']
+                recent_vendors = vendor_counts['recent']
             except Exception as e:
                 logger.error(f"Error getting vendor analytics: {str(e)}")
                 total_vendors = recent_vendors = 0
             
             # Business Analytics
             try:
-                total_businesses_qs = Business.objects(is_active=True).count()
-                recent_businesses_qs = Business.objects(
-                    Q(is_active=True) & Q(created_at__gte=start_date)
-                ).count()
-                
-                # Convert QuerySet/cursor results to integers safely
-                total_businesses = int(total_businesses_qs) if total_businesses_qs is not None else 0
-                recent_businesses = int(recent_businesses_qs) if recent_businesses_qs is not None else 0
-                    
+                business_counts = AnalyticsService._get_count_facets(Business, {'is_active': True}, start_date)
+                total_businesses = business_counts['total']
+                recent_businesses = business_counts['recent']
             except Exception as e:
                 logger.error(f"Error getting business analytics: {str(e)}")
                 total_businesses = recent_businesses = 0
             
             # Customer Analytics
             try:
-                total_customers_qs = Customer.objects().count()
-                recent_customers_qs = Customer.objects(created_at__gte=start_date).count()
-                
-                # Convert QuerySet/cursor results to integers safely
-                total_customers = int(total_customers_qs) if total_customers_qs is not None else 0
-                recent_customers = int(recent_customers_qs) if recent_customers_qs is not None else 0
-                    
+                customer_counts = AnalyticsService._get_count_facets(Customer, {}, start_date)
+                total_customers = customer_counts['total']
+                recent_customers = customer_counts['recent']
             except Exception as e:
                 logger.error(f"Error getting customer analytics: {str(e)}")
                 total_customers = recent_customers = 0
             
-            # Order Analytics
+            # Order and Revenue Analytics
             try:
-                total_orders_qs = Order.objects().count()
-                recent_orders_qs = Order.objects(created_at__gte=start_date).count()
-                paid_orders_qs = Order.objects(payment_status='paid').count()
-                
-                # Convert QuerySet/cursor results to integers safely
-                total_orders = int(total_orders_qs) if total_orders_qs is not None else 0
-                recent_orders = int(recent_orders_qs) if recent_orders_qs is not None else 0
-                paid_orders = int(paid_orders_qs) if paid_orders_qs is not None else 0
-                    
+                order_facets = AnalyticsService._get_order_facets({}, start_date)
+                total_orders = order_facets['total_orders']
+                recent_orders = order_facets['recent_orders']
+                paid_orders = order_facets['paid_orders']
+                total_revenue = order_facets['total_revenue']
+                recent_revenue = order_facets['recent_revenue']
             except Exception as e:
                 logger.error(f"Error getting order analytics: {str(e)}")
                 total_orders = recent_orders = paid_orders = 0
-            
-            # Revenue Analytics
-            try:
-                all_paid_orders = Order.objects(payment_status='paid').only('total_amount')
-                total_revenue = sum(order.total_amount or 0 for order in all_paid_orders)
-                
-                recent_paid_orders = Order.objects(
-                    Q(payment_status='paid') & Q(created_at__gte=start_date)
-                ).only('total_amount')
-                recent_revenue = sum(order.total_amount or 0 for order in recent_paid_orders)
-            except Exception as e:
-                logger.error(f"Error calculating revenue: {str(e)}")
-                total_revenue = 0
-                recent_revenue = 0
+                total_revenue = recent_revenue = 0
             
             # Chat Analytics
             try:
-                total_chat_sessions_qs = ChatSession.objects().count()
-                recent_chat_sessions_qs = ChatSession.objects(created_at__gte=start_date).count()
-                
-                # Convert QuerySet/cursor results to integers safely
-                total_chat_sessions = int(total_chat_sessions_qs) if total_chat_sessions_qs is not None else 0
-                recent_chat_sessions = int(recent_chat_sessions_qs) if recent_chat_sessions_qs is not None else 0
-                    
+                from services.daily_stats import is_rollups_enabled, get_chat_counts
+                chat_counts = None
+                if is_rollups_enabled():
+                    try:
+                        rollup_counts = get_chat_counts({}, start_date)
+                        chat_counts = {'total': rollup_counts['sessions'], 'recent': rollup_counts['recent_sessions']}
+                    except Exception as e:
+                        logger.error(f"Error reading chat rollups, counting sessions instead: {str(e)}")
+                if chat_counts is None:
+                    chat_counts = AnalyticsService._get_count_facets(ChatSession, {}, start_date)
+                total_chat_sessions = chat_counts['total']
+                recent_chat_sessions = chat_counts['recent']
             except Exception as e:
                 logger.error(f"Error getting chat analytics: {str(e)}")
                 total_chat_sessions = recent_chat_sessions = 0
             
-            # Top performing businesses - simplified approach to avoid aggregation issues
+            # Top performing businesses by paid revenue in the period
             try:
-                # Get all paid orders with business info - limit to recent orders for performance
-                paid_orders = Order.objects(
-                    Q(payment_status='paid') & Q(created_at__gte=start_date)
-                ).only('business', 'total_amount').limit(1000)  # Limit for performance
-                
-                # Group by business manually
-                paid_orders_by_business = {}
-                
-                for order in paid_orders:
-                    try:
-                        if order.business and order.total_amount:
-                            business_id = str(order.business.id)
-                            business_name = order.business.name
-                            
-                            if business_id not in paid_orders_by_business:
-                                paid_orders_by_business[business_id] = {
-                                    'order_count': 0,
-                                    'revenue': 0,
-                                    'business_name': business_name
-                                }
-                            paid_orders_by_business[business_id]['order_count'] += 1
-                            paid_orders_by_business[business_id]['revenue'] += (order.total_amount or 0)
-                    except Exception as order_error:
-                        logger.error(f"Error processing order: {str(order_error)}")
-                        continue
-                
-                # Sort by revenue and get top 10
-                if paid_orders_by_business:
-                    sorted_businesses = sorted(
-                        paid_orders_by_business.items(), 
-                        key=lambda x: x[1]['revenue'], 
-                        reverse=True
-                    )[:10]
-                    
-                    top_businesses_list = []
-                    for business_id, data in sorted_businesses:
-                        top_businesses_list.append({
-                            "business_id": business_id,
-                            "business_name": data['business_name'],
-                            "order_count": data['order_count'],
-                            "revenue": float(data['revenue'])
-                        })
-                else:
-                    top_businesses_list = []
-                    
+                top_businesses_list = AnalyticsService._get_top_businesses(start_date)
             except Exception as e:
                 logger.error(f"Error getting top businesses: {str(e)}")
                 top_businesses_list = []
@@ -409,415 +318,6 @@ class AnalyticsService:
                 "revenue_chart_data": {"labels": [], "data": []}
             }
     
-    @staticmethod
-    def get_export_data(business_id, data_type, vendor_id=None, start_date=None, end_date=None):
-        """Export data for analytics"""
-        try:
-            # Verify permissions
-            if vendor_id:
-                business = Business.objects(Q(id=business_id) & Q(vendor=vendor_id)).first()
-                if not business:
-                    return {"error": "Business not found or access denied"}
-            
-            if start_date:
-                start_date = datetime.strptime(start_date, '%Y-%m-%d')
-            else:
-                start_date = datetime.utcnow() - timedelta(days=30)
-            
-            if end_date:
-                end_date = datetime.strptime(end_date, '%Y-%m-%d')
-                end_date = end_date.replace(hour=23, minute=59, second=59)
-            else:
-                end_date = datetime.utcnow()
-            
-            if data_type == 'orders':
-                return AnalyticsService._export_orders(business_id, start_date, end_date)
-            elif data_type == 'customers':
-                return AnalyticsService._export_customers(business_id, start_date, end_date)
-            elif data_type == 'products':
-                return AnalyticsService._export_products(business_id, start_date, end_date)
-            elif data_type == 'chats':
-                return AnalyticsService._export_chats(business_id, start_date, end_date)
-            else:
-                return {"error": "Invalid data type"}
-            
-        except Exception as e:
-            logger.error(f"Error exporting data: {str(e)}")
-            return {"error": str(e)}
-    
-    @staticmethod
-    def _export_orders(business_id, start_date, end_date):
-        """Export orders data"""
-        try:
-            orders = Order.objects(
-                Q(business=business_id) & 
-                Q(created_at__gte=start_date) & 
-                Q(created_at__lte=end_date)
-            )
-            
-            export_data = []
-            for order in orders:
-                export_data.append({
-                    "order_number": order.order_number,
-                    "customer_phone": order.customer.phone_number if order.customer else '',
-                    "customer_name": order.customer.name if order.customer and order.customer.name else '',
-                    "total_amount": order.total_amount,
-                    "status": order.status,
-                    "payment_status": order.payment_status,
-                    "payment_method": order.payment_method if hasattr(order, 'payment_method') else '',
-                    "created_at": order.created_at.isoformat(),
-                    "customization_notes": order.customization_notes if hasattr(order, 'customization_notes') else ''
-                })
-            
-            return {"success": True, "data": export_data}
-            
-        except Exception as e:
-            logger.error(f"Error exporting orders: {str(e)}")
-            return {"error": str(e)}
-    
-    @staticmethod
-    def _export_customers(business_id, start_date, end_date):
-        """Export customers data"""
-        try:
-            # Get customers who have chatted with this business in the date range
-            chat_sessions = ChatSession.objects(
-                Q(business=business_id) & 
-                Q(created_at__gte=start_date) & 
-                Q(created_at__lte=end_date)
-            ).distinct('customer')
-            
-            customer_ids = [session.customer.id for session in ChatSession.objects(
-                Q(business=business_id) & 
-                Q(created_at__gte=start_date) & 
-                Q(created_at__lte=end_date)
-            ).only('customer')]
-            
-            customers = Customer.objects(id__in=customer_ids)
-            
-            export_data = []
-            for customer in customers:
-                # Get chat and order statistics
-                chat_sessions_count_qs = ChatSession.objects(
-                    Q(business=business_id) & Q(customer=customer.id)
-                ).count()
-                chat_sessions_count = int(chat_sessions_count_qs) if chat_sessions_count_qs is not None else 0
-                
-                orders_count_qs = Order.objects(
-                    Q(business=business_id) & Q(customer=customer.id)
-                ).count()
-                orders_count = int(orders_count_qs) if orders_count_qs is not None else 0
-                
-                paid_orders = Order.objects(
-                    Q(business=business_id) & 
-                    Q(customer=customer.id) & 
-                    Q(payment_status='paid')
-                ).only('total_amount')
-                total_spent = sum(order.total_amount for order in paid_orders)
-                
-                export_data.append({
-                    "phone_number": customer.phone_number,
-                    "name": customer.name or '',
-                    "email": customer.email or '',
-                    "created_at": customer.created_at.isoformat(),
-                    "chat_sessions": chat_sessions_count,
-                    "orders": orders_count,
-                    "total_spent": float(total_spent)
-                })
-            
-            return {"success": True, "data": export_data}
-            
-        except Exception as e:
-            logger.error(f"Error exporting customers: {str(e)}")
-            return {"error": str(e)}
-    
-    @staticmethod
-    def _export_products(business_id, start_date, end_date):
-        """Export products performance data"""
-        try:
-            from models import OrderItem
-            
-            products = Product.objects(business=business_id)
-            
-            export_data = []
-            for product in products:
-                # Get sales data for the period using aggregation
-                pipeline = [
-                    {"$match": {
-                        "business": business_id,
-                        "payment_status": "paid",
-                        "created_at": {"$gte": start_date, "$lte": end_date}
-                    }},
-                    {"$unwind": "$order_items"},
-                    {"$match": {"order_items.product": str(product.id)}},
-                    {"$group": {
-                        "_id": None,
-                        "total_sold": {"$sum": "$order_items.quantity"},
-                        "total_revenue": {"$sum": "$order_items.total_price"},
-                        "unique_customers": {"$addToSet": "$customer"}
-                    }},
-                    {"$project": {
-                        "total_sold": 1,
-                        "total_revenue": 1,
-                        "unique_customers": {"$size": "$unique_customers"}
-                    }}
-                ]
-                
-                sales_data = list(Order.objects.aggregate(pipeline))
-                
-                if sales_data:
-                    data = sales_data[0]
-                    total_sold = data.get('total_sold', 0)
-                    total_revenue = data.get('total_revenue', 0)
-                    unique_customers = data.get('unique_customers', 0)
-                else:
-                    total_sold = total_revenue = unique_customers = 0
-                
-                export_data.append({
-                    "product_id": product.product_id if hasattr(product, 'product_id') else str(product.id),
-                    "product_name": product.name,
-                    "category": product.category.name if product.category else '',
-                    "price": product.price,
-                    "is_active": product.is_active,
-                    "allows_customization": product.allows_customization if hasattr(product, 'allows_customization') else False,
-                    "has_variations": product.has_variations if hasattr(product, 'has_variations') else False,
-                    "total_sold": total_sold,
-                    "total_revenue": float(total_revenue),
-                    "unique_customers": unique_customers,
-                    "created_at": product.created_at.isoformat()
-                })
-            
-            return {"success": True, "data": export_data}
-            
-        except Exception as e:
-            logger.error(f"Error exporting products: {str(e)}")
-            return {"error": str(e)}
-    
-    @staticmethod
-    def _export_chats(business_id, start_date, end_date):
-        """Export chat sessions data"""
-        try:
-            chat_sessions = ChatSession.objects(
-                Q(business=business_id) & 
-                Q(created_at__gte=start_date) & 
-                Q(created_at__lte=end_date)
-            )
-            
-            export_data = []
-            for session in chat_sessions:
-                message_count_qs = ChatMessage.objects(session=session.id).count()
-                message_count = int(message_count_qs) if message_count_qs is not None else 0
-                
-                export_data.append({
-                    "session_id": session.session_id if hasattr(session, 'session_id') else str(session.id),
-                    "customer_phone": session.customer.phone_number if session.customer else '',
-                    "customer_name": session.customer.name if session.customer and session.customer.name else '',
-                    "created_at": session.created_at.isoformat(),
-                    "message_count": message_count
-                })
-            
-            return {"success": True, "data": export_data}
-            
-        except Exception as e:
-            logger.error(f"Error exporting chats: {str(e)}")
-            return {"error": str(e)}
-    
-    @staticmethod
-    def get_system_export_data(data_type, start_date=None, end_date=None):
-        """Export system-wide data for admins"""
-        try:
-            if start_date:
-                start_date = datetime.strptime(start_date, '%Y-%m-%d')
-            else:
-                start_date = datetime.utcnow() - timedelta(days=30)
-            
-            if end_date:
-                end_date = datetime.strptime(end_date, '%Y-%m-%d')
-                end_date = end_date.replace(hour=23, minute=59, second=59)
-            else:
-                end_date = datetime.utcnow()
-            
-            if data_type == 'orders':
-                return AnalyticsService._export_system_orders(start_date, end_date)
-            elif data_type == 'customers':
-                return AnalyticsService._export_system_customers(start_date, end_date)
-            elif data_type == 'businesses':
-                return AnalyticsService._export_system_businesses(start_date, end_date)
-            elif data_type == 'vendors':
-                return AnalyticsService._export_system_vendors(start_date, end_date)
-            elif data_type == 'chats':
-                return AnalyticsService._export_system_chats(start_date, end_date)
-            else:
-                return {"error": "Invalid data type"}
-            
-        except Exception as e:
-            logger.error(f"Error exporting system data: {str(e)}")
-            return {"error": str(e)}
-    
-    @staticmethod
-    def _export_system_orders(start_date, end_date):
-        """Export all orders system-wide"""
-        try:
-            orders = Order.objects(created_at__gte=start_date, created_at__lte=end_date)
-            
-            export_data = []
-            for order in orders:
-                export_data.append({
-                    "order_id": str(order.id),
-                    "business_name": order.business.name if order.business else '',
-                    "vendor_name": order.business.vendor.name if order.business and order.business.vendor else '',
-                    "customer_name": order.customer.name if order.customer else '',
-                    "customer_phone": order.customer.phone_number if order.customer else '',
-                    "total_amount": float(order.total_amount) if order.total_amount else 0.0,
-                    "payment_status": order.payment_status,
-                    "order_status": order.status,
-                    "created_at": order.created_at.isoformat(),
-                    "updated_at": order.updated_at.isoformat() if order.updated_at else ''
-                })
-            
-            return {"success": True, "data": export_data}
-            
-        except Exception as e:
-            logger.error(f"Error exporting system orders: {str(e)}")
-            return {"error": str(e)}
-    
-    @staticmethod
-    def _export_system_customers(start_date, end_date):
-        """Export all customers system-wide"""
-        try:
-            customers = Customer.objects(created_at__gte=start_date, created_at__lte=end_date)
-            
-            export_data = []
-            for customer in customers:
-                # Get customer's order count and total spent
-                order_count_qs = Order.objects(customer=customer).count()
-                order_count = int(order_count_qs) if order_count_qs is not None else 0
-                
-                paid_orders = Order.objects(customer=customer, payment_status='paid').only('total_amount')
-                total_spent = sum(order.total_amount or 0 for order in paid_orders)
-                
-                export_data.append({
-                    "customer_id": str(customer.id),
-                    "name": customer.name,
-                    "phone": customer.phone_number,
-                    "email": customer.email or '',
-                    "order_count": order_count,
-                    "total_spent": float(total_spent),
-                    "created_at": customer.created_at.isoformat(),
-                    "last_activity": customer.last_activity.isoformat() if hasattr(customer, 'last_activity') and customer.last_activity else ''
-                })
-            
-            return {"success": True, "data": export_data}
-            
-        except Exception as e:
-            logger.error(f"Error exporting system customers: {str(e)}")
-            return {"error": str(e)}
-    
-    @staticmethod
-    def _export_system_businesses(start_date, end_date):
-        """Export all businesses system-wide"""
-        try:
-            businesses = Business.objects(created_at__gte=start_date, created_at__lte=end_date)
-            
-            export_data = []
-            for business in businesses:
-                # Get business statistics
-                order_count_qs = Order.objects(business=business).count()
-                order_count = int(order_count_qs) if order_count_qs is not None else 0
-                
-                paid_orders = Order.objects(business=business, payment_status='paid').only('total_amount')
-                total_revenue = sum(order.total_amount or 0 for order in paid_orders)
-                
-                # Fix: distinct() returns a list, so we need to count the length
-                customer_distinct_list = ChatSession.objects(business=business).distinct('customer')
-                customer_count = len(customer_distinct_list) if customer_distinct_list else 0
-                
-                export_data.append({
-                    "business_id": str(business.id),
-                    "name": business.name,
-                    "vendor_name": business.vendor.name if business.vendor else '',
-                    "phone": business.whatsapp_number,
-                    "email": business.email or '',
-                    "category": business.category,
-                    "is_active": business.is_active,
-                    "order_count": order_count,
-                    "total_revenue": float(total_revenue),
-                    "customer_count": customer_count,
-                    "created_at": business.created_at.isoformat(),
-                    "whatsapp_number": business.whatsapp_number or ''
-                })
-            
-            return {"success": True, "data": export_data}
-            
-        except Exception as e:
-            logger.error(f"Error exporting system businesses: {str(e)}")
-            return {"error": str(e)}
-    
-    @staticmethod
-    def _export_system_vendors(start_date, end_date):
-        """Export all vendors system-wide"""
-        try:
-            vendors = Vendor.objects(created_at__gte=start_date, created_at__lte=end_date)
-            
-            export_data = []
-            for vendor in vendors:
-                # Get vendor statistics
-                business_count_qs = Business.objects(vendor=vendor).count()
-                business_count = int(business_count_qs) if business_count_qs is not None else 0
-                
-                vendor_businesses = Business.objects(vendor=vendor)
-                total_orders_qs = Order.objects(business__in=vendor_businesses).count()
-                total_orders = int(total_orders_qs) if total_orders_qs is not None else 0
-                
-                paid_orders = Order.objects(business__in=vendor_businesses, payment_status='paid').only('total_amount')
-                total_revenue = sum(order.total_amount or 0 for order in paid_orders)
-                
-                export_data.append({
-                    "vendor_id": str(vendor.id),
-                    "name": vendor.name,
-                    "email": vendor.email,
-                    "phone": vendor.phone_number or '',
-                    "is_active": vendor.is_active,
-                    "business_count": business_count,
-                    "total_orders": total_orders,
-                    "total_revenue": float(total_revenue),
-                    "created_at": vendor.created_at.isoformat(),
-                    "last_login": vendor.last_login.isoformat() if hasattr(vendor, 'last_login') and vendor.last_login else ''
-                })
-            
-            return {"success": True, "data": export_data}
-            
-        except Exception as e:
-            logger.error(f"Error exporting system vendors: {str(e)}")
-            return {"error": str(e)}
-    
-    @staticmethod
-    def _export_system_chats(start_date, end_date):
-        """Export all chat sessions system-wide"""
-        try:
-            sessions = ChatSession.objects(created_at__gte=start_date, created_at__lte=end_date)
-            
-            export_data = []
-            for session in sessions:
-                message_count_qs = ChatMessage.objects(session=session).count()
-                message_count = int(message_count_qs) if message_count_qs is not None else 0
-                
-                export_data.append({
-                    "session_id": str(session.id),
-                    "business_name": session.business.name if session.business else '',
-                    "vendor_name": session.business.vendor.name if session.business and session.business.vendor else '',
-                    "customer_name": session.customer.name if session.customer else '',
-                    "customer_phone": session.customer.phone_number if session.customer else '',
-                    "message_count": message_count,
-                    "created_at": session.created_at.isoformat(),
-                    "last_message": session.last_message_at.isoformat() if hasattr(session, 'last_message_at') and session.last_message_at else ''
-                })
-            
-            return {"success": True, "data": export_data}
-            
-        except Exception as e:
-            logger.error(f"Error exporting system chats: {str(e)}")
-            return {"error": str(e)}
-
     @staticmethod
     def health_check():
         """Simple health check for analytics service"""
@@ -833,16 +333,114 @@ class AnalyticsService:
             return {"status": "error", "message": str(e)}
 
     @staticmethod
-    def _get_customer_analytics(business_id, start_date):
+    def _get_count_facets(model, match, start_date):
+        """Total and recent (created_at >= start_date) document counts in one round trip"""
+        pipeline = [
+            {'$match': match},
+            {'$group': {
+                '_id': None,
+                'total': {'$sum': 1},
+                'recent': {'$sum': {'$cond': [{'$gte': ['$created_at', start_date]}, 1, 0]}}
+            }}
+        ]
+        result = list(model.objects.aggregate(pipeline))
+        row = result[0] if result else {}
+        return {'total': int(row.get('total', 0)), 'recent': int(row.get('recent', 0))}
+
+    @staticmethod
+    def _get_order_facets(match, start_date, by_business=False):
+        """
+        Every order figure of a scope with a single $facet aggregation
+        Counts, paid/pending/cancelled breakdowns, total and recent revenue and,
+        with by_business, orders and revenue per business.
+        """
+        from services.daily_stats import is_rollups_enabled, get_order_figures
+        if is_rollups_enabled():
+            try:
+                return get_order_figures(match, start_date, by_business)
+            except Exception as e:
+                logger.error(f"Error reading order rollups, scanning orders instead: {str(e)}")
+        
+        recent = {'$gte': ['$created_at', start_date]}
+        paid = {'$eq': ['$payment_status', 'paid']}
+        amount = {'$ifNull': ['$total_amount', 0]}
+        facets = {
+            'totals': [{'$group': {
+                '_id': None,
+                'total_orders': {'$sum': 1},
+                'recent_orders': {'$sum': {'$cond': [recent, 1, 0]}},
+                'paid_orders': {'$sum': {'$cond': [paid, 1, 0]}},
+                'total_revenue': {'$sum': {'$cond': [paid, amount, 0]}},
+                'recent_revenue': {'$sum': {'$cond': [{'$and': [paid, recent]}, amount, 0]}}
+            }}],
+            'by_status': [{'$group': {'_id': '$status', 'count': {'$sum': 1}}}],
+            'by_payment_status': [{'$group': {'_id': '$payment_status', 'count': {'$sum': 1}}}]
+        }
+        if by_business:
+            facets['by_business'] = [{'$group': {
+                '_id': '$business',
+                'orders': {'$sum': 1},
+                'revenue': {'$sum': {'$cond': [paid, amount, 0]}}
+            }}]
+        
+        result = list(Order.objects.aggregate([{'$match': match}, {'$facet': facets}]))
+        result = result[0] if result else {}
+        totals = (result.get('totals') or [{}])[0]
+        
+        facets = {
+            'total_orders': int(totals.get('total_orders', 0)),
+            'recent_orders': int(totals.get('recent_orders', 0)),
+            'paid_orders': int(totals.get('paid_orders', 0)),
+            'total_revenue': float(totals.get('total_revenue', 0)),
+            'recent_revenue': float(totals.get('recent_revenue', 0)),
+            'status_breakdown': {row['_id']: row['count'] for row in result.get('by_status', [])},
+            'payment_status_breakdown': {row['_id']: row['count'] for row in result.get('by_payment_status', [])}
+        }
+        if by_business:
+            facets['by_business'] = {
+                str(row['_id']): {'orders': row['orders'], 'revenue': row['revenue']}
+                for row in result.get('by_business', [])
+            }
+        return facets
+
+    @staticmethod
+    def _get_chat_facets(match, start_date, by_business=False):
+        """Session and distinct customer counts (total and recent) of a scope with a single $facet aggregation"""
+        recent = {'$cond': [{'$gte': ['$created_at', start_date]}, 1, 0]}
+        facets = {
+            'sessions': [{'$group': {'_id': None, 'total': {'$sum': 1}, 'recent': {'$sum': recent}}}],
+            'customers': [
+                {'$group': {'_id': '$customer', 'recent': {'$max': recent}}},
+                {'$group': {'_id': None, 'total': {'$sum': 1}, 'recent': {'$sum': '$recent'}}}
+            ]
+        }
+        if by_business:
+            facets['by_business'] = [
+                {'$group': {'_id': {'business': '$business', 'customer': '$customer'}}},
+                {'$group': {'_id': '$_id.business', 'customers': {'$sum': 1}}}
+            ]
+        
+        result = list(ChatSession.objects.aggregate([{'$match': match}, {'$facet': facets}]))
+        result = result[0] if result else {}
+        sessions = (result.get('sessions') or [{}])[0]
+        customers = (result.get('customers') or [{}])[0]
+        
+        facets = {
+            'total_chat_sessions': int(sessions.get('total', 0)),
+            'recent_chat_sessions': int(sessions.get('recent', 0)),
+            'total_customers': int(customers.get('total', 0)),
+            'recent_customers': int(customers.get('recent', 0))
+        }
+        if by_business:
+            facets['by_business'] = {str(row['_id']): row['customers'] for row in result.get('by_business', [])}
+        return facets
+
+    @staticmethod
+    def _get_customer_analytics(chat_facets):
         """Get customer analytics for a business"""
         try:
-            total_customers_list = ChatSession.objects(business=business_id).distinct('customer')
-            total_customers = len(total_customers_list) if total_customers_list else 0
-            
-            recent_customers_list = ChatSession.objects(
-                Q(business=business_id) & Q(created_at__gte=start_date)
-            ).distinct('customer')
-            recent_customers = len(recent_customers_list) if recent_customers_list else 0
+            total_customers = chat_facets['total_customers']
+            recent_customers = chat_facets['recent_customers']
             
             returning_customers = 0
             customer_growth = (recent_customers / total_customers * 100) if total_customers > 0 else 0
@@ -858,26 +456,16 @@ class AnalyticsService:
             return {"total_customers": 0, "recent_customers": 0, "returning_customers": 0, "customer_growth": 0}
 
     @staticmethod
-    def _get_order_analytics(business_id, start_date):
+    def _get_order_analytics(order_facets):
         """Get order analytics for a business"""
         try:
-            total_orders = Order.objects(business=business_id).count()
-            total_orders = int(total_orders) if total_orders is not None else 0
+            total_orders = order_facets['total_orders']
+            recent_orders = order_facets['recent_orders']
+            paid_orders = order_facets['paid_orders']
+            pending_orders = order_facets['payment_status_breakdown'].get('pending', 0)
+            cancelled_orders = order_facets['status_breakdown'].get('cancelled', 0)
             
-            recent_orders = Order.objects(Q(business=business_id) & Q(created_at__gte=start_date)).count()
-            recent_orders = int(recent_orders) if recent_orders is not None else 0
-            
-            paid_orders = Order.objects(Q(business=business_id) & Q(payment_status='paid')).count()
-            paid_orders = int(paid_orders) if paid_orders is not None else 0
-            
-            pending_orders = Order.objects(Q(business=business_id) & Q(payment_status='pending')).count()
-            pending_orders = int(pending_orders) if pending_orders is not None else 0
-            
-            cancelled_orders = Order.objects(Q(business=business_id) & Q(status='cancelled')).count()
-            cancelled_orders = int(cancelled_orders) if cancelled_orders is not None else 0
-            
-            paid_order_amounts = Order.objects(Q(business=business_id) & Q(payment_status='paid')).only('total_amount')
-            total_revenue = sum(order.total_amount or 0 for order in paid_order_amounts)
+            total_revenue = order_facets['total_revenue']
             average_order_value = (total_revenue / paid_orders) if paid_orders > 0 else 0
             conversion_rate = (paid_orders / total_orders * 100) if total_orders > 0 else 0
             
@@ -910,20 +498,27 @@ class AnalyticsService:
             return {"total_products": 0, "best_sellers": []}
 
     @staticmethod
-    def _get_chat_analytics(business_id, start_date):
+    def _get_chat_analytics(business_id, start_date, chat_facets):
         """Get chat analytics for a business"""
         try:
-            total_chat_sessions = ChatSession.objects(business=business_id).count()
-            total_chat_sessions = int(total_chat_sessions) if total_chat_sessions is not None else 0
-            
-            recent_chat_sessions = ChatSession.objects(Q(business=business_id) & Q(created_at__gte=start_date)).count()
-            recent_chat_sessions = int(recent_chat_sessions) if recent_chat_sessions is not None else 0
-            
-            total_messages = ChatMessage.objects(session__in=ChatSession.objects(business=business_id)).count()
-            total_messages = int(total_messages) if total_messages is not None else 0
-            
-            recent_messages = ChatMessage.objects(Q(session__in=ChatSession.objects(business=business_id)) & Q(created_at__gte=start_date)).count()
-            recent_messages = int(recent_messages) if recent_messages is not None else 0
+            total_chat_sessions = chat_facets['total_chat_sessions']
+            recent_chat_sessions = chat_facets['recent_chat_sessions']
+            
+            # Messages are counted from the daily rollups or the bucketed message store
+            from services.daily_stats import is_rollups_enabled, get_chat_counts
+            chat_counts = None
+            if is_rollups_enabled():
+                try:
+                    chat_counts = get_chat_counts({'business': ObjectId(str(business_id))}, start_date)
+                except Exception as e:
+                    logger.error(f"Error reading chat rollups, counting messages instead: {str(e)}")
+            if chat_counts:
+                total_messages = chat_counts['messages']
+                recent_messages = chat_counts['recent_messages']
+            else:
+                from services.chat_store import count_business_messages
+                total_messages = int(count_business_messages(business_id))
+                recent_messages = int(count_business_messages(business_id, since=start_date))
             
             average_messages_per_session = (total_messages / total_chat_sessions) if total_chat_sessions > 0 else 0
             
@@ -939,24 +534,60 @@ class AnalyticsService:
             return {"total_chat_sessions": 0, "recent_chat_sessions": 0, "total_messages": 0, "recent_messages": 0, "average_messages_per_session": 0.0}
 
     @staticmethod
-    def _get_revenue_analytics(business_id, start_date):
+    def _get_revenue_analytics(order_facets):
         """Get revenue analytics for a business"""
         try:
-            paid_orders = Order.objects(Q(business=business_id) & Q(payment_status='paid')).only('total_amount')
-            total_revenue = sum(order.total_amount or 0 for order in paid_orders)
-            
-            recent_paid_orders = Order.objects(Q(business=business_id) & Q(payment_status='paid') & Q(created_at__gte=start_date)).only('total_amount')
-            recent_revenue = sum(order.total_amount or 0 for order in recent_paid_orders)
-            
             return {
-                "total_revenue": float(total_revenue),
-                "recent_revenue": float(recent_revenue),
+                "total_revenue": order_facets['total_revenue'],
+                "recent_revenue": order_facets['recent_revenue'],
                 "daily_revenue": []
             }
         except Exception as e:
             logger.error(f"Error getting revenue analytics: {str(e)}")
             return {"total_revenue": 0.0, "recent_revenue": 0.0, "daily_revenue": []}
 
+    @staticmethod
+    def _get_top_businesses(start_date, limit=10):
+        """
+        Businesses with the most paid revenue since start_date
+        Grouped on the server over every paid order (or the daily rollups when
+        enabled); names are looked up for the top `limit` businesses only.
+        """
+        from services.daily_stats import is_rollups_enabled, day_of
+        top = [
+            {'$match': {'revenue': {'$gt': 0}}},
+            {'$sort': {'revenue': -1}},
+            {'$limit': limit},
+            {'$lookup': {'from': Business._get_collection_name(), 'localField': '_id', 'foreignField': '_id', 'as': 'business'}},
+            {'$project': {'order_count': 1, 'revenue': 1, 'business_name': {'$ifNull': [{'$arrayElemAt': ['$business.name', 0]}, '']}}}
+        ]
+        
+        rows = None
+        if is_rollups_enabled():
+            try:
+                from models import DailyBusinessStats
+                rows = list(DailyBusinessStats.objects.aggregate([
+                    {'$match': {'date': {'$gte': day_of(start_date)}, 'paid_orders': {'$gt': 0}}},
+                    {'$group': {'_id': '$business', 'order_count': {'$sum': '$paid_orders'}, 'revenue': {'$sum': '$paid_revenue'}}}
+                ] + top))
+            except Exception as e:
+                logger.error(f"Error reading top businesses from rollups, scanning orders instead: {str(e)}")
+        if rows is None:
+            rows = list(Order.objects.aggregate([
+                {'$match': {'payment_status': 'paid', 'created_at': {'$gte': start_date}}},
+                {'$group': {'_id': '$business', 'order_count': {'$sum': 1}, 'revenue': {'$sum': {'$ifNull': ['$total_amount', 0]}}}}
+            ] + top))
+        
+        return [
+            {
+                "business_id": str(row['_id']),
+                "business_name": row['business_name'],
+                "order_count": int(row['order_count']),
+                "revenue": float(row['revenue'])
+            }
+            for row in rows
+        ]
+
     @staticmethod
     def _get_revenue_chart_data(days=30):
         """Generate daily revenue data for charts"""
@@ -974,19 +605,31 @@ class AnalyticsService:
             # Initialize revenue data for each day
             revenue_by_date = {date: 0 for date in date_range}
             
-            # Get all paid orders within the date range
-            paid_orders = Order.objects(
-                Q(payment_status='paid') & 
-                Q(created_at__gte=start_date) & 
-                Q(created_at__lte=end_date)
-            ).only('total_amount', 'created_at')
-            
-            # Group orders by date and sum revenue
-            for order in paid_orders:
-                if order.created_at and order.total_amount:
-                    order_date = order.created_at.date()
-                    if order_date in revenue_by_date:
-                        revenue_by_date[order_date] += float(order.total_amount)
+            from services.daily_stats import is_rollups_enabled, get_daily_series
+            if is_rollups_enabled():
+                try:
+                    for date, revenue in get_daily_series({}, start_date, end_date, 'paid_revenue').items():
+                        if date in revenue_by_date:
+                            revenue_by_date[date] = revenue
+                    return {
+                        'labels': [date.strftime('%b %d') for date in date_range],
+                        'data': [revenue_by_date[date] for date in date_range]
+                    }
+                except Exception as e:
+                    logger.error(f"Error reading revenue rollups, scanning orders instead: {str(e)}")
+            
+            # Sum paid revenue per day on the server
+            daily_revenue = Order.objects.aggregate([
+                {'$match': {'payment_status': 'paid', 'created_at': {'$gte': start_date, '$lte': end_date}}},
+                {'$group': {
+                    '_id': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$created_at'}},
+                    'revenue': {'$sum': {'$ifNull': ['$total_amount', 0]}}
+                }}
+            ])
+            for row in daily_revenue:
+                order_date = datetime.strptime(row['_id'], '%Y-%m-%d').date()
+                if order_date in revenue_by_date:
+                    revenue_by_date[order_date] += float(row['revenue'])
             
             # Format data for chart
             labels = []
@@ -0,0 +1,128 @@
+import logging
+from bson import ObjectId
+
+logger = logging.getLogger(__name__)
+
+# Request-scoped batch loading for template filters
+# The product_count / order_count / category_count / category_products
+# filters are called once per row a template renders. Instead of a query per
+# call, a loader stored on flask.g collects every business and category that
+# is about to be rendered (primed from the template context before rendering)
+# and, on the first filter call of each kind, resolves all of them with one
+# query. Results are memoised for the rest of the request; a row that was not
+# primed is loaded together with whatever else is still pending.
+
+class BatchLoader:
+    """Collects keys and resolves them in one call per batch"""
+
+    def __init__(self, resolve, default=None):
+        # resolve(list of ObjectId) -> {ObjectId: value}
+        self.resolve = resolve
+        self.default = default
+        self.pending = set()
+        self.results = {}
+
+    def prime(self, key):
+        if key not in self.results:
+            self.pending.add(key)
+
+    def load(self, key):
+        if key not in self.results:
+            keys = self.pending | {key}
+            self.pending = set()
+            resolved = self.resolve(sorted(keys))
+            for k in keys:
+                value = resolved.get(k, self.default)
+                # Each key gets its own copy of a mutable default
+                self.results[k] = list(value) if isinstance(value, list) else value
+        return self.results[key]
+
+def _count_by(model, field):
+    """Resolver counting documents of a model per value of a reference field"""
+    def resolve(ids):
+        pipeline = [
+            {'$match': {field: {'$in': ids}}},
+            {'$group': {'_id': f"${field}", 'count': {'$sum': 1}}}
+        ]
+        return {row['_id']: int(row['count']) for row in model._get_collection().aggregate(pipeline)}
+    return resolve
+
+def _products_by_category(ids):
+    from models import Product
+    products = {}
+    for product in Product.objects(category__in=ids):
+        category_id = getattr(product._data.get('category'), 'id', None)
+        products.setdefault(category_id, []).append(product)
+    return products
+
+class TemplateLoaders:
+    """The loaders of one request"""
+
+    def __init__(self):
+        from models import Product, Order, Category
+        self.product_count = BatchLoader(_count_by(Product, 'business'), default=0)
+        self.order_count = BatchLoader(_count_by(Order, 'business'), default=0)
+        self.category_count = BatchLoader(_count_by(Category, 'business'), default=0)
+        self.category_products = BatchLoader(_products_by_category, default=[])
+
+    def prime_business(self, business_id):
+        for loader in (self.product_count, self.order_count, self.category_count):
+            loader.prime(business_id)
+
+    def prime_category(self, category_id):
+        self.category_products.prime(category_id)
+
+def get_template_loaders():
+    """Loaders of the current request, created on first use"""
+    from flask import g
+    loaders = g.get('template_loaders')
+    if loaders is None:
+        loaders = g.template_loaders = TemplateLoaders()
+    return loaders
+
+def document_id(value):
+    """ObjectId of a document, DBRef or id"""
+    return ObjectId(str(getattr(value, 'pk', None) or getattr(value, 'id', value)))
+
+def _documents(value):
+    """Documents held by a template context value, without running new queries"""
+    from mongoengine import Document
+    from mongoengine.queryset import QuerySet
+
+    if isinstance(value, Document):
+        return [value]
+    if isinstance(value, (list, tuple)):
+        return [item for item in value if isinstance(item, Document)]
+    # Pagination and similar wrappers
+    items = getattr(value, 'items', None)
+    if isinstance(items, list):
+        return [item for item in items if isinstance(item, Document)]
+    # Only querysets that were already evaluated; evaluating one here would
+    # run it a second time when the template iterates it
+    if isinstance(value, QuerySet) and getattr(value, '_has_more', True) is False:
+        return list(getattr(value, '_result_cache', None) or [])
+    return []
+
+def prime_from_context(context):
+    """Register every business and category in a template context with the loaders"""
+    from models import Business, Category
+
+    loaders = get_template_loaders()
+    for value in context.values():
+        try:
+            for document in _documents(value):
+                if isinstance(document, Business):
+                    loaders.prime_business(document.pk)
+                elif isinstance(document, Category):
+                    loaders.prime_category(document.pk)
+        except Exception as e:
+            logger.error(f"Error priming template loaders: {str(e)}")
+
+def init_template_loaders(app):
+    """Prime the loaders from each template context before it is rendered"""
+    from flask import before_render_template
+
+    def prime(sender, template, context, **extra):
+        prime_from_context(context)
+
+    before_render_template.connect(prime, app, weak=False)
@@ -7,8 +7,11 @@ except ImportError as e:
     print(f"Warning: pandas import failed: {e}")
 import logging
 from flask import jsonify
-from models import Customer, ChatSession, Business, Vendor
-from services.messaging_service import send_whatsapp_text_message, send_whatsapp_interactive_message
+from models import Customer, ChatSession, Business, Vendor, Campaign, CampaignRecipient
+from services.business_messaging_service import send_business_whatsapp_text_message, send_business_whatsapp_interactive_message
+from services.whatsapp_client import get_business_credentials
+from services.bulk_send_engine import get_bulk_send_engine
+from mongoengine.queryset.visitor import Q
 from datetime import datetime, timedelta
 import os
 
@@ -20,6 +23,8 @@ class BulkMessagingService:
     def send_bulk_message_to_customers(business_id, message, customer_filter=None, vendor_id=None):
         """
         Send bulk message to customers based on filters
+        The campaign runs in the background; the returned campaign_id can be
+        used to follow its progress or resume it.
         
         Args:
             business_id: ID of the business sending the message
@@ -28,43 +33,20 @@ class BulkMessagingService:
             vendor_id: ID of vendor (for permission checking)
         """
         try:
-            # Verify permissions using MongoEngine
-            if vendor_id:
-                business = Business.objects(id=business_id, vendor=vendor_id).first()
-                if not business:
-                    return {"error": "Business not found or access denied"}
-            else:
-                business = Business.objects(id=business_id).first()
-                if not business:
-                    return {"error": "Business not found"}
-            
-            # Get customers based on filter
-            customers = BulkMessagingService._get_filtered_customers(business_id, customer_filter)
-            
-            sent_count = 0
-            failed_count = 0
-            failed_numbers = []
-            
-            for customer in customers:
-                try:
-                    send_whatsapp_text_message(customer.phone_number, message)
-                    sent_count += 1
-                    logger.info(f"Message sent to {customer.phone_number}")
-                except Exception as e:
-                    logger.error(f"Failed to send message to {customer.phone_number}: {str(e)}")
-                    failed_count += 1
-                    failed_numbers.append(customer.phone_number)
-            
-            # Log the bulk message activity
-            BulkMessagingService._log_bulk_message(business_id, message, sent_count, failed_count)
+            business = BulkMessagingService._get_business(business_id, vendor_id)
+            if isinstance(business, dict):
+                return business
+            
+            campaign = Campaign(
+                business=business,
+                vendor=business.vendor,
+                campaign_type='text',
+                message_text=message,
+                customer_filter=customer_filter or {}
+            )
+            campaign.save()
             
-            return {
-                "success": True,
-                "sent": sent_count,
-                "failed": failed_count,
-                "total": len(customers),
-                "failed_numbers": failed_numbers
-            }
+            return BulkMessagingService._start_campaign(campaign, business)
             
         except Exception as e:
             logger.error(f"Error in bulk messaging: {str(e)}")
@@ -73,59 +55,250 @@ class BulkMessagingService:
     @staticmethod
     def send_promotional_message(business_id, header, body, footer, buttons=None, customer_filter=None, vendor_id=None):
         """
-        Send interactive promotional message to customers
+        Send interactive promotional message to customers in the background
         """
         try:
-            # Verify permissions using MongoEngine
-            if vendor_id:
-                business = Business.objects(id=business_id, vendor=vendor_id).first()
-                if not business:
-                    return {"error": "Business not found or access denied"}
-            else:
-                business = Business.objects(id=business_id).first()
-                if not business:
-                    return {"error": "Business not found"}
+            business = BulkMessagingService._get_business(business_id, vendor_id)
+            if isinstance(business, dict):
+                return business
+            
+            campaign = Campaign(
+                business=business,
+                vendor=business.vendor,
+                campaign_type='promotional',
+                message_text=f"PROMO: {header} - {body}",
+                header=header,
+                body=body,
+                footer=footer,
+                buttons=buttons or [],
+                customer_filter=customer_filter or {}
+            )
+            campaign.save()
             
-            # Get customers based on filter
-            customers = BulkMessagingService._get_filtered_customers(business_id, customer_filter)
+            return BulkMessagingService._start_campaign(campaign, business)
             
-            sent_count = 0
-            failed_count = 0
-            failed_numbers = []
+        except Exception as e:
+            logger.error(f"Error in promotional messaging: {str(e)}")
+            return {"error": str(e)}
+    
+    @staticmethod
+    def resume_campaign(campaign_id, vendor_id=None):
+        """Resume an interrupted campaign, sending only to recipients not yet messaged"""
+        try:
+            campaign = BulkMessagingService._get_campaign(campaign_id, vendor_id)
+            if isinstance(campaign, dict):
+                return campaign
+            
+            if campaign.status == 'completed':
+                return {"error": "Campaign has already completed"}
+            
+            if get_bulk_send_engine().is_running(str(campaign.id)):
+                return {"error": "Campaign is still running"}
+            
+            # Claim the campaign in one step, so concurrent resumes (double
+            # clicks, other gunicorn workers) cannot both start sending. A
+            # campaign that checkpointed recently is still being sent by some worker.
+            now = datetime.utcnow()
+            stale_before = now - timedelta(seconds=int(os.getenv('CAMPAIGN_STALE_SECONDS', 120)))
+            claimed = Campaign.objects(
+                Q(id=campaign.id) & Q(status__ne='completed') & (
+                    Q(status='failed') |
+                    Q(last_checkpoint_at__lt=stale_before) |
+                    (Q(last_checkpoint_at=None) & Q(created_at__lt=stale_before))
+                )
+            ).modify(new=True, set__status='running', set__last_checkpoint_at=now)
+            if not claimed:
+                return {"error": "Campaign is still running"}
+            
+            return BulkMessagingService._start_campaign(claimed, claimed.business)
             
-            for customer in customers:
-                try:
-                    if buttons:
-                        send_whatsapp_interactive_message(
-                            customer.phone_number, header, body, footer, buttons
-                        )
-                    else:
-                        message = f"{header}\n\n{body}\n\n{footer}"
-                        send_whatsapp_text_message(customer.phone_number, message)
-                    
-                    sent_count += 1
-                    logger.info(f"Promotional message sent to {customer.phone_number}")
-                except Exception as e:
-                    logger.error(f"Failed to send promotional message to {customer.phone_number}: {str(e)}")
-                    failed_count += 1
-                    failed_numbers.append(customer.phone_number)
+        except Exception as e:
+            logger.error(f"Error resuming campaign: {str(e)}")
+            return {"error": str(e)}
+    
+    @staticmethod
+    def get_campaign_progress(campaign_id, vendor_id=None):
+        """Live progress and throughput of a campaign"""
+        try:
+            campaign = BulkMessagingService._get_campaign(campaign_id, vendor_id)
+            if isinstance(campaign, dict):
+                return campaign
+            
+            now = datetime.utcnow()
+            processed = campaign.sent + campaign.failed
+            pending = max(campaign.total - processed, 0)
+            
+            elapsed = 0
+            if campaign.started_at:
+                elapsed = ((campaign.finished_at or now) - campaign.started_at).total_seconds()
+            throughput = round(processed / elapsed, 2) if elapsed > 0 else 0
+            
+            # Throughput over the last minute reflects the current send rate
+            recent_processed = CampaignRecipient.objects(
+                campaign=campaign.id,
+                sent_at__gte=now - timedelta(seconds=60)
+            ).count()
+            recent_throughput = round(recent_processed / 60, 2)
             
-            # Log the promotional campaign
-            message_text = f"PROMO: {header} - {body}"
-            BulkMessagingService._log_bulk_message(business_id, message_text, sent_count, failed_count)
+            eta = None
+            if campaign.status == 'running' and pending and (recent_throughput or throughput):
+                eta = int(pending / (recent_throughput or throughput))
             
             return {
                 "success": True,
-                "sent": sent_count,
-                "failed": failed_count,
-                "total": len(customers),
-                "failed_numbers": failed_numbers
+                "campaign": {
+                    "id": str(campaign.id),
+                    "business_id": str(campaign.business.id),
+                    "type": campaign.campaign_type,
+                    "status": campaign.status,
+                    "total": campaign.total,
+                    "sent": campaign.sent,
+                    "failed": campaign.failed,
+                    "pending": pending,
+                    "percent": round(processed / campaign.total * 100, 1) if campaign.total else 0,
+                    "throughput_per_second": throughput,
+                    "recent_throughput_per_second": recent_throughput,
+                    "eta_seconds": eta,
+                    "created_at": campaign.created_at.isoformat() if campaign.created_at else None,
+                    "started_at": campaign.started_at.isoformat() if campaign.started_at else None,
+                    "finished_at": campaign.finished_at.isoformat() if campaign.finished_at else None,
+                    "error": campaign.error
+                }
             }
             
         except Exception as e:
-            logger.error(f"Error in promotional messaging: {str(e)}")
+            logger.error(f"Error getting campaign progress: {str(e)}")
             return {"error": str(e)}
     
+    @staticmethod
+    def _get_business(business_id, vendor_id=None):
+        """Load the business, checking vendor ownership when vendor_id is given"""
+        if vendor_id:
+            business = Business.objects(id=business_id, vendor=vendor_id).first()
+            if not business:
+                return {"error": "Business not found or access denied"}
+        else:
+            business = Business.objects(id=business_id).first()
+            if not business:
+                return {"error": "Business not found"}
+        return business
+    
+    @staticmethod
+    def _get_campaign(campaign_id, vendor_id=None):
+        """Load a campaign, checking vendor ownership when vendor_id is given"""
+        campaign = Campaign.objects(id=campaign_id).first()
+        if not campaign:
+            return {"error": "Campaign not found"}
+        if vendor_id and str(campaign.business.vendor.id) != str(vendor_id):
+            return {"error": "Campaign not found or access denied"}
+        return campaign
+    
+    @staticmethod
+    def _build_sender(campaign, business):
+        """Return send_one(recipient) for the campaign's message content"""
+        def send_one(recipient):
+            _, phone_number = recipient
+            if campaign.campaign_type == 'promotional' and campaign.buttons:
+                result = send_business_whatsapp_interactive_message(
+                    phone_number, campaign.header, campaign.body, campaign.footer, campaign.buttons, business
+                )
+            elif campaign.campaign_type == 'promotional':
+                message = f"{campaign.header}\n\n{campaign.body}\n\n{campaign.footer}"
+                result = send_business_whatsapp_text_message(phone_number, message, business)
+            else:
+                result = send_business_whatsapp_text_message(phone_number, campaign.message_text, business)
+            
+            if isinstance(result, dict) and result.get('error'):
+                raise RuntimeError(result['error'])
+            
+            messages = (result or {}).get('messages') or [{}]
+            return messages[0].get('id')
+        
+        return send_one
+    
+    @staticmethod
+    def _load_recipients(campaign):
+        """
+        Write every recipient once in bulk, then return the ones still pending
+        as (recipient_id, phone_number) tuples
+        """
+        if not campaign.recipients_loaded:
+            # Clear out a partial write left by an interrupted load
+            CampaignRecipient.objects(campaign=campaign.id).delete()
+            
+            customers = BulkMessagingService._get_filtered_customers(str(campaign.business.id), campaign.customer_filter)
+            phone_numbers = list(dict.fromkeys(c.phone_number for c in customers if c.phone_number))
+            
+            batch_size = 1000
+            for i in range(0, len(phone_numbers), batch_size):
+                CampaignRecipient.objects.insert(
+                    [CampaignRecipient(campaign=campaign.id, phone_number=phone) for phone in phone_numbers[i:i + batch_size]],
+                    load_bulk=False
+                )
+            
+            Campaign.objects(id=campaign.id).update_one(
+                set__recipients_loaded=True,
+                set__total=len(phone_numbers)
+            )
+        
+        pending = CampaignRecipient.objects(campaign=campaign.id, status='pending').only('id', 'phone_number').as_pymongo()
+        return [(recipient['_id'], recipient['phone_number']) for recipient in pending]
+    
+    @staticmethod
+    def _start_campaign(campaign, business):
+        """Hand the campaign to the bulk send engine, rate limited per phone number ID"""
+        campaign_id = str(campaign.id)
+        phone_id, _ = get_business_credentials(business)
+        
+        Campaign.objects(id=campaign.id).update_one(
+            set__status='running',
+            set__phone_id=phone_id,
+            set__started_at=campaign.started_at or datetime.utcnow(),
+            set__last_checkpoint_at=datetime.utcnow(),
+            set__finished_at=None,
+            set__error=None
+        )
+        
+        def on_result(recipient, message_id, error):
+            # Checkpoint every send so a crash never re-sends or loses recipients
+            recipient_id, _ = recipient
+            now = datetime.utcnow()
+            CampaignRecipient.objects(id=recipient_id).update_one(
+                set__status='failed' if error else 'sent',
+                set__whatsapp_message_id=message_id,
+                set__error=error[:500] if error else None,
+                set__sent_at=now,
+                inc__attempts=1
+            )
+            if error:
+                Campaign.objects(id=campaign.id).update_one(inc__failed=1, set__last_checkpoint_at=now)
+            else:
+                Campaign.objects(id=campaign.id).update_one(inc__sent=1, set__last_checkpoint_at=now)
+        
+        def on_complete(state):
+            Campaign.objects(id=campaign.id).update_one(
+                set__status='completed' if state['status'] == 'completed' else 'failed',
+                set__error=state.get('error'),
+                set__finished_at=datetime.utcnow()
+            )
+            BulkMessagingService._log_bulk_message(str(business.id), campaign.message_text or '', state['sent'], state['failed'])
+        
+        get_bulk_send_engine().start_campaign(
+            phone_id,
+            lambda: BulkMessagingService._load_recipients(campaign),
+            BulkMessagingService._build_sender(campaign, business),
+            on_result=on_result,
+            on_complete=on_complete,
+            campaign_id=campaign_id
+        )
+        logger.info(f"Started bulk message campaign {campaign_id} for business {business.name}")
+        
+        return {
+            "success": True,
+            "campaign_id": campaign_id,
+            "status": "running"
+        }
+    
     @staticmethod
     def _get_filtered_customers(business_id, customer_filter=None):
         """Get customers based on filter criteria using MongoEngine"""
@@ -369,6 +542,12 @@ def send_bulk_message(business_id, message, customer_filter=None, vendor_id=None
 def send_promotional_message(business_id, header, body, footer, buttons=None, customer_filter=None, vendor_id=None):
     return BulkMessagingService.send_promotional_message(business_id, header, body, footer, buttons, customer_filter, vendor_id)
 
+def resume_campaign(campaign_id, vendor_id=None):
+    return BulkMessagingService.resume_campaign(campaign_id, vendor_id)
+
+def get_campaign_progress(campaign_id, vendor_id=None):
+    return BulkMessagingService.get_campaign_progress(campaign_id, vendor_id)
+
 def import_customers_csv(business_id, csv_file_path, vendor_id=None):
     return BulkMessagingService.import_customers_from_csv(business_id, csv_file_path, vendor_id)
 
@@ -0,0 +1,247 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Concurrent bulk send engine
+# Campaigns run in a background thread and fan their sends out over a bounded
+# thread pool. Every send first takes a token from the bucket of the WhatsApp
+# phone number ID it is sent from, so a campaign never exceeds the throughput
+# Meta allows for that number. The bucket smooths sends within this process;
+# with WHATSAPP_SHARED_RATE_LIMIT (default on) every send also reserves a slot
+# in a per-second window counter in MongoDB (send_rate_windows), so all
+# gunicorn workers together stay under the rate of a phone number ID.
+
+# Messages per second per phone number ID for each Cloud API throughput tier
+THROUGHPUT_TIERS = {
+    'standard': 80,
+    'high': 1000
+}
+
+def get_send_rate():
+    """Messages per second allowed per phone number ID"""
+    if os.getenv('WHATSAPP_SEND_RATE'):
+        return float(os.getenv('WHATSAPP_SEND_RATE'))
+    tier = os.getenv('WHATSAPP_THROUGHPUT_TIER', 'standard').lower()
+    return THROUGHPUT_TIERS.get(tier, THROUGHPUT_TIERS['standard'])
+
+class TokenBucket:
+    """Thread-safe token bucket; acquire() blocks until a token is available"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, tokens=1):
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+def is_shared_rate_limit_enabled():
+    """Whether the send rate of a phone number ID is enforced across processes"""
+    return os.getenv('WHATSAPP_SHARED_RATE_LIMIT', 'true').lower() in ('1', 'true', 'yes')
+
+class SharedRateLimiter:
+    """
+    Per-second send window of a phone number ID shared by every process
+    Slots are reserved from MongoDB in blocks to keep round trips low; a
+    block is only valid during the second it was reserved for.
+    """
+
+    def __init__(self, phone_id, rate, block=None):
+        self.phone_id = phone_id
+        self.rate = int(rate)
+        self.block = max(1, int(block or self.rate // 10 or 1))
+        self.second = None
+        self.available = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        from models import SendRateWindow
+        while True:
+            with self.lock:
+                second = int(time.time())
+                if self.second != second:
+                    self.second, self.available = second, 0
+                if not self.available:
+                    count = SendRateWindow.reserve(self.phone_id, second, self.block)
+                    # Slots of the block that still fit under the rate
+                    self.available = max(0, min(self.block, self.rate - (count - self.block)))
+                if self.available:
+                    self.available -= 1
+                    return
+            # This second is used up across all processes
+            time.sleep(max(second + 1 - time.time(), 0.001))
+
+class RateLimiter:
+    """Local token bucket, plus the shared window when enabled"""
+
+    def __init__(self, phone_id, rate):
+        self.bucket = TokenBucket(rate)
+        self.shared = SharedRateLimiter(phone_id, rate) if is_shared_rate_limit_enabled() else None
+
+    def acquire(self):
+        self.bucket.acquire()
+        if self.shared:
+            try:
+                self.shared.acquire()
+            except Exception as e:
+                # Keep sending at the local rate rather than stalling the campaign
+                logger.error(f"Shared rate limit unavailable, using the local limit: {str(e)}")
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+def get_rate_limiter(phone_id):
+    """Rate limiter of a WhatsApp phone number ID"""
+    with _buckets_lock:
+        limiter = _buckets.get(phone_id)
+        if limiter is None:
+            limiter = RateLimiter(phone_id, get_send_rate())
+            _buckets[phone_id] = limiter
+        return limiter
+
+class BulkSendEngine:
+    """Runs bulk message campaigns in the background"""
+
+    def __init__(self, max_workers=16):
+        self.max_workers = max_workers
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._campaigns = {}
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix='bulk-send'
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def start_campaign(self, phone_id, load_recipients, send_one, on_result=None, on_complete=None, campaign_id=None):
+        """
+        Start a campaign in the background and return its ID immediately
+        load_recipients() returns the recipients to message,
+        send_one(recipient) sends a single message, returns the WhatsApp
+        message id and raises on failure,
+        on_result(recipient, message_id, error) checkpoints every send,
+        on_complete(campaign) is called with the final campaign state.
+        """
+        campaign_id = campaign_id or uuid.uuid4().hex
+        campaign = {
+            'id': campaign_id,
+            'status': 'queued',
+            'total': 0,
+            'sent': 0,
+            'failed': 0,
+            'started_at': datetime.utcnow(),
+            'finished_at': None
+        }
+        self._campaigns[campaign_id] = campaign
+
+        thread = threading.Thread(
+            target=self._run_campaign,
+            args=(campaign, phone_id, load_recipients, send_one, on_result, on_complete),
+            name=f"campaign-{campaign_id}",
+            daemon=True
+        )
+        thread.start()
+        return campaign_id
+
+    def get_campaign(self, campaign_id):
+        """State of a campaign this process is sending (finished ones are dropped; progress is read from the Campaign documents)"""
+        return self._campaigns.get(campaign_id)
+
+    def is_running(self, campaign_id):
+        """Whether this process is currently sending the campaign"""
+        campaign = self._campaigns.get(campaign_id)
+        return bool(campaign and campaign['status'] in ('queued', 'running'))
+
+    def _run_campaign(self, campaign, phone_id, load_recipients, send_one, on_result, on_complete):
+        lock = threading.Lock()
+        bucket = get_rate_limiter(phone_id)
+        # Bound the number of queued sends so memory stays flat for large lists
+        in_flight = threading.BoundedSemaphore(self.max_workers * 2)
+
+        def deliver(recipient):
+            message_id = None
+            error = None
+            try:
+                message_id = send_one(recipient)
+                with lock:
+                    campaign['sent'] += 1
+            except Exception as e:
+                error = str(e)
+                logger.error(f"Campaign {campaign['id']} failed to send to {recipient}: {error}")
+                with lock:
+                    campaign['failed'] += 1
+            finally:
+                in_flight.release()
+
+            if on_result:
+                try:
+                    on_result(recipient, message_id, error)
+                except Exception as e:
+                    logger.error(f"Error checkpointing campaign {campaign['id']}: {str(e)}")
+
+        try:
+            recipients = load_recipients()
+            campaign['total'] = len(recipients)
+            campaign['status'] = 'running'
+
+            futures = []
+            for recipient in recipients:
+                in_flight.acquire()
+                bucket.acquire()
+                futures.append(self.executor.submit(deliver, recipient))
+
+            for future in futures:
+                future.result()
+
+            campaign['status'] = 'completed'
+        except Exception as e:
+            logger.error(f"Campaign {campaign['id']} aborted: {str(e)}")
+            campaign['status'] = 'failed'
+            campaign['error'] = str(e)
+        finally:
+            campaign['finished_at'] = datetime.utcnow()
+            logger.info(f"Campaign {campaign['id']} finished: sent={campaign['sent']} failed={campaign['failed']} total={campaign['total']}")
+            if on_complete:
+                try:
+                    on_complete(campaign)
+                except Exception as e:
+                    logger.error(f"Error in campaign completion callback: {str(e)}")
+            self._campaigns.pop(campaign['id'], None)
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_bulk_send_engine():
+    """Process-wide bulk send engine"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = BulkSendEngine(max_workers=int(os.getenv('BULK_SEND_WORKERS', 16)))
+        return _engine
@@ -0,0 +1,108 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Business routing cache
+# Every inbound business webhook, GPT turn and business reply needs the same
+# few business fields (name, active flag, WhatsApp phone id and token). They
+# are cached per process for BUSINESS_CACHE_TTL seconds so the per-message hot
+# path does not go back to Mongo; edit_business and whatsapp_config drop the
+# entry as soon as a business is changed.
+
+class BusinessRoute:
+    """Routing record of a business"""
+
+    __slots__ = ('id', 'name', 'is_active', 'whatsapp_phone_id', 'whatsapp_api_token', 'business')
+
+    def __init__(self, business):
+        self.id = business.id
+        self.name = business.name
+        self.is_active = business.is_active
+        self.whatsapp_phone_id = business.whatsapp_phone_id
+        self.whatsapp_api_token = business.whatsapp_api_token
+        # The loaded document, for ORM references and GPT context; shared
+        # between threads, so it must not be modified or saved
+        self.business = business
+
+class BusinessCache:
+    """Per-process TTL/LRU cache of business routing records"""
+
+    def __init__(self, max_entries=1000, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # str(business_id) -> (BusinessRoute or None, expires_at)
+        self.entries = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def get(self, business_id):
+        """Routing record of a business, or None if it does not exist"""
+        key = str(business_id)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[1] > now:
+                self.entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry[0]
+            self.stats['misses'] += 1
+
+        from models import Business
+        business = Business.objects(id=business_id).first()
+        # Unknown ids are cached too, so a misconfigured webhook does not
+        # cost a query per delivery
+        route = BusinessRoute(business) if business else None
+
+        with self.lock:
+            self.entries[key] = (route, now + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return route
+
+    def invalidate(self, business_id):
+        with self.lock:
+            self.entries.pop(str(business_id), None)
+            self.stats['invalidations'] += 1
+
+    def get_metrics(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self.entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0
+        return stats
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_business_cache():
+    """Process-wide business cache configured from the environment"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = BusinessCache(
+                max_entries=int(os.getenv('BUSINESS_CACHE_MAX_ENTRIES', 1000)),
+                ttl=int(os.getenv('BUSINESS_CACHE_TTL', 60))
+            )
+        return _cache
+
+def get_business_route(business_id):
+    """Cached routing record of a business, or None"""
+    return get_business_cache().get(business_id)
+
+def get_cached_business(business_id):
+    """Cached (read-only) Business document, or None"""
+    route = get_business_route(business_id)
+    return route.business if route else None
+
+def invalidate_business_route(business_id):
+    """Drop a business from the cache after it was edited"""
+    try:
+        get_business_cache().invalidate(business_id)
+    except Exception as e:
+        logger.error(f"Error invalidating business cache for {business_id}: {str(e)}")
@@ -1,11 +1,14 @@
-import requests
 import os
 import logging
 from datetime import datetime
 from flask import jsonify, request
 from dotenv import load_dotenv
-from models import Customer, CustomerState, Order, OrderItem, OrderIssue, Business, Product, Category, ChatSession, ChatMessage
+from models import Customer, CustomerState, Order, OrderItem, OrderIssue, Business, ChatSession, ChatMessage
 from services.messaging_service import clean_phone_number
+from services.webhook_dispatcher import dispatch_webhook_batch
+from services.whatsapp_client import get_whatsapp_client, get_business_credentials
+from services.intent_engine import is_business_greeting
+from services.catalog_cache import get_catalog
 
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -14,19 +17,12 @@ def send_business_whatsapp_text_message(phone_number, message, business):
     """Send a text message using business-specific WhatsApp credentials"""
     try:
         # Use business credentials if available, fallback to global
-        access_token = business.whatsapp_api_token or os.getenv('WHATSAPP_ACCESS_TOKEN')
-        phone_id = business.whatsapp_phone_id or os.getenv('WHATSAPP_PHONE_ID')
+        phone_id, access_token = get_business_credentials(business)
         
         if not access_token or not phone_id:
             logger.error(f"Missing WhatsApp credentials for business {business.name}")
             return {"error": "WhatsApp not configured for this business"}
         
-        WHATSAPP_API_URL = f"https://graph.facebook.com/v17.0/{phone_id}/messages"
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json"
-        }
-        
         payload = {
             "messaging_product": "whatsapp",
             "to": phone_number,
@@ -34,7 +30,7 @@ def send_business_whatsapp_text_message(phone_number, message, business):
             "text": {"body": message}
         }
         
-        response = requests.post(WHATSAPP_API_URL, json=payload, headers=headers)
+        response = get_whatsapp_client().send_message(phone_id, access_token, payload)
         
         if response.status_code == 200:
             logger.info(f"WhatsApp message sent successfully to {phone_number}")
@@ -51,19 +47,12 @@ def send_business_whatsapp_interactive_message(phone_number, header, body, foote
     """Send an interactive WhatsApp message using business-specific credentials"""
     try:
         # Use business credentials if available, fallback to global
-        access_token = business.whatsapp_api_token or os.getenv('WHATSAPP_ACCESS_TOKEN')
-        phone_id = business.whatsapp_phone_id or os.getenv('WHATSAPP_PHONE_ID')
+        phone_id, access_token = get_business_credentials(business)
         
         if not access_token or not phone_id:
             logger.error(f"Missing WhatsApp credentials for business {business.name}")
             return {"error": "WhatsApp not configured for this business"}
         
-        WHATSAPP_API_URL = f"https://graph.facebook.com/v17.0/{phone_id}/messages"
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json"
-        }
-        
         # Set default values for empty strings
         header = header or "Message"
         body = body or "Please select an option"
@@ -125,7 +114,7 @@ def send_business_whatsapp_interactive_message(phone_number, header, body, foote
             }
         }
         
-        response = requests.post(WHATSAPP_API_URL, json=payload, headers=headers)
+        response = get_whatsapp_client().send_message(phone_id, access_token, payload)
         
         if response.status_code == 200:
             logger.info(f"WhatsApp interactive message sent successfully to {phone_number}")
@@ -142,19 +131,12 @@ def send_business_whatsapp_list_message(phone_number, header, body, footer, butt
     """Send an interactive WhatsApp list message using business-specific credentials"""
     try:
         # Use business credentials if available, fallback to global
-        access_token = business.whatsapp_api_token or os.getenv('WHATSAPP_ACCESS_TOKEN')
-        phone_id = business.whatsapp_phone_id or os.getenv('WHATSAPP_PHONE_ID')
+        phone_id, access_token = get_business_credentials(business)
         
         if not access_token or not phone_id:
             logger.error(f"Missing WhatsApp credentials for business {business.name}")
             return {"error": "WhatsApp not configured for this business"}
         
-        WHATSAPP_API_URL = f"https://graph.facebook.com/v17.0/{phone_id}/messages"
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json"
-        }
-        
         payload = {
             "messaging_product": "whatsapp",
             "to": phone_number,
@@ -178,7 +160,7 @@ def send_business_whatsapp_list_message(phone_number, header, body, footer, butt
             }
         }
         
-        response = requests.post(WHATSAPP_API_URL, json=payload, headers=headers)
+        response = get_whatsapp_client().send_message(phone_id, access_token, payload)
         
         if response.status_code == 200:
             logger.info(f"WhatsApp list message sent successfully to {phone_number}")
@@ -191,13 +173,12 @@ def send_business_whatsapp_list_message(phone_number, header, body, footer, butt
         logger.error(f"Error sending business WhatsApp list message: {str(e)}")
         return {"error": str(e)}
 
-def is_business_greeting(message):
-    """Check if the message is a greeting/trigger word"""
-    greeting_words = ['hello', 'hi', 'hey', 'start', 'menu', 'help', 'hola', 'hujambo', 'mambo']
-    return any(word.lower() in message.lower() for word in greeting_words)
-
-def process_business_whatsapp_message(data, business):
-    """Process WhatsApp messages for a specific business"""
+def process_business_whatsapp_message(data, business, raise_errors=False):
+    """
+    Process WhatsApp messages for a specific business
+    With raise_errors (queued webhooks) failures are raised so the queue can
+    retry them; otherwise they are logged and answered with a 500.
+    """
     try:
         logger.info(f"Processing business WhatsApp message for business: {business.name}")
         
@@ -209,76 +190,71 @@ def process_business_whatsapp_message(data, business):
         if 'entry' not in data:
             logger.warning("Webhook data missing 'entry' - might be a status update")
             return jsonify({"status": "ok"}), 200
-            
-        entry = data['entry'][0]
-        if 'changes' not in entry:
-            logger.warning("Webhook data missing 'changes' - might be a status update")
-            return jsonify({"status": "ok"}), 200
-            
-        changes = entry['changes'][0]
-        if 'value' not in changes:
-            logger.warning("Webhook data missing 'value' - might be a status update")
-            return jsonify({"status": "ok"}), 200
-            
-        value = changes['value']
         
-        # Handle status updates (delivery receipts, read receipts, etc.)
-        if 'statuses' in value:
-            logger.info("Received status update webhook")
-            return jsonify({"status": "ok"}), 200
-            
-        if 'messages' not in value:
-            logger.info("No messages in webhook data - might be a status update or other notification")
-            return jsonify({"status": "ok"}), 200
-            
-        messages = value['messages'][0]
-        phone_number = messages.get('from')
+        # Walk every entry/change/message in the batch; status updates
+        # (delivery receipts, read receipts, etc.) are only logged
+        summary = dispatch_webhook_batch(
+            data,
+            lambda messages: handle_business_webhook_message(messages, business),
+            handle_status=lambda status: logger.info(f"Business {business.name} - Message {status.get('id')} status: {status.get('status')}"),
+            business_key=str(business.id),
+            raise_errors=raise_errors
+        )
         
-        # Handle text messages
-        if 'text' in messages:
-            message = messages.get('text', {}).get('body', '')
-            if not phone_number or not message:
-                logger.error(f"Missing required fields: phone={phone_number}, message={message}")
+        logger.info(f"Business webhook batch processed for {business.name}: {summary}")
+        return jsonify({"status": "ok"}), 200
+        
+    except Exception as e:
+        logger.error(f"Error processing business WhatsApp webhook: {str(e)}")
+        if raise_errors:
+            raise
+        return jsonify({"error": "Internal server error"}), 500
+
+def handle_business_webhook_message(messages, business):
+    """Handle a single customer message sent to a business number"""
+    phone_number = messages.get('from')
+    
+    # Handle text messages
+    if 'text' in messages:
+        message = messages.get('text', {}).get('body', '')
+        if not phone_number or not message:
+            logger.error(f"Missing required fields: phone={phone_number}, message={message}")
+            return jsonify({"error": "Missing required fields"}), 400
+            
+        return handle_business_user_message({
+            'phone_number': phone_number,
+            'message': message,
+            'business': business
+        })
+    
+    # Handle button responses
+    elif 'interactive' in messages:
+        interactive = messages.get('interactive', {})
+        if 'button_reply' in interactive:
+            button_id = interactive['button_reply'].get('id')
+            if not phone_number or not button_id:
+                logger.error(f"Missing required fields: phone={phone_number}, button_id={button_id}")
                 return jsonify({"error": "Missing required fields"}), 400
                 
             return handle_business_user_message({
                 'phone_number': phone_number,
-                'message': message,
+                'button_id': button_id,
                 'business': business
             })
-        
-        # Handle button responses
-        elif 'interactive' in messages:
-            interactive = messages.get('interactive', {})
-            if 'button_reply' in interactive:
-                button_id = interactive['button_reply'].get('id')
-                if not phone_number or not button_id:
-                    logger.error(f"Missing required fields: phone={phone_number}, button_id={button_id}")
-                    return jsonify({"error": "Missing required fields"}), 400
-                    
-                return handle_business_user_message({
-                    'phone_number': phone_number,
-                    'button_id': button_id,
-                    'business': business
-                })
-            elif 'list_reply' in interactive:
-                list_id = interactive['list_reply'].get('id')
-                if not phone_number or not list_id:
-                    logger.error(f"Missing required fields: phone={phone_number}, list_id={list_id}")
-                    return jsonify({"error": "Missing required fields"}), 400
-                    
-                return handle_business_user_message({
-                    'phone_number': phone_number,
-                    'button_id': list_id,  # Use same parameter name for consistency
-                    'business': business
-                })
-        
-        logger.error("Unsupported message type")
-        return jsonify({"error": "Unsupported message type"}), 400
-        
-    except Exception as e:
-        logger.error(f"Error processing business WhatsApp webhook: {str(e)}")
-        return jsonify({"error": "Internal server error"}), 500
+        elif 'list_reply' in interactive:
+            list_id = interactive['list_reply'].get('id')
+            if not phone_number or not list_id:
+                logger.error(f"Missing required fields: phone={phone_number}, list_id={list_id}")
+                return jsonify({"error": "Missing required fields"}), 400
+                
+            return handle_business_user_message({
+                'phone_number': phone_number,
+                'button_id': list_id,  # Use same parameter name for consistency
+                'business': business
+            })
+    
+    logger.error("Unsupported message type")
+    return jsonify({"error": "Unsupported message type"}), 400
 
 def handle_business_user_message(data):
     """Handle incoming user messages for business-specific interactions"""
@@ -455,7 +431,7 @@ def send_browse_products_message(phone_number, business, customer):
 def send_all_products(phone_number, business, customer):
     """Send all active products for the business"""
     try:
-        products = Product.objects(business=business, is_active=True)
+        products = get_catalog(business.id).products
         
         if not products:
             return send_business_whatsapp_text_message(
@@ -507,7 +483,7 @@ def send_all_products(phone_number, business, customer):
 def send_categories_menu(phone_number, business, customer):
     """Send interactive menu of categories"""
     try:
-        categories = Category.objects(business=business)
+        categories = get_catalog(business.id).categories
         
         if not categories:
             return send_business_whatsapp_text_message(
@@ -880,8 +856,8 @@ def handle_customer_data_input(phone_number, message, business, customer, custom
 def send_category_products(phone_number, business, customer, category_id):
     """Send products for a specific category"""
     try:
-        from bson import ObjectId
-        category = Category.objects(id=ObjectId(category_id), business=business).first()
+        catalog = get_catalog(business.id)
+        category = catalog.get_category(category_id)
         
         if not category:
             return send_business_whatsapp_text_message(
@@ -890,7 +866,7 @@ def send_category_products(phone_number, business, customer, category_id):
                 business
             )
         
-        products = Product.objects(category=category, business=business, is_active=True)
+        products = catalog.get_category_products(category.id)
         
         if not products:
             return send_business_whatsapp_text_message(
@@ -932,18 +908,8 @@ def send_category_products(phone_number, business, customer, category_id):
 def save_chat_message(customer, business, sender_type, message_text, message_type='text'):
     """Save a chat message to the database"""
     try:
-        # Get or create chat session
+        # Add message, creating the chat session if needed
         session_id = f"{customer.id}_{business.id}"
-        chat_session = ChatSession.objects(session_id=session_id).first()
-        
-        if not chat_session:
-            chat_session = ChatSession(
-                customer=customer,
-                business=business,
-                session_id=session_id
-            )
-        
-        # Add message
         message = ChatMessage(
             sender_type=sender_type,
             message_text=message_text,
@@ -951,8 +917,7 @@ def save_chat_message(customer, business, sender_type, message_text, message_typ
             timestamp=datetime.utcnow()
         )
         
-        chat_session.messages.append(message)
-        chat_session.save()
+        ChatSession.append_messages(session_id, [message], customer=customer, business=business)
         
     except Exception as e:
         logger.error(f"Error saving chat message: {str(e)}")
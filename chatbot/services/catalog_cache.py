@@ -0,0 +1,240 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from bson import ObjectId
+
+logger = logging.getLogger(__name__)
+
+# Per-business catalog snapshots
+# The chat flows read the same categories, products and variations of a
+# business over and over. A snapshot holds all of them, indexed for every
+# lookup the flows make, and is rebuilt only when the business's catalog
+# version changes. Product/Category save and delete bump the version in this
+# process and a counter in Mongo that other workers check every
+# CATALOG_VERSION_CHECK_INTERVAL seconds. With CATALOG_SHARED_VERSION=false
+# the counter is skipped and other workers see a change (prices included)
+# only once their snapshot is CATALOG_CACHE_TTL seconds old.
+#
+# Snapshot documents are shared between threads and must be treated as
+# read-only; load a fresh document before modifying and saving it.
+
+def is_shared_version_enabled():
+    """Whether catalog changes are propagated to other workers through Mongo"""
+    return os.getenv('CATALOG_SHARED_VERSION', 'true').lower() in ('1', 'true', 'yes')
+
+class CatalogSnapshot:
+    """Categories, products and variations of one business at one catalog version"""
+
+    def __init__(self, business_id, version, categories, products):
+        self.business_id = business_id
+        self.version = version
+        self.built_at = time.monotonic()
+        self.checked_at = self.built_at
+
+        self.categories = categories
+        self.categories_by_id = {str(category.id): category for category in categories}
+
+        # Identifies the catalog content for caches keyed on it (e.g. GPT
+        # replies): the local and shared versions, bumped by every Product and
+        # Category save and delete. Without the shared version another
+        # worker's change is only picked up by a rebuild, so every rebuild
+        # counts as a new version.
+        if is_shared_version_enabled():
+            self.content_version = f"{version[0]}:{version[1]}"
+        else:
+            self.content_version = f"{version[0]}:built-{self.built_at}"
+
+        self.products_by_pk = {}
+        self.products_by_product_id = {}
+        self.variations = {}
+        self.products = []
+        self.products_by_category = {}
+        for product in products:
+            # Resolve the category from the snapshot instead of a dereference per product
+            category_ref = product.category
+            category = self.categories_by_id.get(str(getattr(category_ref, 'id', category_ref))) if category_ref else None
+            product.category = category
+
+            self.products_by_pk[str(product.id)] = product
+            self.products_by_product_id[product.product_id] = product
+            for variation in product.variations:
+                self.variations[variation.variation_id] = (product, variation)
+
+            if product.is_active:
+                self.products.append(product)
+                if category:
+                    self.products_by_category.setdefault(str(category.id), []).append(product)
+
+    def owner_keys(self):
+        """(kind, id) keys of everything in the snapshot, see CatalogCache.owner"""
+        return ([('category', key) for key in self.categories_by_id] +
+                [('product', key) for key in self.products_by_pk] +
+                [('variation', key) for key in self.variations])
+
+    def get_category(self, category_id):
+        return self.categories_by_id.get(str(category_id))
+
+    def get_product(self, pk):
+        """Product by its document id"""
+        return self.products_by_pk.get(str(pk))
+
+    def get_product_by_product_id(self, product_id):
+        """Product by its public product ID"""
+        return self.products_by_product_id.get(product_id)
+
+    def get_variation(self, variation_id):
+        """(product, variation) for a variation ID, or (None, None)"""
+        return self.variations.get(variation_id, (None, None))
+
+    def get_category_products(self, category_id):
+        """Active products of a category"""
+        return self.products_by_category.get(str(category_id), [])
+
+class CatalogCache:
+    """Process-wide LRU of catalog snapshots"""
+
+    def __init__(self, max_businesses=500, ttl=300, check_interval=2):
+        self.max_businesses = max_businesses
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.snapshots = OrderedDict()
+        self.versions = {}
+        # Which business owns a category/product/variation, for lookups that
+        # only carry an id
+        self.owners = {}
+        self.stats = {'hits': 0, 'builds': 0, 'invalidations': 0}
+
+    def _forget(self, snapshot):
+        """Drop the owner entries of a snapshot leaving the cache (lock held)"""
+        for key in snapshot.owner_keys():
+            if self.owners.get(key) == snapshot.business_id:
+                del self.owners[key]
+
+    def _local_version(self, business_id):
+        return self.versions.get(business_id, 0)
+
+    def _is_fresh(self, snapshot):
+        now = time.monotonic()
+        if now - snapshot.built_at > self.ttl:
+            return False
+        if snapshot.version[0] != self._local_version(snapshot.business_id):
+            return False
+        if is_shared_version_enabled() and now - snapshot.checked_at >= self.check_interval:
+            from models import CatalogVersion
+            if CatalogVersion.get_version(snapshot.business_id) != snapshot.version[1]:
+                return False
+            snapshot.checked_at = now
+        return True
+
+    def get(self, business_id):
+        """Current snapshot of a business's catalog, built on first use"""
+        business_id = ObjectId(str(getattr(business_id, 'id', business_id)))
+        with self.lock:
+            snapshot = self.snapshots.get(business_id)
+        if snapshot and self._is_fresh(snapshot):
+            with self.lock:
+                if business_id in self.snapshots:
+                    self.snapshots.move_to_end(business_id)
+                self.stats['hits'] += 1
+            return snapshot
+        return self._build(business_id)
+
+    def _build(self, business_id):
+        from models import Category, Product, CatalogVersion
+
+        local_version = self._local_version(business_id)
+        shared_version = CatalogVersion.get_version(business_id) if is_shared_version_enabled() else 0
+        categories = list(Category.objects(business=business_id))
+        products = list(Product.objects(business=business_id).no_dereference())
+        snapshot = CatalogSnapshot(business_id, (local_version, shared_version), categories, products)
+
+        with self.lock:
+            previous = self.snapshots.pop(business_id, None)
+            if previous:
+                self._forget(previous)
+            self.snapshots[business_id] = snapshot
+            while len(self.snapshots) > self.max_businesses:
+                _, evicted = self.snapshots.popitem(last=False)
+                self._forget(evicted)
+            for key in snapshot.owner_keys():
+                self.owners[key] = business_id
+            self.stats['builds'] += 1
+
+        logger.info(f"Built catalog snapshot for business {business_id}: {len(categories)} categories, {len(products)} products")
+        return snapshot
+
+    def invalidate(self, business_id):
+        business_id = ObjectId(str(business_id))
+        with self.lock:
+            self.versions[business_id] = self._local_version(business_id) + 1
+            snapshot = self.snapshots.pop(business_id, None)
+            if snapshot:
+                self._forget(snapshot)
+            self.stats['invalidations'] += 1
+
+    def owner(self, kind, key):
+        with self.lock:
+            return self.owners.get((kind, str(key)))
+
+    def get_metrics(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['businesses'] = len(self.snapshots)
+        lookups = stats['hits'] + stats['builds']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0
+        return stats
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_catalog_cache():
+    """Process-wide catalog cache configured from the environment"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CatalogCache(
+                max_businesses=int(os.getenv('CATALOG_CACHE_MAX_BUSINESSES', 500)),
+                ttl=int(os.getenv('CATALOG_CACHE_TTL', 300)),
+                check_interval=float(os.getenv('CATALOG_VERSION_CHECK_INTERVAL', 2))
+            )
+        return _cache
+
+def get_catalog(business_id):
+    """Catalog snapshot of a business"""
+    return get_catalog_cache().get(business_id)
+
+def invalidate_catalog(business_id):
+    """Mark a business's catalog as changed (called on Product/Category save and delete)"""
+    if not business_id:
+        return
+    try:
+        get_catalog_cache().invalidate(business_id)
+        if is_shared_version_enabled():
+            from models import CatalogVersion
+            CatalogVersion.bump(ObjectId(str(business_id)))
+    except Exception as e:
+        logger.error(f"Error invalidating catalog cache for business {business_id}: {str(e)}")
+
+def _catalog_for(kind, key, find_business):
+    """Snapshot of the business owning a category/product/variation"""
+    business_id = get_catalog_cache().owner(kind, key)
+    if business_id is None:
+        business_id = find_business()
+        if business_id is None:
+            return None
+    return get_catalog(business_id)
+
+def get_catalog_for_category(category_id):
+    from models import Category
+    return _catalog_for('category', category_id, lambda: Category.objects(id=category_id).scalar('business').no_dereference().first())
+
+def get_catalog_for_product(product_pk):
+    from models import Product
+    return _catalog_for('product', product_pk, lambda: Product.objects(id=product_pk).scalar('business').no_dereference().first())
+
+def get_catalog_for_variation(variation_id):
+    from models import Product
+    return _catalog_for('variation', variation_id, lambda: Product.objects(variations__variation_id=variation_id).scalar('business').no_dereference().first())
@@ -0,0 +1,235 @@
+import logging
+from bson import ObjectId
+from models import ChatSession, ChatMessage, ChatMessageBucket
+
+logger = logging.getLogger(__name__)
+
+# Bucketed chat message storage
+# Messages live in chat_message_buckets, one document per chunk of up to
+# CHAT_BUCKET_SIZE messages of a session, written by ChatSession.append_messages
+# with atomic $push updates. This module holds the read side.
+#
+# Sessions created before buckets existed keep their whole history inline
+# (messages_bucketed unset, no message_count) until `flask
+# migrate-chat-messages` or their next append moves it; the readers fall back
+# to the inline list for them.
+
+# Filter of sessions whose history is still inline
+UNMIGRATED = {'messages_bucketed': {'$ne': True}}
+
+# A session's message count in an aggregation, for unmigrated sessions too
+MESSAGE_COUNT = {'$cond': [
+    {'$eq': ['$messages_bucketed', True]},
+    {'$ifNull': ['$message_count', 0]},
+    {'$size': {'$ifNull': ['$messages', []]}}
+]}
+
+def get_messages(session, limit=None):
+    """
+    Messages of a session in chronological order
+    With limit only the newest `limit` messages are returned, reading just
+    as many buckets as needed.
+    """
+    collected = []
+    buckets = ChatMessageBucket.objects(session=session.pk).order_by('-first_message_at', '-id')
+    for bucket in buckets:
+        collected = list(bucket.messages) + collected
+        if limit and len(collected) >= limit:
+            break
+
+    # Sessions that have not been migrated yet still hold older messages inline
+    legacy = _legacy_messages(session, collected)
+    if legacy:
+        collected = legacy + collected
+
+    if limit:
+        collected = collected[-limit:]
+    return collected
+
+def _legacy_messages(session, bucket_messages):
+    """Inline messages that predate the session's bucketed messages"""
+    inline = getattr(session, 'messages', None) or []
+    if not inline:
+        return []
+    if not bucket_messages:
+        return list(inline)
+    first_bucketed = bucket_messages[0].timestamp
+    return [m for m in inline if not first_bucketed or not m.timestamp or m.timestamp < first_bucketed]
+
+class ConversationHistory:
+    """
+    The last `limit` messages of a session, shaped for the OpenAI chat API
+    Only sender_type and message_text are read, from the session's inline
+    tail ($slice) when it holds enough messages, otherwise from the newest
+    buckets, so the cost is O(limit) rather than O(session length).
+    The history is loaded at most once per instance, so create one per
+    conversation turn and pass it around.
+    """
+
+    ROLES = {'customer': 'user', 'gpt': 'assistant'}
+
+    def __init__(self, session_id, limit=20):
+        self.session_id = session_id
+        self.limit = limit
+        self._messages = None
+
+    @property
+    def messages(self):
+        """[{'sender_type': ..., 'message_text': ...}, ...] oldest first"""
+        if self._messages is None:
+            self._messages = self._load()
+        return self._messages
+
+    def _load(self):
+        if not self.limit:
+            return []
+
+        # Project the inline tail down to the newest `limit` messages and
+        # the two fields the prompt needs
+        pipeline = [
+            {'$project': {
+                'message_count': 1,
+                'messages_bucketed': 1,
+                'messages': _project_messages({'$slice': [{'$ifNull': ['$messages', []]}, -self.limit]})
+            }}
+        ]
+        rows = list(ChatSession.objects(session_id=self.session_id).aggregate(pipeline))
+        if not rows:
+            return []
+        session = rows[0]
+        tail = session.get('messages') or []
+
+        if not session.get('messages_bucketed'):
+            # Unmigrated session: its older history is still inline
+            legacy = get_messages(ChatSession.objects(id=session['_id']).only('id', 'messages').first(), limit=self.limit)
+            return [{'sender_type': m.sender_type, 'message_text': m.message_text} for m in legacy]
+
+        if len(tail) >= self.limit or len(tail) >= (session.get('message_count') or 0):
+            return tail
+
+        # The inline tail is shorter than the limit (CHAT_SESSION_RECENT_MESSAGES
+        # below it): read the newest buckets instead
+        collected = []
+        bucket_pipeline = [
+            {'$match': {'session': session['_id']}},
+            {'$sort': {'first_message_at': -1, '_id': -1}},
+            {'$project': {'messages': _project_messages({'$slice': ['$messages', -self.limit]})}}
+        ]
+        for bucket in ChatMessageBucket.objects.aggregate(bucket_pipeline):
+            collected = (bucket.get('messages') or []) + collected
+            if len(collected) >= self.limit:
+                break
+
+        return collected[-self.limit:]
+
+    def to_openai_messages(self, system_prompt=None, current_message=None):
+        """
+        OpenAI messages list: the system prompt, then the history
+        current_message is appended as the user turn unless it is already the
+        last message in the history.
+        """
+        openai_messages = []
+        if system_prompt:
+            openai_messages.append({"role": "system", "content": system_prompt})
+
+        for message in self.messages:
+            role = self.ROLES.get(message.get('sender_type'))
+            if role:
+                openai_messages.append({"role": role, "content": message.get('message_text')})
+
+        if current_message is not None and (
+                not self.messages or self.messages[-1].get('message_text') != current_message):
+            openai_messages.append({"role": "user", "content": current_message})
+        return openai_messages
+
+def _project_messages(source):
+    """$map expression keeping only the fields a prompt needs"""
+    return {'$map': {
+        'input': source,
+        'as': 'message',
+        'in': {'sender_type': '$$message.sender_type', 'message_text': '$$message.message_text'}
+    }}
+
+def get_recent_messages_for_sessions(session_ids, per_session=5):
+    """
+    Latest messages of several sessions with a single query
+    Returns {str(session_id): [ChatMessage, ...]} read from each session's
+    newest bucket, or from the inline history of unmigrated sessions (one
+    more query while any are on the page).
+    """
+    if not session_ids:
+        return {}
+
+    pipeline = [
+        {'$match': {'session': {'$in': list(session_ids)}}},
+        {'$sort': {'first_message_at': -1}},
+        {'$group': {'_id': '$session', 'messages': {'$first': {'$slice': ['$messages', -per_session]}}}}
+    ]
+
+    recent = {}
+    for row in ChatMessageBucket.objects.aggregate(pipeline):
+        recent[str(row['_id'])] = [ChatMessage._from_son(message) for message in row['messages']]
+
+    missing = [session_id for session_id in session_ids if str(session_id) not in recent]
+    if missing:
+        query = dict(UNMIGRATED, _id={'$in': missing})
+        for row in ChatSession._get_collection().find(query, {'messages': {'$slice': -per_session}}):
+            recent[str(row['_id'])] = [ChatMessage._from_son(message) for message in row.get('messages') or []]
+    return recent
+
+def fill_unmigrated_summaries(sessions):
+    """
+    Set message_count and last_message of unmigrated sessions loaded without
+    their messages; both are only maintained once a session is bucketed
+    """
+    by_id = {session.pk: session for session in sessions}
+    if not by_id:
+        return
+    for row in ChatSession._get_collection().aggregate([
+        {'$match': dict(UNMIGRATED, _id={'$in': list(by_id)})},
+        {'$project': {'message_count': MESSAGE_COUNT, 'last_message': {'$arrayElemAt': ['$messages', -1]}}}
+    ]):
+        session = by_id[row['_id']]
+        session.message_count = row['message_count']
+        if row.get('last_message'):
+            session.last_message = ChatMessage._from_son(row['last_message'])
+
+def _count_since(since):
+    """Expression counting a document's messages sent since a date"""
+    return {'$size': {'$filter': {
+        'input': {'$ifNull': ['$messages', []]},
+        'as': 'message',
+        'cond': {'$gte': ['$$message.timestamp', since]}
+    }}}
+
+def count_business_messages(business_id, since=None):
+    """Number of messages a business has exchanged (buckets and unmigrated sessions), optionally since a date"""
+    business_id = ObjectId(str(business_id))
+    if since is None:
+        pipeline = [
+            {'$match': {'business': business_id}},
+            {'$group': {'_id': None, 'total': {'$sum': '$count'}}}
+        ]
+        inline = {'$size': {'$ifNull': ['$messages', []]}}
+    else:
+        pipeline = [
+            {'$match': {'business': business_id, 'last_message_at': {'$gte': since}}},
+            {'$project': {'recent': _count_since(since)}},
+            {'$group': {'_id': None, 'total': {'$sum': '$recent'}}}
+        ]
+        inline = _count_since(since)
+
+    total = 0
+    for result in (
+        ChatMessageBucket.objects.aggregate(pipeline),
+        ChatSession.objects.aggregate([
+            {'$match': dict(UNMIGRATED, business=business_id)},
+            {'$group': {'_id': None, 'total': {'$sum': inline}}}
+        ])
+    ):
+        total += sum(row['total'] for row in result)
+    return total
+
+def migrate_session(session_id):
+    """Move a session's inline messages into buckets, returns the number moved"""
+    return ChatSession.bucket_inline_messages(session_id)
@@ -0,0 +1,332 @@
+import os
+import logging
+from datetime import datetime
+from collections import Counter
+from bson import ObjectId
+
+logger = logging.getLogger(__name__)
+
+# Daily business rollups
+# daily_business_stats holds one row per business per UTC day with the
+# orders created that day (by current status and payment status, with their
+# revenue) and the day's chat activity (first-time customers and new sessions,
+# both on the day of their first message, and messages). Order.save and ChatSession.append_messages keep the rows up to
+# date with $inc updates; `flask rebuild-daily-stats` recomputes them from the
+# raw collections. With ANALYTICS_USE_ROLLUPS enabled the dashboards read
+# O(days) rollup rows instead of scanning orders and sessions.
+
+ORDER_STATUSES = ['pending', 'paid', 'processing', 'completed', 'delivered', 'cancelled']
+PAYMENT_STATUSES = ['pending', 'paid', 'failed']
+
+def is_rollups_enabled():
+    """Whether dashboards read the daily rollups instead of the raw collections"""
+    return os.getenv('ANALYTICS_USE_ROLLUPS', 'false').lower() in ('1', 'true', 'yes')
+
+def day_of(moment):
+    """Midnight UTC of the day a datetime falls on"""
+    return datetime(moment.year, moment.month, moment.day)
+
+def _order_figures(order, sign=1):
+    """Rollup increments contributed by one order (raw document fields)"""
+    status = order.get('status') or 'pending'
+    payment_status = order.get('payment_status') or 'pending'
+    amount = float(order.get('total_amount') or 0)
+    figures = {
+        'orders': sign,
+        f"orders_by_status.{status}": sign,
+        f"orders_by_payment_status.{payment_status}": sign,
+        f"revenue_by_status.{status}": sign * amount
+    }
+    if payment_status == 'paid':
+        figures['paid_orders'] = sign
+        figures['paid_revenue'] = sign * amount
+    return figures
+
+def record_order_change(business_id, created_at, previous, current):
+    """
+    Apply an order to the rollup of the day it was created
+    previous is the stored order before the change (None for a new order);
+    its figures are taken back out before the current ones are added.
+    """
+    if not business_id:
+        return
+    try:
+        from models import DailyBusinessStats
+
+        inc = Counter(_order_figures(current))
+        if previous:
+            inc.update(_order_figures(previous, sign=-1))
+        DailyBusinessStats.increment(business_id, day_of(created_at or datetime.utcnow()), dict(inc))
+    except Exception as e:
+        logger.error(f"Error updating daily stats for order of business {business_id}: {str(e)}")
+
+def record_chat_activity(session, messages, new_session=False):
+    """
+    Count appended chat messages in the daily rollups
+    session is the raw session document (_id, business, customer). On a
+    session's first messages the session is counted too, and the customer if
+    they have no earlier session with the business.
+    """
+    business_id = session.get('business')
+    if not business_id or not messages:
+        return
+    try:
+        from models import DailyBusinessStats, ChatSession
+
+        now = datetime.utcnow()
+        per_day = Counter(day_of(message.timestamp or now) for message in messages)
+        first_day = day_of(messages[0].timestamp or now)
+        new_customer = new_session and not ChatSession._get_collection().find_one(
+            {'customer': session.get('customer'), 'business': business_id, '_id': {'$ne': session['_id']}},
+            {'_id': 1}
+        )
+        for day, count in per_day.items():
+            inc = {'messages': count}
+            if new_session and day == first_day:
+                inc['sessions'] = 1
+                inc['new_customers'] = 1 if new_customer else 0
+            DailyBusinessStats.increment(business_id, day, inc)
+    except Exception as e:
+        logger.error(f"Error updating daily chat stats for business {business_id}: {str(e)}")
+
+def _day_expression(field):
+    return {'$dateFromParts': {
+        'year': {'$year': field},
+        'month': {'$month': field},
+        'day': {'$dayOfMonth': field}
+    }}
+
+def rebuild_daily_stats(business_id=None, since=None, batch_size=1000):
+    """
+    Recompute the rollups from orders and chat message buckets (and the
+    inline history of sessions not migrated to buckets yet)
+    Sessions and new customers are counted on the day of their first message,
+    like the live updates. Limited to one business and/or to the days from
+    `since` when given.
+    Rows in the range are replaced; increments landing while the rebuild runs
+    may be overwritten, so re-run for the current day if writes were live.
+    Returns the number of rows written.
+    """
+    from pymongo import UpdateOne
+    from models import DailyBusinessStats, Order, ChatSession, ChatMessageBucket
+
+    scope = {'business': ObjectId(str(business_id))} if business_id else {}
+    since_day = day_of(since) if since else None
+    rows = {}
+
+    def row(business, date):
+        key = (business, date)
+        if key not in rows:
+            rows[key] = {
+                'orders': 0, 'orders_by_status': {}, 'orders_by_payment_status': {}, 'revenue_by_status': {},
+                'paid_orders': 0, 'paid_revenue': 0.0, 'new_customers': 0, 'sessions': 0, 'messages': 0
+            }
+        return rows[key]
+
+    # Orders by day of creation, status and payment status
+    order_match = dict(scope)
+    if since_day:
+        order_match['created_at'] = {'$gte': since_day}
+    for group in Order.objects.aggregate([
+        {'$match': order_match},
+        {'$group': {
+            '_id': {
+                'business': '$business',
+                'date': _day_expression('$created_at'),
+                'status': '$status',
+                'payment_status': '$payment_status'
+            },
+            'orders': {'$sum': 1},
+            'revenue': {'$sum': {'$ifNull': ['$total_amount', 0]}}
+        }}
+    ]):
+        key = group['_id']
+        if not key.get('business') or not key.get('date'):
+            continue
+        stats = row(key['business'], key['date'])
+        status = key.get('status') or 'pending'
+        payment_status = key.get('payment_status') or 'pending'
+        stats['orders'] += group['orders']
+        stats['orders_by_status'][status] = stats['orders_by_status'].get(status, 0) + group['orders']
+        stats['orders_by_payment_status'][payment_status] = stats['orders_by_payment_status'].get(payment_status, 0) + group['orders']
+        stats['revenue_by_status'][status] = stats['revenue_by_status'].get(status, 0) + group['revenue']
+        if payment_status == 'paid':
+            stats['paid_orders'] += group['orders']
+            stats['paid_revenue'] += group['revenue']
+
+    def with_inline(match):
+        """
+        Buckets matching `match`, plus the sessions not migrated to buckets
+        yet, shaped like a bucket of their inline messages
+        """
+        return [
+            {'$match': match},
+            {'$unionWith': {'coll': ChatSession._get_collection_name(), 'pipeline': [
+                {'$match': dict(scope, messages_bucketed={'$ne': True})},
+                {'$project': {
+                    'session': '$_id',
+                    'business': 1,
+                    'messages': 1,
+                    'first_message_at': {'$min': '$messages.timestamp'},
+                    'last_message_at': {'$max': '$messages.timestamp'}
+                }},
+                {'$match': match}
+            ]}}
+        ]
+
+    # Sessions on the day of their first message, as record_chat_activity
+    # counts them (sessions without messages are not counted)
+    session_starts = with_inline(scope) + [
+        {'$group': {'_id': '$session', 'business': {'$first': '$business'}, 'first': {'$min': '$first_message_at'}}},
+        {'$match': {'first': {'$ne': None}}}
+    ]
+    since_first = [{'$match': {'first': {'$gte': since_day}}}] if since_day else []
+    for group in ChatMessageBucket.objects.aggregate(session_starts + since_first + [
+        {'$group': {'_id': {'business': '$business', 'date': _day_expression('$first')}, 'sessions': {'$sum': 1}}}
+    ], allowDiskUse=True):
+        key = group['_id']
+        if key.get('business') and key.get('date'):
+            row(key['business'], key['date'])['sessions'] += group['sessions']
+
+    # Customers on the day of their first message to the business
+    for group in ChatMessageBucket.objects.aggregate(session_starts + [
+        {'$lookup': {'from': ChatSession._get_collection_name(), 'localField': '_id', 'foreignField': '_id', 'as': 'session'}},
+        {'$group': {
+            '_id': {'business': '$business', 'customer': {'$arrayElemAt': ['$session.customer', 0]}},
+            'first': {'$min': '$first'}
+        }}
+    ] + since_first + [
+        {'$group': {'_id': {'business': '$_id.business', 'date': _day_expression('$first')}, 'customers': {'$sum': 1}}}
+    ], allowDiskUse=True):
+        key = group['_id']
+        if key.get('business') and key.get('date'):
+            row(key['business'], key['date'])['new_customers'] += group['customers']
+
+    # Messages by day sent, from the message buckets
+    bucket_match = dict(scope)
+    if since_day:
+        bucket_match['last_message_at'] = {'$gte': since_day}
+    message_pipeline = with_inline(bucket_match)
+    message_pipeline.append({'$unwind': '$messages'})
+    if since_day:
+        message_pipeline.append({'$match': {'messages.timestamp': {'$gte': since_day}}})
+    message_pipeline.append({'$group': {
+        '_id': {'business': '$business', 'date': _day_expression('$messages.timestamp')},
+        'messages': {'$sum': 1}
+    }})
+    for group in ChatMessageBucket.objects.aggregate(message_pipeline, allowDiskUse=True):
+        key = group['_id']
+        if key.get('business') and key.get('date'):
+            row(key['business'], key['date'])['messages'] += group['messages']
+
+    # Replace the rows of the rebuilt range
+    collection = DailyBusinessStats._get_collection()
+    stale = dict(scope)
+    if since_day:
+        stale['date'] = {'$gte': since_day}
+    collection.delete_many(stale)
+
+    now = datetime.utcnow()
+    operations = []
+    written = 0
+    for (business, date), stats in rows.items():
+        stats['updated_at'] = now
+        operations.append(UpdateOne({'business': business, 'date': date}, {'$set': stats}, upsert=True))
+        if len(operations) >= batch_size:
+            collection.bulk_write(operations, ordered=False)
+            written += len(operations)
+            operations = []
+    if operations:
+        collection.bulk_write(operations, ordered=False)
+        written += len(operations)
+
+    logger.info(f"Rebuilt {written} daily stats rows" + (f" for business {business_id}" if business_id else ""))
+    return written
+
+def _rollup_match(match, start=None, end=None):
+    """A business scope filter (as used on orders/sessions) restricted to a day range"""
+    match = dict(match or {})
+    if start or end:
+        match['date'] = {}
+        if start:
+            match['date']['$gte'] = day_of(start)
+        if end:
+            match['date']['$lte'] = day_of(end)
+    return match
+
+def get_order_figures(match, start_date, by_business=False):
+    """
+    Order figures of a scope from the rollups, shaped like
+    AnalyticsService._get_order_facets. Recent figures count whole days from
+    the day of start_date.
+    """
+    from models import DailyBusinessStats
+
+    recent = {'$gte': ['$date', day_of(start_date)]}
+    totals = {
+        '_id': None,
+        'total_orders': {'$sum': '$orders'},
+        'recent_orders': {'$sum': {'$cond': [recent, '$orders', 0]}},
+        'paid_orders': {'$sum': '$paid_orders'},
+        'total_revenue': {'$sum': '$paid_revenue'},
+        'recent_revenue': {'$sum': {'$cond': [recent, '$paid_revenue', 0]}}
+    }
+    for status in ORDER_STATUSES:
+        totals[f"status_{status}"] = {'$sum': {'$ifNull': [f"$orders_by_status.{status}", 0]}}
+    for payment_status in PAYMENT_STATUSES:
+        totals[f"payment_{payment_status}"] = {'$sum': {'$ifNull': [f"$orders_by_payment_status.{payment_status}", 0]}}
+    facets = {'totals': [{'$group': totals}]}
+    if by_business:
+        facets['by_business'] = [{'$group': {
+            '_id': '$business',
+            'orders': {'$sum': '$orders'},
+            'revenue': {'$sum': '$paid_revenue'}
+        }}]
+
+    result = list(DailyBusinessStats.objects.aggregate([{'$match': _rollup_match(match)}, {'$facet': facets}]))
+    result = result[0] if result else {}
+    row = (result.get('totals') or [{}])[0]
+
+    figures = {
+        'total_orders': int(row.get('total_orders', 0)),
+        'recent_orders': int(row.get('recent_orders', 0)),
+        'paid_orders': int(row.get('paid_orders', 0)),
+        'total_revenue': float(row.get('total_revenue', 0)),
+        'recent_revenue': float(row.get('recent_revenue', 0)),
+        'status_breakdown': {status: int(row.get(f"status_{status}", 0)) for status in ORDER_STATUSES},
+        'payment_status_breakdown': {status: int(row.get(f"payment_{status}", 0)) for status in PAYMENT_STATUSES}
+    }
+    if by_business:
+        figures['by_business'] = {
+            str(group['_id']): {'orders': group['orders'], 'revenue': group['revenue']}
+            for group in result.get('by_business', [])
+        }
+    return figures
+
+def get_chat_counts(match, start_date):
+    """Total and recent session and message counts of a scope from the rollups"""
+    from models import DailyBusinessStats
+
+    recent = {'$gte': ['$date', day_of(start_date)]}
+    result = list(DailyBusinessStats.objects.aggregate([
+        {'$match': _rollup_match(match)},
+        {'$group': {
+            '_id': None,
+            'sessions': {'$sum': '$sessions'},
+            'recent_sessions': {'$sum': {'$cond': [recent, '$sessions', 0]}},
+            'messages': {'$sum': '$messages'},
+            'recent_messages': {'$sum': {'$cond': [recent, '$messages', 0]}}
+        }}
+    ]))
+    row = result[0] if result else {}
+    return {key: int(row.get(key, 0)) for key in ('sessions', 'recent_sessions', 'messages', 'recent_messages')}
+
+def get_daily_series(match, start_date, end_date, field):
+    """{date: summed field} per day of a scope, e.g. field='paid_revenue' or 'revenue_by_status.delivered'"""
+    from models import DailyBusinessStats
+
+    result = DailyBusinessStats.objects.aggregate([
+        {'$match': _rollup_match(match, start_date, end_date)},
+        {'$group': {'_id': '$date', 'value': {'$sum': {'$ifNull': [f"${field}", 0]}}}}
+    ])
+    return {row['_id'].date(): float(row['value']) for row in result}
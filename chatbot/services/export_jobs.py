@@ -0,0 +1,301 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from datetime import datetime, timedelta
+from bson import ObjectId
+from mongoengine import Q
+
+logger = logging.getLogger(__name__)
+
+# Background export jobs
+# Large exports are submitted as jobs in the export_jobs collection instead of
+# being computed inside the request. Worker threads in each process claim
+# pending jobs, stream the export rows (services.export_service) into a GridFS
+# file and report progress on the job as they go; the client polls the job
+# and downloads the file once it is completed. Finished jobs and their files
+# are removed once they expire, by the workers and by `flask cleanup-exports`.
+# With EXPORT_WORKERS_ENABLED=false a process only submits jobs, leaving them
+# to the processes that run workers.
+
+def is_export_workers_enabled():
+    """Whether this process runs export jobs (jobs can still be submitted when it does not)"""
+    return os.getenv('EXPORT_WORKERS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+def _retention():
+    """How long finished exports are kept"""
+    return timedelta(hours=float(os.getenv('EXPORT_RETENTION_HOURS', 24)))
+
+def submit_export_job(data_type, business_id=None, file_format='csv', start_date=None, end_date=None, requested_by=None):
+    """Queue an export and wake the workers, returns the job"""
+    from models import ExportJob
+    from services.export_service import BUSINESS_EXPORTS, SYSTEM_EXPORTS
+
+    exports = BUSINESS_EXPORTS if business_id else SYSTEM_EXPORTS
+    if data_type not in exports:
+        raise ValueError(f"Invalid export type: {data_type}")
+
+    job = ExportJob(
+        data_type=data_type,
+        business=ObjectId(str(business_id)) if business_id else None,
+        file_format='xlsx' if file_format == 'xlsx' else 'csv',
+        start_date=start_date,
+        end_date=end_date,
+        requested_by=str(requested_by) if requested_by else None
+    )
+    job.save()
+    if _workers is not None:
+        _workers.wake()
+    return job
+
+def claim_export_job(visibility_timeout=600):
+    """Atomically lock the oldest pending job (or a stalled running one), or return None"""
+    from models import ExportJob
+    now = datetime.utcnow()
+    stale_before = now - timedelta(seconds=visibility_timeout)
+
+    return ExportJob.objects(
+        Q(status='pending') |
+        (Q(status='running') & Q(locked_at__lt=stale_before))
+    ).order_by('created_at').modify(
+        new=True,
+        set__status='running',
+        set__started_at=now,
+        set__locked_at=now,
+        set__claim_id=uuid.uuid4().hex,
+        set__rows_written=0,
+        inc__attempts=1
+    )
+
+class _Progress:
+    """Passes rows through, recording how many were written every few seconds"""
+
+    def __init__(self, job, rows, interval=2.0):
+        self.job = job
+        self.rows = rows
+        self.interval = interval
+        self.count = 0
+
+    def __iter__(self):
+        from models import ExportJob
+        reported_at = time.monotonic()
+        for row in self.rows:
+            self.count += 1
+            yield row
+            if time.monotonic() - reported_at >= self.interval:
+                reported_at = time.monotonic()
+                # Also refreshes the lock so the job is not handed out again
+                ExportJob.objects(id=self.job.id, claim_id=self.job.claim_id).update_one(
+                    set__rows_written=self.count,
+                    set__locked_at=datetime.utcnow()
+                )
+
+def run_export_job(job, max_attempts=2):
+    """Compute one claimed job into a GridFS file"""
+    from models import ExportJob
+    from services.image_service import get_gridfs
+    from services.export_service import get_export, count_export_rows, iter_csv, iter_xlsx, CSV_MIMETYPE, XLSX_MIMETYPE
+
+    business_id = job._data.get('business')
+    business_id = getattr(business_id, 'id', business_id)
+    grid_file = None
+    try:
+        rows_total = count_export_rows(job.data_type, business_id, job.start_date, job.end_date)
+        ExportJob.objects(id=job.id, claim_id=job.claim_id).update_one(set__rows_total=rows_total)
+
+        columns, rows = get_export(job.data_type, business_id, job.start_date, job.end_date)
+        progress = _Progress(job, rows)
+        scope = f"business_{business_id}" if business_id else 'system'
+        filename = f"{scope}_{job.data_type}_{job.created_at.strftime('%Y%m%d_%H%M%S')}.{job.file_format}"
+
+        if job.file_format == 'xlsx':
+            chunks, content_type = iter_xlsx(columns, progress), XLSX_MIMETYPE
+        else:
+            chunks, content_type = iter_csv(columns, progress), CSV_MIMETYPE
+
+        grid_file = get_gridfs().new_file(
+            filename=filename,
+            content_type=content_type,
+            metadata={'export_job': str(job.id)}
+        )
+        for chunk in chunks:
+            grid_file.write(chunk)
+        grid_file.close()
+
+        # Only the run holding the current claim completes the job; a run whose
+        # job was handed out again after stalling discards its file
+        now = datetime.utcnow()
+        completed = ExportJob.objects(id=job.id, claim_id=job.claim_id, status='running').update_one(
+            set__status='completed',
+            set__file_id=grid_file._id,
+            set__filename=filename,
+            set__file_size=grid_file.length,
+            set__rows_written=progress.count,
+            set__rows_total=max(rows_total, progress.count),
+            set__finished_at=now,
+            set__expires_at=now + _retention(),
+            unset__error=True
+        )
+        if not completed:
+            logger.warning(f"Export job {job.id} was claimed again while running; discarding file {grid_file._id}")
+            get_gridfs().delete(grid_file._id)
+            return
+        logger.info(f"Export job {job.id} wrote {progress.count} rows to {filename}")
+
+    except Exception as e:
+        logger.error(f"Error running export job {job.id}: {str(e)}", exc_info=True)
+        if grid_file is not None and not grid_file.closed:
+            try:
+                grid_file.abort()
+            except Exception as abort_error:
+                logger.error(f"Error discarding partial export file: {str(abort_error)}")
+
+        if job.attempts < max_attempts:
+            ExportJob.objects(id=job.id, claim_id=job.claim_id).update_one(set__status='pending', set__error=str(e)[:1000])
+            return
+        now = datetime.utcnow()
+        ExportJob.objects(id=job.id, claim_id=job.claim_id).update_one(
+            set__status='failed',
+            set__error=str(e)[:1000],
+            set__finished_at=now,
+            set__expires_at=now + _retention()
+        )
+
+def job_summary(job):
+    """JSON-ready status of a job"""
+    return {
+        'job_id': str(job.id),
+        'data_type': job.data_type,
+        'file_format': job.file_format,
+        'status': job.status,
+        'progress': job.progress,
+        'rows_written': job.rows_written,
+        'rows_total': job.rows_total,
+        'filename': job.filename,
+        'file_size': job.file_size,
+        'error': job.error if job.status == 'failed' else None,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'expires_at': job.expires_at.isoformat() if job.expires_at else None
+    }
+
+def open_export_file(job):
+    """GridOut of a completed job's file, or None"""
+    import gridfs
+    from services.image_service import get_gridfs
+
+    if job.status != 'completed' or not job.file_id:
+        return None
+    try:
+        return get_gridfs().get(job.file_id)
+    except gridfs.NoFile:
+        logger.warning(f"Export file of job {job.id} not found in GridFS: {job.file_id}")
+        return None
+
+def cleanup_expired_exports(now=None):
+    """Delete expired jobs and their GridFS files, returns the number of jobs removed"""
+    import gridfs
+    from models import ExportJob
+    from services.image_service import get_gridfs
+
+    now = now or datetime.utcnow()
+    fs = get_gridfs()
+    removed = 0
+    for job in ExportJob.objects(expires_at__lt=now).only('id', 'file_id'):
+        try:
+            if job.file_id:
+                try:
+                    fs.delete(job.file_id)
+                except gridfs.NoFile:
+                    pass
+            job.delete()
+            removed += 1
+        except Exception as e:
+            logger.error(f"Error removing expired export job {job.id}: {str(e)}")
+    if removed:
+        logger.info(f"Removed {removed} expired export jobs")
+    return removed
+
+class ExportWorkerPool:
+    """Daemon threads claiming and running export jobs"""
+
+    def __init__(self, app, size=1, poll_interval=5.0, cleanup_interval=3600):
+        self.app = app
+        self.size = size
+        self.poll_interval = poll_interval
+        self.cleanup_interval = cleanup_interval
+        self.visibility_timeout = int(os.getenv('EXPORT_VISIBILITY_TIMEOUT', 600))
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+        self._cleaned_at = 0
+
+    def start(self):
+        """Start the worker threads (again after a fork)"""
+        with self._lock:
+            if self._pid == os.getpid() and self._threads:
+                return
+
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._threads = []
+            for i in range(self.size):
+                thread = threading.Thread(target=self._run, name=f"export-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+            logger.info(f"Started {self.size} export worker threads in process {self._pid}")
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def wake(self):
+        self.start()
+        self._wakeup.set()
+
+    def _cleanup_due(self):
+        with self._lock:
+            if time.monotonic() - self._cleaned_at < self.cleanup_interval:
+                return False
+            self._cleaned_at = time.monotonic()
+            return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    if self._cleanup_due():
+                        cleanup_expired_exports()
+                    job = claim_export_job(self.visibility_timeout)
+                    if job:
+                        run_export_job(job)
+                        continue
+            except Exception as e:
+                logger.error(f"Error in export worker: {str(e)}")
+
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+_workers = None
+
+def init_export_workers(app):
+    """Create and start the export worker pool when this process runs export jobs"""
+    from services.utils import is_cli_command
+    global _workers
+
+    # CLI commands exit when done and would abandon any job they claimed
+    if not is_export_workers_enabled() or is_cli_command():
+        return None
+
+    _workers = ExportWorkerPool(
+        app,
+        size=int(os.getenv('EXPORT_WORKER_THREADS', 1)),
+        poll_interval=float(os.getenv('EXPORT_POLL_INTERVAL', 5.0)),
+        cleanup_interval=int(os.getenv('EXPORT_CLEANUP_INTERVAL', 3600))
+    )
+    _workers.start()
+    return _workers
@@ -0,0 +1,585 @@
+import os
+import io
+import csv
+import logging
+import tempfile
+from datetime import datetime, timedelta
+from urllib.parse import quote
+from bson import ObjectId
+
+logger = logging.getLogger(__name__)
+
+# Streaming exports
+# Every export is a generator of rows read from a projected Mongo cursor in
+# batches of EXPORT_BATCH_SIZE documents. For each batch the referenced
+# customers, products, businesses and vendors are fetched with one $in query
+# per collection, and per-row figures (order counts, revenue, sales) with one
+# aggregation per batch, instead of a dereference or query per row. Rows are
+# written as they are produced: CSV in chunks of a chunked HTTP response,
+# Excel with xlsxwriter's constant_memory mode into a temporary file that is
+# then streamed. Worker memory stays flat whatever the number of rows.
+
+CSV_MIMETYPE = 'text/csv'
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Data rows per worksheet (Excel's limit less the header row)
+XLSX_MAX_ROWS = 1048575
+
+def _batch_size():
+    return int(os.getenv('EXPORT_BATCH_SIZE', 1000))
+
+def _batches(cursor, size):
+    """Lists of up to `size` documents from a cursor"""
+    batch = []
+    for document in cursor:
+        batch.append(document)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _ref(value):
+    """ObjectId of a stored reference (ObjectId or DBRef)"""
+    return getattr(value, 'id', value)
+
+def _iso(value):
+    return value.isoformat() if value else ''
+
+def _created_between(start_date, end_date):
+    """created_at filter for an export range (either end may be open)"""
+    created = {}
+    if start_date:
+        created['$gte'] = start_date
+    if end_date:
+        created['$lte'] = end_date
+    return {'created_at': created} if created else {}
+
+class _References:
+    """Referenced documents of a batch, fetched with one $in query"""
+
+    def __init__(self, model, fields, keep=False):
+        self.collection = model._get_collection()
+        self.projection = {field: 1 for field in fields}
+        # Small collections (businesses, vendors, categories) stay cached for
+        # the whole export; customers and products are only kept per batch
+        self.keep = keep
+        self.documents = {}
+
+    def fetch(self, ids):
+        wanted = {_ref(value) for value in ids if value is not None}
+        missing = [value for value in wanted if value not in self.documents] if self.keep else list(wanted)
+        found = {}
+        if missing:
+            found = {document['_id']: document for document in self.collection.find({'_id': {'$in': missing}}, self.projection)}
+        if self.keep:
+            self.documents.update(found)
+        else:
+            self.documents = found
+        return self
+
+    def get(self, value, field, default=''):
+        document = self.documents.get(_ref(value))
+        if not document:
+            return default
+        return document.get(field) or default
+
+def _figures_by(model, match, key, figures):
+    """{key value: {figure: value}} of one aggregation grouped by `key`"""
+    group = {'_id': f"${key}"}
+    group.update(figures)
+    return {row['_id']: row for row in model._get_collection().aggregate([{'$match': match}, {'$group': group}])}
+
+def _order_totals(match, key):
+    """Order count and paid revenue per value of `key` for the orders matching `match`"""
+    from models import Order
+    return _figures_by(Order, match, key, {
+        'orders': {'$sum': 1},
+        'revenue': {'$sum': {'$cond': [{'$eq': ['$payment_status', 'paid']}, {'$ifNull': ['$total_amount', 0]}, 0]}}
+    })
+
+# Business exports (vendor and per-business admin exports)
+
+BUSINESS_ORDER_COLUMNS = [
+    'order_number', 'customer_phone', 'customer_name', 'products', 'total_amount', 'status',
+    'payment_status', 'payment_method', 'created_at', 'customization_notes'
+]
+
+def _business_orders(business_id, start_date, end_date):
+    from models import Order, Customer, Product
+
+    match = {'business': business_id}
+    match.update(_created_between(start_date, end_date))
+    cursor = Order._get_collection().find(match, {
+        'order_number': 1, 'customer': 1, 'order_items.product': 1, 'order_items.quantity': 1, 'total_amount': 1,
+        'status': 1, 'payment_status': 1, 'payment_method': 1, 'created_at': 1, 'customization_notes': 1
+    }).sort('created_at', 1)
+
+    customers = _References(Customer, ['name', 'phone_number'])
+    products = _References(Product, ['name'])
+    for batch in _batches(cursor, _batch_size()):
+        customers.fetch(order.get('customer') for order in batch)
+        products.fetch(item.get('product') for order in batch for item in order.get('order_items') or [])
+        for order in batch:
+            items = ', '.join(
+                f"{products.get(item.get('product'), 'name', 'Unknown product')} (x{item.get('quantity') or 1})"
+                for item in order.get('order_items') or []
+            )
+            yield [
+                order.get('order_number', ''),
+                customers.get(order.get('customer'), 'phone_number'),
+                customers.get(order.get('customer'), 'name'),
+                items,
+                order.get('total_amount') or 0,
+                order.get('status', ''),
+                order.get('payment_status', ''),
+                order.get('payment_method') or '',
+                _iso(order.get('created_at')),
+                order.get('customization_notes') or ''
+            ]
+
+BUSINESS_CUSTOMER_COLUMNS = ['phone_number', 'name', 'email', 'created_at', 'chat_sessions', 'orders', 'total_spent']
+
+def _business_customers(business_id, start_date, end_date):
+    """Customers who chatted with the business in the range, with their all-time figures there"""
+    from models import ChatSession, Customer
+
+    match = {'business': business_id}
+    match.update(_created_between(start_date, end_date))
+    customer_ids = ChatSession._get_collection().aggregate([
+        {'$match': match},
+        {'$group': {'_id': '$customer'}},
+        {'$sort': {'_id': 1}}
+    ], allowDiskUse=True)
+
+    customers = _References(Customer, ['name', 'phone_number', 'email', 'created_at'])
+    for batch in _batches((row['_id'] for row in customer_ids if row['_id'] is not None), _batch_size()):
+        customers.fetch(batch)
+        in_batch = {'business': business_id, 'customer': {'$in': batch}}
+        sessions = _figures_by(ChatSession, in_batch, 'customer', {'count': {'$sum': 1}})
+        orders = _order_totals(in_batch, 'customer')
+        for customer_id in batch:
+            customer = customers.documents.get(customer_id)
+            if not customer:
+                continue
+            totals = orders.get(customer_id, {})
+            yield [
+                customer.get('phone_number', ''),
+                customer.get('name') or '',
+                customer.get('email') or '',
+                _iso(customer.get('created_at')),
+                sessions.get(customer_id, {}).get('count', 0),
+                totals.get('orders', 0),
+                float(totals.get('revenue', 0))
+            ]
+
+BUSINESS_PRODUCT_COLUMNS = [
+    'product_id', 'product_name', 'category', 'price', 'is_active', 'allows_customization', 'has_variations',
+    'total_sold', 'total_revenue', 'unique_customers', 'created_at'
+]
+
+def _business_products(business_id, start_date, end_date):
+    """The business's products with their paid sales in the range"""
+    from models import Product, Category, Order
+
+    cursor = Product._get_collection().find({'business': business_id}, {
+        'product_id': 1, 'name': 1, 'category': 1, 'price': 1, 'is_active': 1,
+        'allows_customization': 1, 'has_variations': 1, 'created_at': 1
+    }).sort('created_at', 1)
+
+    categories = _References(Category, ['name'], keep=True)
+    for batch in _batches(cursor, _batch_size()):
+        categories.fetch(product.get('category') for product in batch)
+        product_ids = [product['_id'] for product in batch]
+        match = {'business': business_id, 'payment_status': 'paid', 'order_items.product': {'$in': product_ids}}
+        match.update(_created_between(start_date, end_date))
+        sales = {row['_id']: row for row in Order._get_collection().aggregate([
+            {'$match': match},
+            {'$unwind': '$order_items'},
+            {'$match': {'order_items.product': {'$in': product_ids}}},
+            {'$group': {
+                '_id': '$order_items.product',
+                'total_sold': {'$sum': '$order_items.quantity'},
+                'total_revenue': {'$sum': '$order_items.total_price'},
+                'customers': {'$addToSet': '$customer'}
+            }},
+            {'$project': {'total_sold': 1, 'total_revenue': 1, 'unique_customers': {'$size': '$customers'}}}
+        ])}
+        for product in batch:
+            figures = sales.get(product['_id'], {})
+            yield [
+                product.get('product_id') or str(product['_id']),
+                product.get('name', ''),
+                categories.get(product.get('category'), 'name'),
+                product.get('price') or 0,
+                product.get('is_active', True),
+                product.get('allows_customization', False),
+                product.get('has_variations', False),
+                figures.get('total_sold', 0),
+                float(figures.get('total_revenue', 0)),
+                figures.get('unique_customers', 0),
+                _iso(product.get('created_at'))
+            ]
+
+BUSINESS_CHAT_COLUMNS = ['session_id', 'customer_phone', 'customer_name', 'created_at', 'message_count']
+
+def _business_chats(business_id, start_date, end_date):
+    from models import ChatSession, Customer
+    from services.chat_store import MESSAGE_COUNT
+
+    match = {'business': business_id}
+    match.update(_created_between(start_date, end_date))
+    cursor = ChatSession._get_collection().aggregate([
+        {'$match': match},
+        {'$sort': {'created_at': 1}},
+        {'$project': {'session_id': 1, 'customer': 1, 'created_at': 1, 'message_count': MESSAGE_COUNT}}
+    ], allowDiskUse=True)
+
+    customers = _References(Customer, ['name', 'phone_number'])
+    for batch in _batches(cursor, _batch_size()):
+        customers.fetch(session.get('customer') for session in batch)
+        for session in batch:
+            yield [
+                session.get('session_id') or str(session['_id']),
+                customers.get(session.get('customer'), 'phone_number'),
+                customers.get(session.get('customer'), 'name'),
+                _iso(session.get('created_at')),
+                session.get('message_count') or 0
+            ]
+
+# System-wide exports (admin)
+
+SYSTEM_ORDER_COLUMNS = [
+    'order_id', 'business_name', 'vendor_name', 'customer_name', 'customer_phone', 'total_amount',
+    'payment_status', 'order_status', 'created_at', 'updated_at'
+]
+
+def _system_orders(start_date, end_date):
+    from models import Order, Customer, Business, Vendor
+
+    cursor = Order._get_collection().find(_created_between(start_date, end_date), {
+        'business': 1, 'customer': 1, 'total_amount': 1, 'payment_status': 1, 'status': 1,
+        'created_at': 1, 'updated_at': 1
+    }).sort('created_at', 1)
+
+    customers = _References(Customer, ['name', 'phone_number'])
+    businesses = _References(Business, ['name', 'vendor'], keep=True)
+    vendors = _References(Vendor, ['name'], keep=True)
+    for batch in _batches(cursor, _batch_size()):
+        customers.fetch(order.get('customer') for order in batch)
+        businesses.fetch(order.get('business') for order in batch)
+        vendors.fetch(businesses.get(order.get('business'), 'vendor', None) for order in batch)
+        for order in batch:
+            business = order.get('business')
+            yield [
+                str(order['_id']),
+                businesses.get(business, 'name'),
+                vendors.get(businesses.get(business, 'vendor', None), 'name'),
+                customers.get(order.get('customer'), 'name'),
+                customers.get(order.get('customer'), 'phone_number'),
+                float(order.get('total_amount') or 0),
+                order.get('payment_status', ''),
+                order.get('status', ''),
+                _iso(order.get('created_at')),
+                _iso(order.get('updated_at'))
+            ]
+
+SYSTEM_CUSTOMER_COLUMNS = ['customer_id', 'name', 'phone', 'email', 'order_count', 'total_spent', 'created_at', 'last_activity']
+
+def _system_customers(start_date, end_date):
+    from models import Customer
+
+    cursor = Customer._get_collection().find(_created_between(start_date, end_date), {
+        'name': 1, 'phone_number': 1, 'email': 1, 'created_at': 1, 'last_activity': 1
+    }).sort('created_at', 1)
+
+    for batch in _batches(cursor, _batch_size()):
+        orders = _order_totals({'customer': {'$in': [customer['_id'] for customer in batch]}}, 'customer')
+        for customer in batch:
+            totals = orders.get(customer['_id'], {})
+            yield [
+                str(customer['_id']),
+                customer.get('name') or '',
+                customer.get('phone_number', ''),
+                customer.get('email') or '',
+                totals.get('orders', 0),
+                float(totals.get('revenue', 0)),
+                _iso(customer.get('created_at')),
+                _iso(customer.get('last_activity'))
+            ]
+
+SYSTEM_BUSINESS_COLUMNS = [
+    'business_id', 'name', 'vendor_name', 'phone', 'email', 'category', 'is_active', 'order_count',
+    'total_revenue', 'customer_count', 'created_at', 'whatsapp_number'
+]
+
+def _system_businesses(start_date, end_date):
+    from models import Business, Vendor, ChatSession
+
+    cursor = Business._get_collection().find(_created_between(start_date, end_date), {
+        'name': 1, 'vendor': 1, 'whatsapp_number': 1, 'email': 1, 'category': 1, 'is_active': 1, 'created_at': 1
+    }).sort('created_at', 1)
+
+    vendors = _References(Vendor, ['name'], keep=True)
+    for batch in _batches(cursor, _batch_size()):
+        vendors.fetch(business.get('vendor') for business in batch)
+        business_ids = [business['_id'] for business in batch]
+        orders = _order_totals({'business': {'$in': business_ids}}, 'business')
+        customers = {row['_id']: row['count'] for row in ChatSession._get_collection().aggregate([
+            {'$match': {'business': {'$in': business_ids}}},
+            {'$group': {'_id': {'business': '$business', 'customer': '$customer'}}},
+            {'$group': {'_id': '$_id.business', 'count': {'$sum': 1}}}
+        ], allowDiskUse=True)}
+        for business in batch:
+            totals = orders.get(business['_id'], {})
+            yield [
+                str(business['_id']),
+                business.get('name', ''),
+                vendors.get(business.get('vendor'), 'name'),
+                business.get('whatsapp_number', ''),
+                business.get('email') or '',
+                business.get('category', ''),
+                business.get('is_active', True),
+                totals.get('orders', 0),
+                float(totals.get('revenue', 0)),
+                customers.get(business['_id'], 0),
+                _iso(business.get('created_at')),
+                business.get('whatsapp_number') or ''
+            ]
+
+SYSTEM_VENDOR_COLUMNS = [
+    'vendor_id', 'name', 'email', 'phone', 'is_active', 'business_count', 'total_orders', 'total_revenue',
+    'created_at', 'last_login'
+]
+
+def _system_vendors(start_date, end_date):
+    from models import Vendor, Business
+
+    cursor = Vendor._get_collection().find(_created_between(start_date, end_date), {
+        'name': 1, 'email': 1, 'phone_number': 1, 'is_active': 1, 'created_at': 1, 'last_login': 1
+    }).sort('created_at', 1)
+
+    for batch in _batches(cursor, _batch_size()):
+        owners = {
+            business['_id']: _ref(business.get('vendor'))
+            for business in Business._get_collection().find({'vendor': {'$in': [vendor['_id'] for vendor in batch]}}, {'vendor': 1})
+        }
+        per_vendor = {}
+        for vendor_id in owners.values():
+            per_vendor.setdefault(vendor_id, {'businesses': 0, 'orders': 0, 'revenue': 0.0})['businesses'] += 1
+        if owners:
+            for business_id, totals in _order_totals({'business': {'$in': list(owners)}}, 'business').items():
+                figures = per_vendor[owners[business_id]]
+                figures['orders'] += totals['orders']
+                figures['revenue'] += totals['revenue']
+        for vendor in batch:
+            figures = per_vendor.get(vendor['_id'], {})
+            yield [
+                str(vendor['_id']),
+                vendor.get('name', ''),
+                vendor.get('email', ''),
+                vendor.get('phone_number') or '',
+                vendor.get('is_active', True),
+                figures.get('businesses', 0),
+                figures.get('orders', 0),
+                float(figures.get('revenue', 0)),
+                _iso(vendor.get('created_at')),
+                _iso(vendor.get('last_login'))
+            ]
+
+SYSTEM_CHAT_COLUMNS = [
+    'session_id', 'business_name', 'vendor_name', 'customer_name', 'customer_phone', 'message_count',
+    'created_at', 'last_message'
+]
+
+def _system_chats(start_date, end_date):
+    from models import ChatSession, Customer, Business, Vendor
+    from services.chat_store import MESSAGE_COUNT
+
+    cursor = ChatSession._get_collection().aggregate([
+        {'$match': _created_between(start_date, end_date)},
+        {'$sort': {'created_at': 1}},
+        {'$project': {
+            'business': 1, 'customer': 1, 'created_at': 1, 'message_count': MESSAGE_COUNT,
+            # Unmigrated sessions have no last_message_at yet
+            'last_message_at': {'$ifNull': ['$last_message_at', {'$max': '$messages.timestamp'}]}
+        }}
+    ], allowDiskUse=True)
+
+    customers = _References(Customer, ['name', 'phone_number'])
+    businesses = _References(Business, ['name', 'vendor'], keep=True)
+    vendors = _References(Vendor, ['name'], keep=True)
+    for batch in _batches(cursor, _batch_size()):
+        customers.fetch(session.get('customer') for session in batch)
+        businesses.fetch(session.get('business') for session in batch)
+        vendors.fetch(businesses.get(session.get('business'), 'vendor', None) for session in batch)
+        for session in batch:
+            business = session.get('business')
+            yield [
+                str(session['_id']),
+                businesses.get(business, 'name'),
+                vendors.get(businesses.get(business, 'vendor', None), 'name'),
+                customers.get(session.get('customer'), 'name'),
+                customers.get(session.get('customer'), 'phone_number'),
+                session.get('message_count') or 0,
+                _iso(session.get('created_at')),
+                _iso(session.get('last_message_at'))
+            ]
+
+BUSINESS_EXPORTS = {
+    'orders': (BUSINESS_ORDER_COLUMNS, _business_orders),
+    'customers': (BUSINESS_CUSTOMER_COLUMNS, _business_customers),
+    'products': (BUSINESS_PRODUCT_COLUMNS, _business_products),
+    'chats': (BUSINESS_CHAT_COLUMNS, _business_chats)
+}
+
+SYSTEM_EXPORTS = {
+    'orders': (SYSTEM_ORDER_COLUMNS, _system_orders),
+    'customers': (SYSTEM_CUSTOMER_COLUMNS, _system_customers),
+    'businesses': (SYSTEM_BUSINESS_COLUMNS, _system_businesses),
+    'vendors': (SYSTEM_VENDOR_COLUMNS, _system_vendors),
+    'chats': (SYSTEM_CHAT_COLUMNS, _system_chats)
+}
+
+def parse_export_range(start_date=None, end_date=None, default_days=30):
+    """Export range from YYYY-MM-DD strings; the end date is inclusive"""
+    if start_date:
+        start_date = datetime.strptime(start_date, '%Y-%m-%d')
+    else:
+        start_date = datetime.utcnow() - timedelta(days=default_days)
+
+    if end_date:
+        end_date = datetime.strptime(end_date, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
+    else:
+        end_date = datetime.utcnow()
+    return start_date, end_date
+
+def get_export(data_type, business_id=None, start_date=None, end_date=None):
+    """
+    (columns, rows generator) of an export, or None for an unknown data type
+    Business exports when business_id is given, system-wide ones otherwise.
+    Nothing is queried until the rows are iterated.
+    """
+    if business_id:
+        if data_type not in BUSINESS_EXPORTS:
+            return None
+        columns, rows = BUSINESS_EXPORTS[data_type]
+        return columns, rows(ObjectId(str(business_id)), start_date, end_date)
+
+    if data_type not in SYSTEM_EXPORTS:
+        return None
+    columns, rows = SYSTEM_EXPORTS[data_type]
+    return columns, rows(start_date, end_date)
+
+def count_export_rows(data_type, business_id=None, start_date=None, end_date=None):
+    """Number of rows an export will produce, for progress reporting"""
+    from models import Order, ChatSession, Product, Customer, Business, Vendor
+
+    created = _created_between(start_date, end_date)
+    if business_id:
+        business_id = ObjectId(str(business_id))
+        scoped = dict(created, business=business_id)
+        if data_type == 'customers':
+            result = list(ChatSession._get_collection().aggregate([
+                {'$match': scoped},
+                {'$group': {'_id': '$customer'}},
+                {'$count': 'customers'}
+            ], allowDiskUse=True))
+            return result[0]['customers'] if result else 0
+        if data_type == 'products':
+            return Product._get_collection().count_documents({'business': business_id})
+        model = {'orders': Order, 'chats': ChatSession}.get(data_type)
+        return model._get_collection().count_documents(scoped) if model else 0
+
+    model = {
+        'orders': Order, 'customers': Customer, 'businesses': Business, 'vendors': Vendor, 'chats': ChatSession
+    }.get(data_type)
+    return model._get_collection().count_documents(created) if model else 0
+
+def iter_csv(columns, rows, chunk_rows=500):
+    """UTF-8 CSV in chunks of `chunk_rows` rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % chunk_rows == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate(0)
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+def write_xlsx(columns, rows, output):
+    """
+    Write rows to an Excel workbook at `output` (a path or file object)
+    constant_memory flushes each row to disk as soon as the next one starts;
+    rows beyond Excel's sheet limit continue on a new worksheet.
+    """
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True, 'strings_to_urls': False})
+    header = workbook.add_format({'bold': True})
+    sheet, row_number, sheets = None, XLSX_MAX_ROWS, 0
+    for row in rows:
+        if row_number >= XLSX_MAX_ROWS:
+            sheets += 1
+            sheet = workbook.add_worksheet('Export' if sheets == 1 else f"Export {sheets}")
+            sheet.write_row(0, 0, columns, header)
+            row_number = 0
+        row_number += 1
+        sheet.write_row(row_number, 0, row)
+    if sheet is None:
+        workbook.add_worksheet('Export').write_row(0, 0, columns, header)
+    workbook.close()
+
+def iter_xlsx(columns, rows, chunk_size=64 * 1024):
+    """An Excel workbook built in a temporary file, then read back in chunks"""
+    handle, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(handle)
+    try:
+        write_xlsx(columns, rows, path)
+        with open(path, 'rb') as workbook:
+            while True:
+                chunk = workbook.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def content_disposition(filename):
+    """Attachment header with an ASCII fallback and the UTF-8 filename"""
+    fallback = filename.encode('ascii', 'ignore').decode('ascii').replace('"', '').replace('\\', '') or 'export'
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename)}"
+
+def export_response(columns, rows, filename, file_format='csv'):
+    """
+    A chunked download of an export
+    filename is given without extension; file_format is 'csv' or 'xlsx'.
+    """
+    from flask import Response
+
+    if file_format == 'xlsx':
+        body, mimetype = iter_xlsx(columns, rows), XLSX_MIMETYPE
+    else:
+        file_format = 'csv'
+        body, mimetype = iter_csv(columns, rows), CSV_MIMETYPE
+
+    def logged(chunks):
+        try:
+            yield from chunks
+        except Exception as e:
+            # Headers are already sent; the client sees a truncated download
+            logger.error(f"Error streaming export {filename}.{file_format}: {str(e)}")
+            raise
+
+    return Response(logged(body), mimetype=mimetype, headers={
+        'Content-Disposition': content_disposition(f"{filename}.{file_format}"),
+        'Cache-Control': 'no-store',
+        # Let nginx pass chunks through instead of buffering the whole file
+        'X-Accel-Buffering': 'no'
+    })
@@ -0,0 +1,175 @@
+import os
+import re
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Streaming GPT replies
+# Instead of waiting for the whole completion, the stream is consumed and
+# complete sentences/paragraphs are sent as separate WhatsApp messages as soon
+# as enough text has built up (or enough time has passed), so the customer
+# sees the first part of the answer while the rest is still being generated.
+
+# WhatsApp rejects text bodies above 4096 characters
+WHATSAPP_MAX_TEXT = 4096
+
+# End of a paragraph, or of a sentence followed by whitespace
+_PARAGRAPH_END = re.compile(r'\n\s*\n')
+_SENTENCE_END = re.compile(r'[.!?](?:["\')\]]*)\s+|\n')
+
+class StreamInterrupted(Exception):
+    """The stream failed after part of the reply had been sent"""
+
+    def __init__(self, message, delivered):
+        super().__init__(message)
+        # Text of the chunks the customer received
+        self.delivered = delivered
+
+def is_streaming_enabled():
+    """Whether GPT replies should be streamed to WhatsApp in chunks"""
+    return os.getenv('GPT_STREAMING_MODE', 'false').lower() in ('1', 'true', 'yes')
+
+class ChunkAccumulator:
+    """
+    Buffers streamed text and decides when a chunk is ready to send
+    A chunk is released at the last paragraph or sentence boundary once the
+    buffer reaches min_chars or flush_seconds have passed since the previous
+    chunk; text without any boundary is cut at whitespace at max_chars.
+    """
+
+    def __init__(self, min_chars=160, flush_seconds=1.5, max_chars=1000):
+        self.min_chars = min_chars
+        self.flush_seconds = flush_seconds
+        self.max_chars = min(max_chars, WHATSAPP_MAX_TEXT)
+        self.buffer = ''
+        self.last_flush = time.monotonic()
+
+    def _boundary(self):
+        """Index just after the last paragraph, or else sentence, end in the buffer"""
+        for pattern in (_PARAGRAPH_END, _SENTENCE_END):
+            ends = [match.end() for match in pattern.finditer(self.buffer)]
+            if ends:
+                return ends[-1]
+        return None
+
+    def feed(self, text):
+        """Add streamed text, returns the chunks that are ready to send"""
+        self.buffer += text
+        chunks = []
+
+        while self.buffer:
+            boundary = self._boundary()
+            due = time.monotonic() - self.last_flush >= self.flush_seconds
+            if boundary and (boundary >= self.min_chars or due):
+                chunks.append(self._take(boundary))
+            elif len(self.buffer) >= self.max_chars:
+                cut = self.buffer.rfind(' ', 0, self.max_chars)
+                chunks.append(self._take(cut if cut > 0 else self.max_chars))
+            else:
+                break
+
+        return [chunk for chunk in chunks if chunk]
+
+    def flush(self):
+        """Whatever is left once the stream has ended"""
+        chunk = self._take(len(self.buffer))
+        return [chunk] if chunk else []
+
+    def _take(self, index):
+        chunk, self.buffer = self.buffer[:index], self.buffer[index:]
+        self.last_flush = time.monotonic()
+        return chunk.strip()
+
+class StreamingMetrics:
+    """Time-to-first-message and chunk counts of streamed replies in this process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.replies = 0
+        self.chunks = 0
+        self.failed = 0
+        self.total_first_message = 0.0
+        self.max_first_message = 0.0
+        self.total_duration = 0.0
+
+    def record(self, first_message, duration, chunks, failed=False):
+        with self.lock:
+            self.replies += 1
+            self.chunks += chunks
+            if failed:
+                self.failed += 1
+            if first_message is not None:
+                self.total_first_message += first_message
+                self.max_first_message = max(self.max_first_message, first_message)
+            self.total_duration += duration
+
+    def snapshot(self):
+        with self.lock:
+            replies = self.replies
+            return {
+                'replies': replies,
+                'chunks': self.chunks,
+                'failed': self.failed,
+                'avg_chunks_per_reply': round(self.chunks / replies, 2) if replies else 0,
+                'avg_time_to_first_message_ms': round(self.total_first_message / replies * 1000, 2) if replies else 0,
+                'max_time_to_first_message_ms': round(self.max_first_message * 1000, 2),
+                'avg_reply_duration_ms': round(self.total_duration / replies * 1000, 2) if replies else 0
+            }
+
+_metrics = StreamingMetrics()
+
+def get_streaming_metrics():
+    return _metrics.snapshot()
+
+def stream_completion_to_whatsapp(client, send_chunk, **completion_kwargs):
+    """
+    Stream a chat completion and send it in chunks as it is generated
+    send_chunk(text) delivers one WhatsApp message. Returns the assembled
+    reply text. Time to first message is measured from the request start.
+    Raises StreamInterrupted if the stream fails after chunks were sent.
+    """
+    accumulator = ChunkAccumulator(
+        min_chars=int(os.getenv('GPT_STREAM_MIN_CHARS', 160)),
+        flush_seconds=float(os.getenv('GPT_STREAM_FLUSH_SECONDS', 1.5)),
+        max_chars=int(os.getenv('GPT_STREAM_MAX_CHARS', 1000))
+    )
+    started_at = time.monotonic()
+    first_message = None
+    sent = 0
+    parts = []
+    delivered = []
+
+    def deliver(chunks):
+        nonlocal first_message, sent
+        for chunk in chunks:
+            send_chunk(chunk)
+            delivered.append(chunk)
+            sent += 1
+            if first_message is None:
+                first_message = time.monotonic() - started_at
+
+    failed = True
+    try:
+        stream = client.chat.completions.create(stream=True, **completion_kwargs)
+        for event in stream:
+            if not event.choices:
+                continue
+            text = event.choices[0].delta.content
+            if text:
+                parts.append(text)
+                deliver(accumulator.feed(text))
+        deliver(accumulator.flush())
+        failed = False
+    except Exception as e:
+        if delivered:
+            raise StreamInterrupted(str(e), '\n\n'.join(delivered)) from e
+        raise
+    finally:
+        duration = time.monotonic() - started_at
+        _metrics.record(first_message, duration, sent, failed)
+        if first_message is not None:
+            logger.info(f"Streamed GPT reply in {sent} messages, first after {first_message * 1000:.0f}ms, total {duration * 1000:.0f}ms")
+
+    return ''.join(parts)
@@ -0,0 +1,120 @@
+import logging
+from bson import ObjectId
+
+logger = logging.getLogger(__name__)
+
+# Index maintenance and query-plan audit
+# ensure_all_indexes() builds the indexes declared in each model's meta
+# (in the background where the server supports it); audit_hot_queries()
+# explains the query shapes the chat, catalog, order and analytics paths run
+# and reports the ones MongoDB would still answer with a collection scan.
+
+def _models():
+    import models
+    from mongoengine import Document
+    return [
+        getattr(models, name) for name in models.__all__
+        if isinstance(getattr(models, name), type)
+        and issubclass(getattr(models, name), Document)
+        and not getattr(models, name)._meta.get('abstract')
+    ]
+
+def ensure_all_indexes():
+    """Create missing indexes of every model, returns {collection: [new index names]}"""
+    created = {}
+    for model in _models():
+        collection = model._get_collection()
+        before = set(collection.index_information())
+        model.ensure_indexes()
+        new = sorted(set(collection.index_information()) - before)
+        created[collection.name] = new
+        if new:
+            logger.info(f"Created indexes on {collection.name}: {', '.join(new)}")
+    return created
+
+def hot_queries():
+    """
+    Query shapes of the hot paths as (label, model, filter, sort)
+    Values are placeholders; the plan depends on the shape, not the values.
+    """
+    from models import (
+        ChatSession, ChatMessageBucket, Order, CustomerState, Product,
+        Category, Customer, Campaign, CampaignRecipient, InboundWebhook,
+        DailyBusinessStats, OrderIssue, Vendor, Business, ExportJob
+    )
+    oid = ObjectId()
+    return [
+        ('chat session by customer/business', ChatSession, {'customer': oid, 'business': oid}, None),
+        ('chat sessions of a business, newest first', ChatSession, {'business': oid}, [('created_at', -1), ('_id', -1)]),
+        ('chat sessions, newest first', ChatSession, {}, [('created_at', -1), ('_id', -1)]),
+        ('chat session by session_id', ChatSession, {'session_id': 'x'}, None),
+        ('open chat bucket', ChatMessageBucket, {'session': oid, 'count': {'$lte': 199}, 'first_message_at': {'$gte': oid.generation_time}}, None),
+        ('chat buckets of a session, newest first', ChatMessageBucket, {'session': oid}, [('first_message_at', -1)]),
+        ('paid orders of a business by date', Order, {'business': oid, 'payment_status': 'paid'}, [('created_at', -1)]),
+        ('paid orders of a customer by date', Order, {'customer': oid, 'payment_status': 'paid'}, [('created_at', -1)]),
+        ('orders of a business, newest first', Order, {'business': oid}, [('created_at', -1), ('_id', -1)]),
+        ('orders of a business by status, newest first', Order, {'business': oid, 'status': 'pending'}, [('created_at', -1), ('_id', -1)]),
+        ('orders by status, newest first', Order, {'status': 'pending'}, [('created_at', -1), ('_id', -1)]),
+        ('orders, newest first', Order, {}, [('created_at', -1), ('_id', -1)]),
+        ('products of a business, newest first', Product, {'business': oid}, [('created_at', -1), ('_id', -1)]),
+        ('order issues of a business, newest first', OrderIssue, {'business': oid}, [('created_at', -1), ('_id', -1)]),
+        ('vendors, newest first', Vendor, {}, [('created_at', -1), ('_id', -1)]),
+        ('businesses, newest first', Business, {}, [('created_at', -1), ('_id', -1)]),
+        ('orders containing a product', Order, {'order_items.product': oid}, None),
+        ('order by number', Order, {'order_number': 'ORD000000'}, None),
+        ('customer state', CustomerState, {'phone_number': '254700000000', 'business': oid}, None),
+        ('customer by phone number', Customer, {'phone_number': '254700000000'}, None),
+        ('active products of a business', Product, {'business': oid, 'is_active': True}, None),
+        ('active products of a category', Product, {'category': oid, 'is_active': True}, None),
+        ('product by variation id', Product, {'variations.variation_id': 'VAR0000'}, None),
+        ('product by product id', Product, {'product_id': 'P0000'}, None),
+        ('categories of a business', Category, {'business': oid}, None),
+        ('campaigns of a business', Campaign, {'business': oid}, [('created_at', -1)]),
+        ('pending campaign recipients', CampaignRecipient, {'campaign': oid, 'status': 'pending'}, None),
+        ('due webhook events', InboundWebhook, {'status': 'pending', 'available_at': {'$lte': oid.generation_time}}, None),
+        ('daily stats of a business', DailyBusinessStats, {'business': oid, 'date': {'$gte': oid.generation_time}}, None),
+        ('daily stats of all businesses', DailyBusinessStats, {'date': {'$gte': oid.generation_time}}, None),
+        ('customers created in a range', Customer, {'created_at': {'$gte': oid.generation_time}}, [('created_at', 1)]),
+        ('pending export jobs', ExportJob, {'status': 'pending'}, [('created_at', 1)]),
+        ('expired export jobs', ExportJob, {'expires_at': {'$lt': oid.generation_time}}, None),
+        ('export jobs of a user, newest first', ExportJob, {'requested_by': 'x'}, [('created_at', -1)])
+    ]
+
+def _plan_stages(plan, stages=None, indexes=None):
+    """Every stage name and index name in an explain plan tree"""
+    if stages is None:
+        stages, indexes = [], []
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(plan['stage'])
+        if 'indexName' in plan:
+            indexes.append(plan['indexName'])
+        for value in plan.values():
+            _plan_stages(value, stages, indexes)
+    elif isinstance(plan, list):
+        for item in plan:
+            _plan_stages(item, stages, indexes)
+    return stages, indexes
+
+def audit_hot_queries():
+    """Explain every hot query, returns [{'label', 'collection', 'collscan', 'indexes', 'stages'}]"""
+    results = []
+    for label, model, query, sort in hot_queries():
+        collection = model._get_collection()
+        try:
+            cursor = collection.find(query).limit(1)
+            if sort:
+                cursor = cursor.sort(sort)
+            plan = cursor.explain().get('queryPlanner', {}).get('winningPlan', {})
+            stages, indexes = _plan_stages(plan)
+            results.append({
+                'label': label,
+                'collection': collection.name,
+                'collscan': 'COLLSCAN' in stages,
+                'indexes': indexes,
+                'stages': stages
+            })
+        except Exception as e:
+            logger.error(f"Error explaining query '{label}': {str(e)}")
+            results.append({'label': label, 'collection': collection.name, 'error': str(e)})
+    return results
@@ -0,0 +1,110 @@
+import re
+import logging
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# Keyword intent engine
+# Every keyword list used to route customer messages is compiled once, at
+# import time, into a single word-level trie (an Aho-Corasick style automaton
+# over whole words). A message is split into words once and walked in one
+# pass that finds every keyword and phrase of every intent, so keywords only
+# ever match whole words ("ord" no longer matches "word").
+
+# Keywords that may appear anywhere in the message, as whole words/phrases
+KEYWORD_INTENTS = {
+    'order_tracking': ['order', 'orders', 'tracking', 'track', 'status', 'delivery', 'ord'],
+    'product_inquiry': ['product', 'products', 'service', 'services', 'catalog', 'what do you sell', 'what do you offer'],
+    'greeting': ['hello', 'hi', 'hey', 'start', 'menu', 'help', 'hola', 'hujambo', 'mambo'],
+    'platform_inquiry': ['sasabot', 'platform', 'how does it work', 'what is this', 'help', 'support', 'features', 'benefits']
+}
+
+# Messages that trigger an intent only when they are the whole message
+EXACT_INTENTS = {
+    'trigger': ['hi', 'hello', 'sasabot']
+}
+
+# Product IDs are upper-case codes such as "SHOE01" in the original message
+PRODUCT_ID_PATTERN = re.compile(r'\b([A-Z0-9]{4,})\b')
+
+_WORDS = re.compile(r'\w+')
+
+def tokenize(message):
+    """Lowercase words of a message, punctuation dropped"""
+    return _WORDS.findall((message or '').lower())
+
+class IntentEngine:
+    """Finds every intent whose keywords occur in a message in a single pass"""
+
+    def __init__(self, keyword_intents, exact_intents=None):
+        # Word trie: {word: {next_word: {...}, None: intents ending here}}
+        self.trie = {}
+        self.longest = 1
+        for intent, phrases in keyword_intents.items():
+            for phrase in phrases:
+                words = tokenize(phrase)
+                node = self.trie
+                for word in words:
+                    node = node.setdefault(word, {})
+                node.setdefault(None, set()).add(intent)
+                self.longest = max(self.longest, len(words))
+
+        self.exact_intents = {}
+        for intent, phrases in (exact_intents or {}).items():
+            for phrase in phrases:
+                self.exact_intents.setdefault(' '.join(tokenize(phrase)), set()).add(intent)
+
+    def match(self, message):
+        """frozenset of intents matched by a message"""
+        words = tokenize(message)
+        intents = set(self.exact_intents.get(' '.join(words), ()))
+        trie = self.trie
+        for i, word in enumerate(words):
+            node = trie.get(word)
+            if node is None:
+                continue
+            j = i + 1
+            while node is not None:
+                ended = node.get(None)
+                if ended:
+                    intents.update(ended)
+                if j >= len(words) or j - i >= self.longest:
+                    break
+                node = node.get(words[j])
+                j += 1
+        return frozenset(intents)
+
+_engine = IntentEngine(KEYWORD_INTENTS, EXACT_INTENTS)
+
+@lru_cache(maxsize=2048)
+def get_intents(message):
+    """All intents of a message (memoized; the same text is checked by several handlers)"""
+    return _engine.match(message)
+
+def extract_product_id(message):
+    """Product ID mentioned in a message, or None"""
+    match = PRODUCT_ID_PATTERN.search((message or '').upper())
+    return match.group(1) if match else None
+
+def determine_intent(message):
+    """Primary intent of a customer message to a business"""
+    intents = get_intents(message)
+    if 'order_tracking' in intents:
+        return 'order_tracking'
+    if 'product_inquiry' in intents:
+        return 'product_inquiry'
+    if PRODUCT_ID_PATTERN.search(message or ''):
+        return 'product_id'
+    return 'general'
+
+def is_trigger_word(message):
+    """Whether the whole message is one of the system trigger words"""
+    return 'trigger' in get_intents(message)
+
+def is_business_greeting(message):
+    """Whether the message contains a greeting/menu word"""
+    return 'greeting' in get_intents(message)
+
+def is_platform_inquiry(message):
+    """Whether the message asks about the Sasabot platform itself"""
+    return 'platform_inquiry' in get_intents(message)
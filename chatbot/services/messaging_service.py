@@ -7,6 +7,10 @@ from flask import jsonify, request
 from dotenv import load_dotenv
 from models import OnboardingState, Customer, Order, OrderItem, Business, Product, ProductVariation, ChatSession, ChatMessage
 from services.onboarding_service import onboarding_service
+from services.webhook_dispatcher import dispatch_webhook_batch
+from services.whatsapp_client import get_whatsapp_client, get_system_credentials
+from services.intent_engine import is_trigger_word
+from services.catalog_cache import get_catalog_for_product, get_catalog_for_variation
 
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -195,76 +199,66 @@ def process_business_whatsapp_message(data, business_id):
         if 'entry' not in data:
             logger.warning("Business webhook data missing 'entry'")
             return jsonify({"status": "ok"}), 200
-            
-        entry = data['entry'][0]
-        if 'changes' not in entry:
-            logger.warning("Business webhook data missing 'changes'")
-            return jsonify({"status": "ok"}), 200
-            
-        changes = entry['changes'][0]
-        if 'value' not in changes:
-            logger.warning("Business webhook data missing 'value'")
-            return jsonify({"status": "ok"}), 200
-            
-        value = changes['value']
         
-        # Handle business-specific status updates (delivery receipts, read receipts, etc.)
-        if 'statuses' in value:
-            logger.info(f"Processing status update for business {business_id}")
-            return handle_business_status_update(value['statuses'], business_id)
-            
-        if 'messages' not in value:
-            logger.info("No messages in business webhook data")
-            return jsonify({"status": "ok"}), 200
-            
-        messages = value['messages'][0]
-        phone_number = messages.get('from')
+        summary = dispatch_webhook_batch(
+            data,
+            lambda messages: handle_business_webhook_message(messages, business_id),
+            handle_status=lambda status: handle_business_status_update([status], business_id),
+            business_key=str(business_id)
+        )
         
-        # Handle business-specific messages
-        if 'text' in messages:
-            message = messages.get('text', {}).get('body', '')
-            if not phone_number or not message:
-                logger.error(f"Missing required fields: phone={phone_number}, message={message}")
+        logger.info(f"Business webhook processed successfully: {summary}")
+        return jsonify({"status": "ok"}), 200
+        
+    except Exception as e:
+        logger.error(f"Error processing business WhatsApp webhook: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+def handle_business_webhook_message(messages, business_id):
+    """Handle a single message delivered to a business webhook"""
+    phone_number = messages.get('from')
+    
+    # Handle business-specific messages
+    if 'text' in messages:
+        message = messages.get('text', {}).get('body', '')
+        if not phone_number or not message:
+            logger.error(f"Missing required fields: phone={phone_number}, message={message}")
+            return jsonify({"error": "Missing required fields"}), 400
+            
+        return handle_business_message({
+            'phone_number': phone_number,
+            'message': message,
+            'business_id': business_id
+        })
+    
+    # Handle button responses for business
+    elif 'interactive' in messages:
+        interactive = messages.get('interactive', {})
+        if 'button_reply' in interactive:
+            button_id = interactive['button_reply'].get('id')
+            if not phone_number or not button_id:
+                logger.error(f"Missing required fields: phone={phone_number}, button_id={button_id}")
                 return jsonify({"error": "Missing required fields"}), 400
                 
             return handle_business_message({
                 'phone_number': phone_number,
-                'message': message,
+                'button_id': button_id,
                 'business_id': business_id
             })
-        
-        # Handle button responses for business
-        elif 'interactive' in messages:
-            interactive = messages.get('interactive', {})
-            if 'button_reply' in interactive:
-                button_id = interactive['button_reply'].get('id')
-                if not phone_number or not button_id:
-                    logger.error(f"Missing required fields: phone={phone_number}, button_id={button_id}")
-                    return jsonify({"error": "Missing required fields"}), 400
-                    
-                return handle_business_message({
-                    'phone_number': phone_number,
-                    'button_id': button_id,
-                    'business_id': business_id
-                })
-            elif 'list_reply' in interactive:
-                list_id = interactive['list_reply'].get('id')
-                if not phone_number or not list_id:
-                    logger.error(f"Missing required fields: phone={phone_number}, list_id={list_id}")
-                    return jsonify({"error": "Missing required fields"}), 400
-                    
-                return handle_business_message({
-                    'phone_number': phone_number,
-                    'button_id': list_id,
-                    'business_id': business_id
-                })
-        
-        logger.info("Business webhook processed successfully")
-        return jsonify({"status": "ok"}), 200
-        
-    except Exception as e:
-        logger.error(f"Error processing business WhatsApp webhook: {str(e)}")
-        return jsonify({"error": "Internal server error"}), 500
+        elif 'list_reply' in interactive:
+            list_id = interactive['list_reply'].get('id')
+            if not phone_number or not list_id:
+                logger.error(f"Missing required fields: phone={phone_number}, list_id={list_id}")
+                return jsonify({"error": "Missing required fields"}), 400
+                
+            return handle_business_message({
+                'phone_number': phone_number,
+                'button_id': list_id,
+                'business_id': business_id
+            })
+    
+    logger.info("Unsupported business message type")
+    return jsonify({"status": "ok"}), 200
 
 def handle_business_status_update(statuses, business_id):
     """Handle status updates for business webhooks"""
@@ -335,7 +329,12 @@ def handle_business_message(data):
         logger.error(f"Error handling business message: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
 
-def process_whatsapp_message(data):
+def process_whatsapp_message(data, raise_errors=False):
+    """
+    Process a system webhook payload
+    With raise_errors (queued webhooks) failures are raised so the queue can
+    retry them; otherwise they are logged and answered with a 500.
+    """
     try:
         logger.info(f"Received WhatsApp webhook data: {data}")
         
@@ -347,118 +346,103 @@ def process_whatsapp_message(data):
         if 'entry' not in data:
             logger.warning("Webhook data missing 'entry' - might be a status update")
             return jsonify({"status": "ok"}), 200
-            
-        entry = data['entry'][0]
-        if 'changes' not in entry:
-            logger.warning("Webhook data missing 'changes' - might be a status update")
-            return jsonify({"status": "ok"}), 200
-            
-        changes = entry['changes'][0]
-        if 'value' not in changes:
-            logger.warning("Webhook data missing 'value' - might be a status update")
-            return jsonify({"status": "ok"}), 200
-            
-        value = changes['value']
         
-        # Handle status updates (delivery receipts, read receipts, etc.)
-        # These should be handled by business-specific webhooks, not the system webhook
-        if 'statuses' in value:
-            logger.info("Received status update webhook - should be handled by business webhook")
-            # System webhook ignores status updates - they belong to business webhooks
-            return jsonify({"status": "ok"}), 200
-            
-        if 'messages' not in value:
-            logger.info("No messages in webhook data - might be a status update or other notification")
-            return jsonify({"status": "ok"}), 200
-            
-        messages = value['messages'][0]
+        # Status updates (delivery receipts, read receipts, etc.) belong to
+        # business webhooks, so the system webhook only handles messages
+        summary = dispatch_webhook_batch(data, handle_system_webhook_message, business_key='system', raise_errors=raise_errors)
+        logger.info(f"System webhook batch processed: {summary}")
+        return jsonify({"status": "ok"}), 200
         
-        phone_number = messages.get('from')
+    except Exception as e:
+        logger.error(f"Error processing WhatsApp webhook: {str(e)}")
+        if raise_errors:
+            raise
+        return jsonify({"error": "Internal server error"}), 500
+
+def handle_system_webhook_message(messages):
+    """Handle a single message delivered to the system webhook"""
+    phone_number = messages.get('from')
+    
+    # SYSTEM WEBHOOK - Only handle onboarding and system-level interactions
+    # Check if user is in onboarding process
+    onboarding_state = OnboardingState.objects(phone_number=phone_number).first()
+    if not onboarding_state:
+        # Check for system trigger words to start onboarding
+        message_text = ""
+        if 'text' in messages:
+            message_text = messages.get('text', {}).get('body', '').lower().strip()
         
-        # SYSTEM WEBHOOK - Only handle onboarding and system-level interactions
-        # Check if user is in onboarding process
-        onboarding_state = OnboardingState.objects(phone_number=phone_number).first()
-        if not onboarding_state:
-            # Check for system trigger words to start onboarding
-            message_text = ""
-            if 'text' in messages:
-                message_text = messages.get('text', {}).get('body', '').lower().strip()
-            
-            # Check for system button responses (welcome message buttons)
-            system_button_id = ""
-            if 'interactive' in messages:
-                interactive = messages.get('interactive', {})
-                if 'button_reply' in interactive:
-                    system_button_id = interactive['button_reply'].get('id', '')
-                elif 'list_reply' in interactive:
-                    system_button_id = interactive['list_reply'].get('id', '')
+        # Check for system button responses (welcome message buttons)
+        system_button_id = ""
+        if 'interactive' in messages:
+            interactive = messages.get('interactive', {})
+            if 'button_reply' in interactive:
+                system_button_id = interactive['button_reply'].get('id', '')
+            elif 'list_reply' in interactive:
+                system_button_id = interactive['list_reply'].get('id', '')
+        
+        # Handle initial trigger words for system onboarding
+        if message_text in ["hi", "hello", "sasabot", "start"]:
+            logger.info(f"System trigger word detected from {phone_number}: {message_text}")
+            return handle_system_onboarding_trigger(phone_number)
+        # Handle system welcome message button responses
+        elif system_button_id in ["about", "faqs", "onboarding"]:
+            logger.info(f"System button response detected from {phone_number}: {system_button_id}")
+            return handle_system_message({
+                'phone_number': phone_number,
+                'button_id': system_button_id
+            })
+        # Handle non-trigger text messages with GPT for general platform inquiries
+        elif message_text and 'text' in messages:
+            logger.info(f"Non-trigger text message from {phone_number}, sending to GPT: {message_text}")
+            return handle_system_message({
+                'phone_number': phone_number,
+                'message': messages.get('text', {}).get('body', '')
+            })
+        else:
+            # Ignore other types of messages (like media) - they should be handled by business-specific webhooks
+            logger.info(f"Ignoring non-text message from {phone_number} - should be handled by business webhook")
+            return jsonify({"status": "ok"}), 200
+    
+    # Handle onboarding interactions for users already in onboarding process
+    # Handle text messages
+    if 'text' in messages:
+        message = messages.get('text', {}).get('body', '')
+        if not phone_number or not message:
+            logger.error(f"Missing required fields: phone={phone_number}, message={message}")
+            return jsonify({"error": "Missing required fields"}), 400
             
-            # Handle initial trigger words for system onboarding
-            if message_text in ["hi", "hello", "sasabot", "start"]:
-                logger.info(f"System trigger word detected from {phone_number}: {message_text}")
-                return handle_system_onboarding_trigger(phone_number)
-            # Handle system welcome message button responses
-            elif system_button_id in ["about", "faqs", "onboarding"]:
-                logger.info(f"System button response detected from {phone_number}: {system_button_id}")
-                return handle_system_message({
-                    'phone_number': phone_number,
-                    'button_id': system_button_id
-                })
-            # Handle non-trigger text messages with GPT for general platform inquiries
-            elif message_text and 'text' in messages:
-                logger.info(f"Non-trigger text message from {phone_number}, sending to GPT: {message_text}")
-                return handle_system_message({
-                    'phone_number': phone_number,
-                    'message': messages.get('text', {}).get('body', '')
-                })
-            else:
-                # Ignore other types of messages (like media) - they should be handled by business-specific webhooks
-                logger.info(f"Ignoring non-text message from {phone_number} - should be handled by business webhook")
-                return jsonify({"status": "ok"}), 200
-        
-        # Handle onboarding interactions for users already in onboarding process
-        # Handle text messages
-        if 'text' in messages:
-            message = messages.get('text', {}).get('body', '')
-            if not phone_number or not message:
-                logger.error(f"Missing required fields: phone={phone_number}, message={message}")
+        return handle_system_message({
+            'phone_number': phone_number,
+            'message': message
+        })
+    
+    # Handle button responses
+    elif 'interactive' in messages:
+        interactive = messages.get('interactive', {})
+        if 'button_reply' in interactive:
+            button_id = interactive['button_reply'].get('id')
+            if not phone_number or not button_id:
+                logger.error(f"Missing required fields: phone={phone_number}, button_id={button_id}")
                 return jsonify({"error": "Missing required fields"}), 400
                 
             return handle_system_message({
                 'phone_number': phone_number,
-                'message': message
+                'button_id': button_id
             })
-        
-        # Handle button responses
-        elif 'interactive' in messages:
-            interactive = messages.get('interactive', {})
-            if 'button_reply' in interactive:
-                button_id = interactive['button_reply'].get('id')
-                if not phone_number or not button_id:
-                    logger.error(f"Missing required fields: phone={phone_number}, button_id={button_id}")
-                    return jsonify({"error": "Missing required fields"}), 400
-                    
-                return handle_system_message({
-                    'phone_number': phone_number,
-                    'button_id': button_id
-                })
-            elif 'list_reply' in interactive:
-                list_id = interactive['list_reply'].get('id')
-                if not phone_number or not list_id:
-                    logger.error(f"Missing required fields: phone={phone_number}, list_id={list_id}")
-                    return jsonify({"error": "Missing required fields"}), 400
-                    
-                return handle_system_message({
-                    'phone_number': phone_number,
-                    'button_id': list_id  # Use same parameter name for consistency
-                })
-        
-        logger.info("System webhook ignoring non-onboarding message")
-        return jsonify({"status": "ok"}), 200
-        
-    except Exception as e:
-        logger.error(f"Error processing WhatsApp webhook: {str(e)}")
-        return jsonify({"error": "Internal server error"}), 500
+        elif 'list_reply' in interactive:
+            list_id = interactive['list_reply'].get('id')
+            if not phone_number or not list_id:
+                logger.error(f"Missing required fields: phone={phone_number}, list_id={list_id}")
+                return jsonify({"error": "Missing required fields"}), 400
+                
+            return handle_system_message({
+                'phone_number': phone_number,
+                'button_id': list_id  # Use same parameter name for consistency
+            })
+    
+    logger.info("System webhook ignoring non-onboarding message")
+    return jsonify({"status": "ok"}), 200
 
 def send_whatsapp_interactive_message(phone_number, header, body, footer, buttons):
     """
@@ -481,11 +465,7 @@ def send_whatsapp_interactive_message(phone_number, header, body, footer, button
         if not validate_whatsapp_config():
             raise ValueError("WhatsApp configuration is incomplete")
         
-        WHATSAPP_API_URL = f"https://graph.facebook.com/v17.0/{os.getenv('WHATSAPP_PHONE_ID')}/messages"
-        headers = {
-            "Authorization": f"Bearer {os.getenv('WHATSAPP_ACCESS_TOKEN')}",
-            "Content-Type": "application/json"
-        }
+        phone_id, access_token = get_system_credentials()
         
         # Validate and truncate text lengths according to WhatsApp limits
         # Header: 60 characters max
@@ -565,7 +545,7 @@ def send_whatsapp_interactive_message(phone_number, header, body, footer, button
         }
         
         logger.info(f"Sending WhatsApp interactive message payload: {payload}")
-        response = requests.post(WHATSAPP_API_URL, json=payload, headers=headers)
+        response = get_whatsapp_client().send_message(phone_id, access_token, payload)
         
         if response.status_code != 200:
             logger.error(f"WhatsApp API error response: {response.text}")
@@ -598,11 +578,7 @@ def send_whatsapp_text_message(phone_number, message):
     Send a simple text message via WhatsApp
     """
     try:
-        WHATSAPP_API_URL = f"https://graph.facebook.com/v17.0/{os.getenv('WHATSAPP_PHONE_ID')}/messages"
-        headers = {
-            "Authorization": f"Bearer {os.getenv('WHATSAPP_ACCESS_TOKEN')}",
-            "Content-Type": "application/json"
-        }
+        phone_id, access_token = get_system_credentials()
         
         payload = {
             "messaging_product": "whatsapp",
@@ -611,7 +587,7 @@ def send_whatsapp_text_message(phone_number, message):
             "text": {"body": message}
         }
         
-        response = requests.post(WHATSAPP_API_URL, json=payload, headers=headers)
+        response = get_whatsapp_client().send_message(phone_id, access_token, payload)
         response.raise_for_status()
         return response.json()
         
@@ -624,11 +600,7 @@ def send_whatsapp_document(phone_number, document_url, filename, caption=""):
     Send a document via WhatsApp
     """
     try:
-        WHATSAPP_API_URL = f"https://graph.facebook.com/v17.0/{os.getenv('WHATSAPP_PHONE_ID')}/messages"
-        headers = {
-            "Authorization": f"Bearer {os.getenv('WHATSAPP_ACCESS_TOKEN')}",
-            "Content-Type": "application/json"
-        }
+        phone_id, access_token = get_system_credentials()
         
         payload = {
             "messaging_product": "whatsapp",
@@ -641,7 +613,7 @@ def send_whatsapp_document(phone_number, document_url, filename, caption=""):
             }
         }
         
-        response = requests.post(WHATSAPP_API_URL, json=payload, headers=headers)
+        response = get_whatsapp_client().send_message(phone_id, access_token, payload)
         response.raise_for_status()
         return response.json()
         
@@ -920,12 +892,6 @@ def log_chat_message(session_id, sender_type, message_text, message_type='text',
     """Log a chat message to the database"""
     
     try:
-        # Find the chat session
-        session = ChatSession.objects(session_id=session_id).first()
-        if not session:
-            logger.error(f"Chat session not found: {session_id}")
-            return None
-        
         # Create the message
         message = ChatMessage(
             sender_type=sender_type,
@@ -934,9 +900,10 @@ def log_chat_message(session_id, sender_type, message_text, message_type='text',
             button_data=button_data
         )
         
-        # Add message to session
-        session.messages.append(message)
-        session.save()
+        # Add message to the session in a single update
+        if ChatSession.append_messages(session_id, [message]) is None:
+            logger.error(f"Chat session not found: {session_id}")
+            return None
         return message
         
     except Exception as e:
@@ -1035,11 +1002,7 @@ def send_whatsapp_list_message(phone_number, header, body, footer, button_text,
     sections format: [{"title": "Section Title", "rows": [{"id": "row_id", "title": "Row Title", "description": "Row Description"}]}]
     """
     try:
-        WHATSAPP_API_URL = f"https://graph.facebook.com/v17.0/{os.getenv('WHATSAPP_PHONE_ID')}/messages"
-        headers = {
-            "Authorization": f"Bearer {os.getenv('WHATSAPP_ACCESS_TOKEN')}",
-            "Content-Type": "application/json"
-        }
+        phone_id, access_token = get_system_credentials()
         
         payload = {
             "messaging_product": "whatsapp",
@@ -1064,7 +1027,7 @@ def send_whatsapp_list_message(phone_number, header, body, footer, button_text,
             }
         }
         
-        response = requests.post(WHATSAPP_API_URL, json=payload, headers=headers)
+        response = get_whatsapp_client().send_message(phone_id, access_token, payload)
         response.raise_for_status()
         return response.json()
         
@@ -1075,7 +1038,8 @@ def send_whatsapp_list_message(phone_number, header, body, footer, button_text,
 def handle_product_variations(phone_number, product_id):
     """Handle product variations display with interactive buttons or list"""
     
-    product = Product.objects(id=product_id).first()
+    catalog = get_catalog_for_product(product_id)
+    product = catalog.get_product(product_id) if catalog else None
     if not product:
         return send_whatsapp_text_message(phone_number, "Product not found.")
     
@@ -1141,13 +1105,6 @@ def handle_product_customization(phone_number, product_id):
         f"Kindly describe what customizations you would like done to your {product.name}"
     )
 
-def is_trigger_word(message):
-    """
-    Check if the message contains trigger words
-    """
-    trigger_words = ["hi", "hello", "sasabot"]
-    return message.lower().strip() in trigger_words
-
 def clean_phone_number(phone_number):
     """
     Clean and format phone number while preserving international formats
@@ -1173,13 +1130,6 @@ def is_mpesa_number(message):
     cleaned = ''.join(filter(str.isdigit, message))
     return len(cleaned) in [9, 10, 12] and (cleaned.startswith('0') or cleaned.startswith('254'))
 
-def is_trigger_word(message):
-    """
-    Check if the message contains trigger words
-    """
-    trigger_words = ["hi", "hello", "sasabot"]
-    return message.lower().strip() in trigger_words
-
 # =============================================================================
 # DEPRECATED FUNCTIONS - FOR BUSINESS-SPECIFIC WEBHOOKS ONLY
 # These functions should NOT be called from the system webhook
@@ -1418,18 +1368,12 @@ def initiate_variation_purchase(phone_number, variation_id):
     
     try:
         # Find the product that contains this variation
-        product = Product.objects(variations__variation_id=variation_id).first()
+        catalog = get_catalog_for_variation(variation_id)
+        product, variation = catalog.get_variation(variation_id) if catalog else (None, None)
         if not product:
             return send_whatsapp_text_message(phone_number, "Product not found.")
         
-        # Find the specific variation
-        variation = None
-        for var in product.variations:
-            if var.variation_id == variation_id and var.is_active:
-                variation = var
-                break
-        
-        if not variation:
+        if not variation or not variation.is_active:
             return send_whatsapp_text_message(phone_number, "Sorry, this variation is not available.")
         
         # Get or create customer
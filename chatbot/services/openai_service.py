@@ -1,9 +1,11 @@
 import os
 import logging
+import threading
+import httpx
 from openai import OpenAI
 from dotenv import load_dotenv
 from models import Business, Product, ProductVariation, Category, Order, Customer, ChatSession, ChatMessage
-import re
+from services.intent_engine import determine_intent, extract_product_id, is_platform_inquiry
 
 # GPT CONVERSATION TYPES:
 # 1. System-level GPT (process_system_gpt_interaction): 
@@ -18,56 +20,71 @@ import re
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+# Process-wide OpenAI clients
+# Clients are created lazily, one per (base_url, api_key), and reused for
+# every message so requests share a keep-alive httpx connection pool instead
+# of paying a TLS handshake each time. A forked worker (gunicorn pre-fork)
+# must not reuse its parent's sockets, so clients are dropped in the child.
+_openai_clients = {}
+_openai_clients_lock = threading.Lock()
+_openai_clients_pid = os.getpid()
+
+def _build_http_client():
+    """httpx client with a pooled, keep-alive transport configured from the environment"""
+    timeout = httpx.Timeout(
+        float(os.getenv('OPENAI_TIMEOUT', 30)),
+        connect=float(os.getenv('OPENAI_CONNECT_TIMEOUT', 5))
+    )
+    limits = httpx.Limits(
+        max_connections=int(os.getenv('OPENAI_MAX_CONNECTIONS', 20)),
+        max_keepalive_connections=int(os.getenv('OPENAI_MAX_KEEPALIVE_CONNECTIONS', 10)),
+        keepalive_expiry=float(os.getenv('OPENAI_KEEPALIVE_EXPIRY', 30))
+    )
+    # trust_env=False ignores HTTP(S)_PROXY, which used to be stripped from
+    # os.environ around every client construction
+    return httpx.Client(timeout=timeout, limits=limits, trust_env=False)
+
+def reset_openai_clients():
+    """Drop cached clients; called in forked children and usable from worker hooks"""
+    global _openai_clients, _openai_clients_lock, _openai_clients_pid
+    _openai_clients = {}
+    _openai_clients_lock = threading.Lock()
+    _openai_clients_pid = os.getpid()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_openai_clients)
+
 def initialize_openai_client():
-    """Initialize OpenAI client with proper configuration"""
-    try:
-        # Get API key from environment
-        api_key = os.getenv('OPENAI_API_KEY')
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY environment variable is not set")
-        
-        # Clear any proxy-related environment variables that might interfere
-        proxy_env_vars = ['HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy']
-        original_proxy_values = {}
-        for var in proxy_env_vars:
-            if var in os.environ:
-                original_proxy_values[var] = os.environ[var]
-                logger.debug(f"Temporarily clearing {var}={os.environ[var]}")
-                del os.environ[var]
-        
-        try:
-            # Create client with explicit parameters to avoid unexpected kwargs
-            client_kwargs = {
-                'api_key': api_key
-            }
-            
-            # Explicitly set base_url if needed (optional)
-            base_url = os.getenv('OPENAI_BASE_URL')
-            if base_url:
-                client_kwargs['base_url'] = base_url
-            
-            # Initialize client with controlled parameters
+    """Shared OpenAI client for the configured API key and base URL"""
+    api_key = os.getenv('OPENAI_API_KEY')
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY environment variable is not set")
+    base_url = os.getenv('OPENAI_BASE_URL') or None
+
+    if _openai_clients_pid != os.getpid():
+        reset_openai_clients()
+
+    key = (base_url, api_key)
+    client = _openai_clients.get(key)
+    if client is not None:
+        return client
+
+    with _openai_clients_lock:
+        client = _openai_clients.get(key)
+        if client is None:
             try:
-                client = OpenAI(**client_kwargs)
-                logger.info("OpenAI client initialized successfully")
-                return client
-            except TypeError as te:
-                # Handle case where unexpected parameters are being passed
-                logger.warning(f"TypeError during OpenAI client initialization: {str(te)}")
-                # Fallback to minimal initialization
-                client = OpenAI(api_key=api_key)
-                logger.info("OpenAI client initialized with fallback method")
-                return client
-                
-        finally:
-            # Restore original proxy environment variables
-            for var, value in original_proxy_values.items():
-                os.environ[var] = value
-                logger.debug(f"Restored {var}={value}")
-            
-    except Exception as e:
-        logger.error(f"Failed to initialize OpenAI client: {str(e)}")
-        raise
+                client = OpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    max_retries=int(os.getenv('OPENAI_MAX_RETRIES', 2)),
+                    http_client=_build_http_client()
+                )
+            except Exception as e:
+                logger.error(f"Failed to initialize OpenAI client: {str(e)}")
+                raise
+            _openai_clients[key] = client
+            logger.info("OpenAI client initialized successfully")
+        return client
 
 def process_gpt_interaction(phone_number, message, business_id=None):
     """
@@ -89,35 +106,27 @@ def process_gpt_interaction(phone_number, message, business_id=None):
         if not business_id:
             business = Business.objects().first()  # For now, use first business
         else:
-            business = Business.objects(id=business_id).first()
+            from services.business_cache import get_cached_business
+            business = get_cached_business(business_id)
         
         if not business:
             from services.messaging_service import send_whatsapp_text_message
             return send_whatsapp_text_message(phone_number, "Sorry, I couldn't find the business information.")
         
-        # Get or create chat session using MongoEngine
-        from models import ChatSession
-        session = ChatSession.objects(
+        # Find the chat session id without loading the session; it is
+        # created by the first append when missing
+        from models import ChatSession, ChatMessage
+        session_id = ChatSession.objects(
             customer=customer.id,
             business=business.id
-        ).first()
-        
-        if not session:
-            session = ChatSession(
-                customer=customer.id,
-                business=business.id,
-                session_id=f"{customer.id}_{business.id}_{phone_number}"
-            )
-            session.save()
+        ).scalar('session_id').first() or f"{customer.id}_{business.id}_{phone_number}"
         
-        # Save customer message using MongoEngine (embedded in session)
-        from models import ChatMessage
+        # Save customer message
         customer_message = ChatMessage(
             sender_type='customer',
             message_text=message
         )
-        session.messages.append(customer_message)
-        session.save()
+        ChatSession.append_messages(session_id, [customer_message], customer=customer, business=business)
         
         # Get business custom instructions
         custom_instructions = business.custom_instructions or "You are a helpful customer service assistant."
@@ -142,44 +151,66 @@ def process_gpt_interaction(phone_number, message, business_id=None):
             if product_id:
                 return handle_product_details(phone_number, product_id, business.id)
         
+        # Repeated questions are answered from the response cache
+        from services.business_messaging_service import send_business_whatsapp_text_message
+        from services.response_cache import is_response_cache_enabled, get_cached_response, store_response
+        cache_key = None
+        if is_response_cache_enabled():
+            cached_response, cache_key = get_cached_response(business, message)
+            if cached_response:
+                ChatSession.append_messages(session_id, [ChatMessage(sender_type='gpt', message_text=cached_response)])
+                send_business_whatsapp_text_message(phone_number, cached_response, business)
+                return cached_response
+        
         # Business-specific GPT response using fine-tuned model
-        # Build conversation history for context
-        conversation_messages = [
-            {"role": "system", "content": f"{business_context}\n\nYou are a customer service assistant for {business.name}. Use the custom instructions to guide your responses. Keep responses helpful and business-focused. Handle customer inquiries, product questions, orders, and support for this specific business only."}
-        ]
+        # Build conversation history for context (last 10 exchanges to avoid
+        # token limits), loaded once for this turn
+        from services.chat_store import ConversationHistory
+        history = ConversationHistory(session_id, limit=20)
+        conversation_messages = history.to_openai_messages(
+            system_prompt=f"{business_context}\n\nYou are a customer service assistant for {business.name}. Use the custom instructions to guide your responses. Keep responses helpful and business-focused. Handle customer inquiries, product questions, orders, and support for this specific business only.",
+            current_message=message
+        )
         
-        # Add conversation history (limit to last 10 exchanges to avoid token limits)
-        recent_messages = session.messages[-20:] if len(session.messages) > 20 else session.messages
-        for msg in recent_messages:
-            if msg.sender_type == 'customer':
-                conversation_messages.append({"role": "user", "content": msg.message_text})
-            elif msg.sender_type == 'gpt':
-                conversation_messages.append({"role": "assistant", "content": msg.message_text})
+        completion_kwargs = {
+            'model': "ft:gpt-3.5-turbo-1106:meira-africa-education-solutions::AzJSAPGn", #Business Model
+            'messages': conversation_messages,
+            'max_tokens': 500,
+            'temperature': 0.7
+        }
         
-        # Add current message if not already added
-        if not recent_messages or recent_messages[-1].message_text != message:
-            conversation_messages.append({"role": "user", "content": message})
+        from services.gpt_streaming import is_streaming_enabled, stream_completion_to_whatsapp, StreamInterrupted
         
-        response = client.chat.completions.create(
-            model="ft:gpt-3.5-turbo-1106:meira-africa-education-solutions::AzJSAPGn", #Business Model
-            messages=conversation_messages,
-            max_tokens=500,
-            temperature=0.7
-        )
-        
-        gpt_response = response.choices[0].message.content
+        streaming = is_streaming_enabled()
+        if streaming:
+            # Send the reply sentence by sentence while it is generated
+            try:
+                gpt_response = stream_completion_to_whatsapp(
+                    client,
+                    lambda chunk: send_business_whatsapp_text_message(phone_number, chunk, business),
+                    **completion_kwargs
+                )
+            except StreamInterrupted as e:
+                # Keep the part the customer already received in the history
+                ChatSession.append_messages(session_id, [ChatMessage(sender_type='gpt', message_text=e.delivered)])
+                raise
+        else:
+            response = client.chat.completions.create(**completion_kwargs)
+            gpt_response = response.choices[0].message.content
         
-        # Save GPT response using MongoEngine (embedded in session)
+        # Save GPT response as a single message
         gpt_message = ChatMessage(
             sender_type='gpt',
             message_text=gpt_response
         )
-        session.messages.append(gpt_message)
-        session.save()
+        ChatSession.append_messages(session_id, [gpt_message])
         
-        # Send response via WhatsApp using business-specific messaging
-        from services.business_messaging_service import send_business_whatsapp_text_message
-        send_business_whatsapp_text_message(phone_number, gpt_response, business)
+        if cache_key:
+            store_response(cache_key, gpt_response)
+        
+        if not streaming:
+            # Send response via WhatsApp using business-specific messaging
+            send_business_whatsapp_text_message(phone_number, gpt_response, business)
         
         return gpt_response
     
@@ -225,10 +256,7 @@ def process_system_gpt_interaction(phone_number, message):
         """
         
         # Check if this is a simple platform inquiry
-        message_lower = message.lower()
-        platform_keywords = ['sasabot', 'platform', 'how does it work', 'what is this', 'help', 'support', 'features', 'benefits']
-        
-        if any(keyword in message_lower for keyword in platform_keywords):
+        if is_platform_inquiry(message):
             # This is a platform-related inquiry, process with GPT
             response = client.chat.completions.create(
                 model="ft:gpt-3.5-turbo-1106:meira-africa-education-solutions::AzJSAPGn",  # Sasabot Model
@@ -271,32 +299,6 @@ def process_system_gpt_interaction(phone_number, message):
                        "• Type 'onboarding' to register your business")
         return send_whatsapp_text_message(phone_number, fallback_msg)
 
-def determine_intent(message):
-    """Determine the intent of the customer message"""
-    message_lower = message.lower()
-    
-    # Order tracking keywords
-    order_keywords = ['order', 'tracking', 'track', 'status', 'delivery', 'ord']
-    if any(keyword in message_lower for keyword in order_keywords):
-        return 'order_tracking'
-    
-    # Product inquiry keywords
-    product_keywords = ['product', 'products', 'service', 'services', 'catalog', 'what do you sell', 'what do you offer']
-    if any(keyword in message_lower for keyword in product_keywords):
-        return 'product_inquiry'
-    
-    # Check if message contains product ID pattern
-    if re.search(r'\b[A-Z0-9]{4,}\b', message):
-        return 'product_id'
-    
-    return 'general'
-
-def extract_product_id(message):
-    """Extract product ID from message"""
-    pattern = r'\b([A-Z0-9]{4,})\b'
-    match = re.search(pattern, message.upper())
-    return match.group(1) if match else None
-
 def handle_order_tracking(phone_number, message, business_id):
     """Handle order tracking requests"""
     from services.messaging_service import send_whatsapp_text_message
@@ -304,10 +306,11 @@ def handle_order_tracking(phone_number, message, business_id):
 
 def handle_product_inquiry(phone_number, business_id):
     """Handle product/service inquiries"""
-    from models import Business, Category
+    from services.business_cache import get_cached_business
+    from services.catalog_cache import get_catalog
     
-    business = Business.objects(id=business_id).first()
-    categories = Category.objects(business=business_id)
+    business = get_cached_business(business_id)
+    categories = get_catalog(business_id).categories
     
     if not categories:
         from services.messaging_service import send_whatsapp_text_message
@@ -360,9 +363,9 @@ def handle_product_inquiry(phone_number, business_id):
 
 def handle_product_details(phone_number, product_id, business_id):
     """Handle product details request"""
-    from models import Product
+    from services.catalog_cache import get_catalog
     
-    product = Product.objects(product_id=product_id, business=business_id).first()
+    product = get_catalog(business_id).get_product_by_product_id(product_id)
     
     if not product:
         from services.messaging_service import send_whatsapp_text_message
@@ -391,9 +394,10 @@ def handle_product_details(phone_number, product_id, business_id):
 
 def handle_category_selection(phone_number, category_id):
     """Handle category selection"""
-    from models import Product
+    from services.catalog_cache import get_catalog_for_category
     
-    products = Product.objects(category=category_id, is_active=True)
+    catalog = get_catalog_for_category(category_id)
+    products = catalog.get_category_products(category_id) if catalog else []
     
     if not products:
         from services.messaging_service import send_whatsapp_text_message
@@ -413,10 +417,11 @@ def handle_category_selection(phone_number, category_id):
 
 def handle_see_all_categories(phone_number, business_id):
     """Handle 'See all options' button for categories - display as list"""
-    from models import Business, Category
+    from services.business_cache import get_cached_business
+    from services.catalog_cache import get_catalog
     
-    business = Business.objects(id=business_id).first()
-    categories = Category.objects(business=business_id)
+    business = get_cached_business(business_id)
+    categories = get_catalog(business_id).categories
     
     if not categories:
         from services.messaging_service import send_whatsapp_text_message
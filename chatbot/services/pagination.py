@@ -1,40 +1,63 @@
+import os
+import json
+import time
+import base64
+import threading
+from datetime import datetime
+from bson import ObjectId
+
 class Pagination:
     """
     A pagination utility class that mimics Flask-SQLAlchemy's pagination behavior
     for use with MongoEngine QuerySets.
+
+    Pages built with paginate_keyset() also carry opaque next/prev cursors;
+    their page number is only for display and their total may be an estimate.
     """
-    
-    def __init__(self, page, per_page, total, items):
+
+    def __init__(self, page, per_page, total, items, has_prev=None, has_next=None,
+                 next_cursor=None, prev_cursor=None, total_is_estimate=False):
         self.page = page
         self.per_page = per_page
         self.total = total
         self.items = list(items)
-        
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total_is_estimate = total_is_estimate
+        self._has_prev = has_prev
+        self._has_next = has_next
+
     @property
     def pages(self):
         """Total number of pages"""
-        return (self.total + self.per_page - 1) // self.per_page
-    
+        pages = (self.total + self.per_page - 1) // self.per_page
+        # An estimated total may lag behind the pages actually reached
+        return max(pages, self.page) if self.total_is_estimate else pages
+
     @property
     def has_prev(self):
         """Whether there's a previous page"""
+        if self._has_prev is not None:
+            return self._has_prev
         return self.page > 1
-    
+
     @property
     def has_next(self):
         """Whether there's a next page"""
+        if self._has_next is not None:
+            return self._has_next
         return self.page < self.pages
-    
+
     @property
     def prev_num(self):
         """Previous page number"""
         return self.page - 1 if self.has_prev else None
-    
+
     @property
     def next_num(self):
         """Next page number"""
         return self.page + 1 if self.has_next else None
-    
+
     def iter_pages(self, left_edge=2, left_current=2, right_current=3, right_edge=2):
         """
         Iterates over the page numbers in the pagination. This method yields
@@ -42,7 +65,7 @@ class Pagination:
         in the page numbers.
         """
         last = self.pages
-        
+
         for num in range(1, last + 1):
             if num <= left_edge or \
                (self.page - left_current - 1 < num < self.page + right_current) or \
@@ -52,3 +75,132 @@ class Pagination:
                 # Check if we need to add a gap
                 if num == left_edge + 1 or num == last - right_edge:
                     yield None
+
+# Keyset pagination
+# Pages are read newest first on (created_at, _id) and continue from the last
+# (or first) row of the previous page instead of skipping over every earlier
+# row, so page 500 costs the same as page 1 given an index ending in
+# (-created_at, -_id). Cursors are URL-safe base64 JSON holding that row's
+# key, the direction, the page number and the total, which is counted once:
+# estimated_document_count() for an unfiltered collection, otherwise a count
+# cached for PAGINATION_COUNT_TTL seconds.
+
+def encode_cursor(data):
+    raw = json.dumps(data, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Cursor contents, or None if the cursor is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        data = json.loads(raw)
+        data['id'] = ObjectId(data['id'])
+        data['created_at'] = datetime.fromisoformat(data['created_at']) if data.get('created_at') else None
+        if data.get('dir') not in ('next', 'prev'):
+            return None
+        return data
+    except Exception:
+        return None
+
+def _row_cursor(document, direction, page, total, is_estimate):
+    return encode_cursor({
+        'created_at': document.created_at.isoformat() if document.created_at else None,
+        'id': str(document.pk),
+        'dir': direction,
+        'page': page,
+        'total': total,
+        'estimate': is_estimate
+    })
+
+def _after(created_at, pk):
+    """Rows after a key in newest-first order (documents without created_at sort last)"""
+    from mongoengine.queryset.visitor import Q
+    if created_at is None:
+        return Q(created_at=None, id__lt=pk)
+    return Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk) | Q(created_at=None)
+
+def _before(created_at, pk):
+    """Rows before a key in newest-first order"""
+    from mongoengine.queryset.visitor import Q
+    if created_at is None:
+        return Q(created_at__ne=None) | Q(created_at=None, id__gt=pk)
+    return Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+
+_count_cache = {}
+_count_cache_lock = threading.Lock()
+
+def count_queryset(queryset):
+    """
+    Total of a queryset for page counts, returns (total, is_estimate)
+    Unfiltered collections use the collection metadata; filtered counts are
+    cached for PAGINATION_COUNT_TTL seconds.
+    """
+    query = queryset._query
+    collection = queryset._collection
+    if not query:
+        return collection.estimated_document_count(), True
+
+    ttl = int(os.getenv('PAGINATION_COUNT_TTL', 60))
+    key = (collection.name, json.dumps(query, sort_keys=True, default=str))
+    now = time.monotonic()
+    with _count_cache_lock:
+        cached = _count_cache.get(key)
+        if cached and cached[1] > now:
+            return cached[0], ttl > 0
+
+    total = queryset.count()
+    if ttl > 0:
+        with _count_cache_lock:
+            if len(_count_cache) > 10000:
+                _count_cache.clear()
+            _count_cache[key] = (total, now + ttl)
+    return total, False
+
+def paginate_keyset(queryset, cursor=None, page=1, per_page=20):
+    """
+    A page of queryset, newest first, positioned by an opaque cursor
+    Without a cursor, page > 1 (old ?page=N links) is served with skip once;
+    the links it renders are cursors again.
+    """
+    state = decode_cursor(cursor)
+    ordered = queryset.order_by('-created_at', '-id')
+
+    if state:
+        page = max(int(state.get('page') or 1), 1)
+        total = state.get('total')
+        is_estimate = bool(state.get('estimate'))
+        if state['dir'] == 'prev':
+            rows = list(queryset.filter(_before(state['created_at'], state['id'])).order_by('created_at', 'id').limit(per_page + 1))
+            has_prev = len(rows) > per_page
+            items = list(reversed(rows[:per_page]))
+            has_next = True
+            if not has_prev:
+                page = 1
+        else:
+            rows = list(ordered.filter(_after(state['created_at'], state['id'])).limit(per_page + 1))
+            has_next = len(rows) > per_page
+            items = rows[:per_page]
+            has_prev = True
+    else:
+        page = max(page or 1, 1)
+        total = None
+        rows = list(ordered.skip((page - 1) * per_page).limit(per_page + 1))
+        has_next = len(rows) > per_page
+        items = rows[:per_page]
+        has_prev = page > 1
+
+    if total is None:
+        total, is_estimate = count_queryset(queryset)
+
+    next_cursor = _row_cursor(items[-1], 'next', page + 1, total, is_estimate) if has_next and items else None
+    # Page 1 is linked without a cursor
+    prev_cursor = _row_cursor(items[0], 'prev', page - 1, total, is_estimate) if has_prev and items and page > 2 else None
+
+    return Pagination(
+        page, per_page, total, items,
+        has_prev=has_prev, has_next=has_next and bool(items),
+        next_cursor=next_cursor, prev_cursor=prev_cursor,
+        total_is_estimate=is_estimate
+    )
@@ -0,0 +1,291 @@
+import os
+import json
+import time
+import logging
+import threading
+from contextvars import ContextVar
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+# Per-request Mongo query instrumentation
+# A pymongo CommandListener attributes every command to the Flask request
+# that issued it: how many queries, how long they took in total and which
+# were slowest. In debug (or with QUERY_METRICS_HEADERS) the figures are
+# returned as X-DB-* response headers; otherwise each request is logged as a
+# JSON line. Per-route totals and a queries-per-request histogram of this
+# worker process are served in Prometheus text format at /metrics.
+
+# Upper bounds of the queries-per-request histogram
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# Commands that are not queries issued by the application
+IGNORED_COMMANDS = {'hello', 'ismaster', 'isMaster', 'ping', 'saslStart', 'saslContinue', 'endSessions'}
+
+def is_query_metrics_enabled():
+    """Whether Mongo commands are attributed to requests"""
+    return os.getenv('QUERY_METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+class RequestQueries:
+    """Mongo commands issued while serving one request"""
+
+    def __init__(self, route, max_slowest=3):
+        self.route = route
+        self.max_slowest = max_slowest
+        self.started_at = time.perf_counter()
+        self.count = 0
+        self.total_micros = 0
+        # [(micros, command, collection)], slowest first
+        self.slowest = []
+        # (connection, request id) -> (command, collection) of commands in flight
+        self.pending = {}
+
+    def record(self, command, collection, micros):
+        self.count += 1
+        self.total_micros += micros
+        if len(self.slowest) < self.max_slowest or micros > self.slowest[-1][0]:
+            self.slowest.append((micros, command, collection))
+            self.slowest.sort(key=lambda entry: entry[0], reverse=True)
+            del self.slowest[self.max_slowest:]
+
+    @property
+    def db_ms(self):
+        return round(self.total_micros / 1000, 2)
+
+    def summary(self):
+        return {
+            'route': self.route,
+            'queries': self.count,
+            'db_ms': self.db_ms,
+            'duration_ms': round((time.perf_counter() - self.started_at) * 1000, 2),
+            'slowest': [
+                {'command': command, 'collection': collection, 'ms': round(micros / 1000, 2)}
+                for micros, command, collection in self.slowest
+            ]
+        }
+
+_current = ContextVar('request_queries', default=None)
+
+class QueryListener(monitoring.CommandListener):
+    """Attributes Mongo commands to the request being served on this thread"""
+
+    def started(self, event):
+        queries = _current.get()
+        if queries is None or event.command_name in IGNORED_COMMANDS:
+            return
+        target = event.command.get(event.command_name)
+        if not isinstance(target, str):
+            # getMore names its collection separately
+            target = event.command.get('collection', '')
+        queries.pending[(event.connection_id, event.request_id)] = (event.command_name, target)
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event)
+
+    def _finished(self, event):
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        get_query_metrics().record_command(event.command_name, event.duration_micros)
+        queries = _current.get()
+        if queries is None:
+            return
+        command, collection = queries.pending.pop((event.connection_id, event.request_id), (event.command_name, ''))
+        queries.record(command, collection, event.duration_micros)
+
+class QueryMetrics:
+    """Per-route request and query totals of this process, for /metrics"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # route -> totals
+        self.routes = {}
+        # (route, method, status) -> requests
+        self.responses = {}
+        # command -> [count, seconds], including background threads
+        self.commands = {}
+
+    def record_command(self, command, micros):
+        with self.lock:
+            totals = self.commands.setdefault(command, [0, 0.0])
+            totals[0] += 1
+            totals[1] += micros / 1e6
+
+    def record_request(self, queries, method, status):
+        summary = queries.summary()
+        with self.lock:
+            key = (queries.route, method, str(status))
+            self.responses[key] = self.responses.get(key, 0) + 1
+            totals = self.routes.setdefault(queries.route, {
+                'requests': 0,
+                'queries': 0,
+                'db_seconds': 0.0,
+                'duration_seconds': 0.0,
+                'max_queries': 0,
+                'buckets': [0] * len(QUERY_BUCKETS)
+            })
+            totals['requests'] += 1
+            totals['queries'] += queries.count
+            totals['db_seconds'] += queries.total_micros / 1e6
+            totals['duration_seconds'] += summary['duration_ms'] / 1000
+            totals['max_queries'] = max(totals['max_queries'], queries.count)
+            for i, bound in enumerate(QUERY_BUCKETS):
+                if queries.count <= bound:
+                    totals['buckets'][i] += 1
+        return summary
+
+    def get_metrics(self):
+        """Per-route averages, most queries per request first"""
+        with self.lock:
+            routes = {route: dict(totals) for route, totals in self.routes.items()}
+        summary = []
+        for route, totals in routes.items():
+            requests = totals['requests'] or 1
+            summary.append({
+                'route': route,
+                'requests': totals['requests'],
+                'avg_queries': round(totals['queries'] / requests, 2),
+                'max_queries': totals['max_queries'],
+                'avg_db_ms': round(totals['db_seconds'] * 1000 / requests, 2),
+                'avg_duration_ms': round(totals['duration_seconds'] * 1000 / requests, 2)
+            })
+        summary.sort(key=lambda row: row['avg_queries'], reverse=True)
+        return summary
+
+    def render_prometheus(self):
+        """Metrics in the Prometheus text exposition format"""
+        with self.lock:
+            routes = {route: dict(totals, buckets=list(totals['buckets'])) for route, totals in self.routes.items()}
+            responses = dict(self.responses)
+            commands = {command: list(totals) for command, totals in self.commands.items()}
+
+        lines = [
+            '# HELP sasabot_http_requests_total Requests served, by route, method and status.',
+            '# TYPE sasabot_http_requests_total counter'
+        ]
+        for (route, method, status), count in sorted(responses.items()):
+            lines.append(f"sasabot_http_requests_total{{route=\"{_label(route)}\",method=\"{method}\",status=\"{status}\"}} {count}")
+
+        lines += [
+            '# HELP sasabot_http_request_duration_seconds_total Time spent serving requests, by route.',
+            '# TYPE sasabot_http_request_duration_seconds_total counter'
+        ]
+        for route, totals in sorted(routes.items()):
+            lines.append(f"sasabot_http_request_duration_seconds_total{{route=\"{_label(route)}\"}} {totals['duration_seconds']:.6f}")
+
+        lines += [
+            '# HELP sasabot_db_query_duration_seconds_total Time spent in Mongo commands, by route.',
+            '# TYPE sasabot_db_query_duration_seconds_total counter'
+        ]
+        for route, totals in sorted(routes.items()):
+            lines.append(f"sasabot_db_query_duration_seconds_total{{route=\"{_label(route)}\"}} {totals['db_seconds']:.6f}")
+
+        lines += [
+            '# HELP sasabot_db_queries_per_request Mongo commands issued per request, by route.',
+            '# TYPE sasabot_db_queries_per_request histogram'
+        ]
+        for route, totals in sorted(routes.items()):
+            label = _label(route)
+            for bound, count in zip(QUERY_BUCKETS, totals['buckets']):
+                lines.append(f"sasabot_db_queries_per_request_bucket{{route=\"{label}\",le=\"{bound}\"}} {count}")
+            lines.append(f"sasabot_db_queries_per_request_bucket{{route=\"{label}\",le=\"+Inf\"}} {totals['requests']}")
+            lines.append(f"sasabot_db_queries_per_request_sum{{route=\"{label}\"}} {totals['queries']}")
+            lines.append(f"sasabot_db_queries_per_request_count{{route=\"{label}\"}} {totals['requests']}")
+
+        lines += [
+            '# HELP sasabot_db_commands_total Mongo commands issued by this process, by command.',
+            '# TYPE sasabot_db_commands_total counter'
+        ]
+        for command, (count, _) in sorted(commands.items()):
+            lines.append(f"sasabot_db_commands_total{{command=\"{_label(command)}\"}} {count}")
+        lines += [
+            '# HELP sasabot_db_command_duration_seconds_total Time spent in Mongo commands, by command.',
+            '# TYPE sasabot_db_command_duration_seconds_total counter'
+        ]
+        for command, (_, seconds) in sorted(commands.items()):
+            lines.append(f"sasabot_db_command_duration_seconds_total{{command=\"{_label(command)}\"}} {seconds:.6f}")
+
+        return '\n'.join(lines) + '\n'
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+_metrics = QueryMetrics()
+_listener = None
+_listener_lock = threading.Lock()
+
+def get_query_metrics():
+    """Process-wide request/query totals"""
+    return _metrics
+
+def get_query_listeners():
+    """Event listeners to pass to the Mongo connection (empty when disabled)"""
+    global _listener
+    if not is_query_metrics_enabled():
+        return []
+    with _listener_lock:
+        if _listener is None:
+            _listener = QueryListener()
+        return [_listener]
+
+def init_query_metrics(app):
+    """Track the Mongo queries of every request and serve /metrics"""
+    from flask import g, request, Response
+
+    if not is_query_metrics_enabled():
+        return
+
+    max_slowest = int(os.getenv('QUERY_METRICS_SLOWEST', 3))
+    warn_queries = int(os.getenv('QUERY_METRICS_WARN_QUERIES', 50))
+    log_min_queries = int(os.getenv('QUERY_METRICS_LOG_MIN_QUERIES', 1))
+    headers_setting = os.getenv('QUERY_METRICS_HEADERS')
+
+    def headers_enabled():
+        if headers_setting is not None:
+            return headers_setting.lower() in ('1', 'true', 'yes')
+        return app.debug
+
+    @app.before_request
+    def start_query_tracking():
+        if request.endpoint == 'static':
+            return
+        g.query_tracking = _current.set(RequestQueries(request.endpoint or 'unmatched', max_slowest))
+
+    @app.after_request
+    def report_query_tracking(response):
+        queries = _current.get()
+        if queries is None:
+            return response
+        try:
+            summary = _metrics.record_request(queries, request.method, response.status_code)
+            if headers_enabled():
+                response.headers['X-DB-Queries'] = str(summary['queries'])
+                response.headers['X-DB-Time-Ms'] = str(summary['db_ms'])
+                response.headers['X-DB-Slowest'] = ', '.join(
+                    f"{entry['command']} {entry['collection']} {entry['ms']}ms" for entry in summary['slowest']
+                )
+            elif summary['queries'] >= log_min_queries:
+                summary.update({'event': 'request_queries', 'method': request.method, 'path': request.path, 'status': response.status_code})
+                if summary['queries'] >= warn_queries:
+                    logger.warning(json.dumps(summary))
+                else:
+                    logger.info(json.dumps(summary))
+        except Exception as e:
+            logger.error(f"Error reporting request queries: {str(e)}")
+        return response
+
+    @app.teardown_request
+    def stop_query_tracking(exc=None):
+        token = g.pop('query_tracking', None)
+        if token is not None:
+            _current.reset(token)
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        # Optional bearer token, so the endpoint can be exposed publicly
+        token = os.getenv('METRICS_TOKEN')
+        if token and request.headers.get('Authorization') != f"Bearer {token}":
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+        return Response(_metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
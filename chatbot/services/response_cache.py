@@ -0,0 +1,220 @@
+import os
+import re
+import math
+import time
+import zlib
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# GPT response cache
+# Many customers ask a business the same few questions (opening hours,
+# delivery, prices). Answers are cached per business under a fingerprint of
+# everything the reply depends on (business profile, custom instructions and
+# catalog version), so any change to those starts a fresh cache. The inputs
+# come from the cached business and catalog snapshot, so edits made in another
+# worker take effect when those caches refresh there (the business route cache
+# after 60s, the catalog per CATALOG_SHARED_VERSION / CATALOG_CACHE_TTL). Lookups try
+# the normalised question first and, when enabled, the most similar cached
+# question of that business using a small local embedding.
+
+def is_response_cache_enabled():
+    """Whether GPT replies may be served from the response cache"""
+    return os.getenv('RESPONSE_CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+
+def is_semantic_match_enabled():
+    """Whether near-duplicate questions may be answered from the cache"""
+    return os.getenv('RESPONSE_CACHE_SEMANTIC', 'false').lower() in ('1', 'true', 'yes')
+
+_PUNCTUATION = re.compile(r'[^\w\s]')
+_WHITESPACE = re.compile(r'\s+')
+
+def normalize_question(text):
+    """Lowercase, strip punctuation and collapse whitespace"""
+    text = _PUNCTUATION.sub(' ', (text or '').lower())
+    return _WHITESPACE.sub(' ', text).strip()
+
+def get_catalog_version(business_id):
+    """
+    Version of a business's catalog, changed by any product or category edit
+    Taken from the catalog snapshot, so it costs no query on a cache hit. A
+    change made in another worker is seen once that worker's snapshot is
+    refreshed (within CATALOG_VERSION_CHECK_INTERVAL, or CATALOG_CACHE_TTL
+    with CATALOG_SHARED_VERSION=false).
+    """
+    from services.catalog_cache import get_catalog
+    return get_catalog(business_id).content_version
+
+def business_fingerprint(business, catalog_version=None):
+    """Hash of the business data a GPT reply depends on"""
+    if catalog_version is None:
+        catalog_version = get_catalog_version(business.id)
+    parts = [
+        business.name or '',
+        business.description or '',
+        business.category or '',
+        business.custom_instructions or '',
+        str(catalog_version)
+    ]
+    return hashlib.sha1('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+def embed_text(text, dimensions=256):
+    """
+    Local embedding of a normalised question: hashed word and character
+    trigram counts, L2 normalised. Cheap, dependency free and good enough to
+    match rephrasings such as "what time do you open" / "what time are you open".
+    """
+    vector = {}
+    words = text.split()
+    features = words + [f"#{text[i:i + 3]}" for i in range(max(len(text) - 2, 0))]
+    for feature in features:
+        index = zlib.crc32(feature.encode('utf-8')) % dimensions
+        vector[index] = vector.get(index, 0.0) + 1.0
+
+    norm = math.sqrt(sum(value * value for value in vector.values()))
+    if not norm:
+        return {}
+    return {index: value / norm for index, value in vector.items()}
+
+def cosine_similarity(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(value * b.get(index, 0.0) for index, value in a.items())
+
+class ResponseCache:
+    """Per-process TTL/LRU cache of GPT replies"""
+
+    def __init__(self, max_entries=5000, ttl=3600, similarity_threshold=0.9, min_words=3):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.min_words = min_words
+        self.lock = threading.Lock()
+        # (business_id, fingerprint, question) -> (response, vector, expires_at)
+        self.entries = OrderedDict()
+        self.stats = {
+            'exact_hits': 0,
+            'semantic_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0
+        }
+
+    def is_cacheable(self, question):
+        # Very short messages ("yes", "the red one") depend on the conversation
+        return len(question.split()) >= self.min_words
+
+    def get(self, business_id, fingerprint, question, semantic=False):
+        """Cached reply for a normalised question, or None"""
+        if not self.is_cacheable(question):
+            return None
+
+        key = (str(business_id), fingerprint, question)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[2] > now:
+                self.entries.move_to_end(key)
+                self.stats['exact_hits'] += 1
+                return entry[0]
+            if entry:
+                del self.entries[key]
+                self.stats['expirations'] += 1
+
+            if semantic:
+                match = self._nearest(key, embed_text(question), now)
+                if match:
+                    self.entries.move_to_end(match)
+                    self.stats['semantic_hits'] += 1
+                    return self.entries[match][0]
+
+            self.stats['misses'] += 1
+            return None
+
+    def _nearest(self, key, vector, now):
+        """Most similar live entry of the same business and fingerprint above the threshold"""
+        best, best_score = None, self.similarity_threshold
+        for other, (response, other_vector, expires_at) in self.entries.items():
+            if other[:2] != key[:2] or expires_at <= now or not other_vector:
+                continue
+            score = cosine_similarity(vector, other_vector)
+            if score >= best_score:
+                best, best_score = other, score
+        return best
+
+    def set(self, business_id, fingerprint, question, response, semantic=False):
+        if not response or not self.is_cacheable(question):
+            return
+
+        key = (str(business_id), fingerprint, question)
+        vector = embed_text(question) if semantic else None
+        with self.lock:
+            self.entries[key] = (response, vector, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            self.stats['stores'] += 1
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def invalidate_business(self, business_id):
+        """Drop every cached reply of a business, returns the number removed"""
+        business_id = str(business_id)
+        with self.lock:
+            keys = [key for key in self.entries if key[0] == business_id]
+            for key in keys:
+                del self.entries[key]
+            self.stats['invalidations'] += 1
+        return len(keys)
+
+    def get_metrics(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self.entries)
+        hits = stats['exact_hits'] + stats['semantic_hits']
+        lookups = hits + stats['misses']
+        stats['hit_rate'] = round(hits / lookups, 4) if lookups else 0
+        return stats
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_response_cache():
+    """Process-wide response cache configured from the environment"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(
+                max_entries=int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 5000)),
+                ttl=int(os.getenv('RESPONSE_CACHE_TTL', 3600)),
+                similarity_threshold=float(os.getenv('RESPONSE_CACHE_SIMILARITY', 0.9)),
+                min_words=int(os.getenv('RESPONSE_CACHE_MIN_WORDS', 3))
+            )
+        return _cache
+
+def get_cached_response(business, question):
+    """
+    Cached GPT reply for a customer question to a business
+    Returns (response, cache_key); pass cache_key to store_response on a miss.
+    """
+    fingerprint = business_fingerprint(business)
+    normalized = normalize_question(question)
+    response = get_response_cache().get(business.id, fingerprint, normalized, semantic=is_semantic_match_enabled())
+    return response, (business.id, fingerprint, normalized)
+
+def store_response(cache_key, response):
+    business_id, fingerprint, normalized = cache_key
+    get_response_cache().set(business_id, fingerprint, normalized, response, semantic=is_semantic_match_enabled())
+
+def invalidate_business_responses(business_id):
+    """Forget the cached replies of a business after its profile or catalog changed"""
+    try:
+        removed = get_response_cache().invalidate_business(business_id)
+        if removed:
+            logger.info(f"Invalidated {removed} cached responses for business {business_id}")
+    except Exception as e:
+        logger.error(f"Error invalidating response cache for business {business_id}: {str(e)}")
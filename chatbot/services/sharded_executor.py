@@ -0,0 +1,147 @@
+import os
+import time
+import zlib
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+# Per-conversation ordered execution
+# Work is routed to one of N single-threaded shards by a stable hash of its key
+# (business id, phone number). Everything for one conversation therefore runs
+# serially and in submission order, while different conversations run in
+# parallel on the other shards.
+
+def shard_for_key(key, shard_count):
+    """Stable shard index for a key (same result in every process)"""
+    if isinstance(key, (tuple, list)):
+        key = '|'.join(str(part) for part in key)
+    return zlib.crc32(str(key).encode('utf-8')) % shard_count
+
+class _Shard:
+    """A single worker thread with its own FIFO queue and metrics"""
+
+    def __init__(self, index):
+        self.index = index
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.processed = 0
+        self.failed = 0
+        self.busy = False
+        self.total_wait = 0.0
+        self.total_run = 0.0
+        self.max_wait = 0.0
+        self.max_run = 0.0
+        self.thread = threading.Thread(
+            target=self._run,
+            name=f"conversation-shard-{index}",
+            daemon=True
+        )
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            task = self.queue.get()
+            if task is None:
+                break
+
+            future, fn, args, kwargs, enqueued_at = task
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            started_at = time.monotonic()
+            self.busy = True
+            try:
+                future.set_result(fn(*args, **kwargs))
+                failed = False
+            except BaseException as e:
+                future.set_exception(e)
+                failed = True
+            finally:
+                self.busy = False
+
+            finished_at = time.monotonic()
+            wait = started_at - enqueued_at
+            run = finished_at - started_at
+            with self.lock:
+                self.processed += 1
+                if failed:
+                    self.failed += 1
+                self.total_wait += wait
+                self.total_run += run
+                self.max_wait = max(self.max_wait, wait)
+                self.max_run = max(self.max_run, run)
+
+    def stats(self):
+        with self.lock:
+            processed = self.processed
+            return {
+                'shard': self.index,
+                'queue_depth': self.queue.qsize(),
+                'busy': self.busy,
+                'processed': processed,
+                'failed': self.failed,
+                'avg_wait_ms': round(self.total_wait / processed * 1000, 2) if processed else 0,
+                'avg_run_ms': round(self.total_run / processed * 1000, 2) if processed else 0,
+                'max_wait_ms': round(self.max_wait * 1000, 2),
+                'max_run_ms': round(self.max_run * 1000, 2)
+            }
+
+class ShardedExecutor:
+    """Executor that serialises work per key and parallelises across keys"""
+
+    def __init__(self, shard_count=8):
+        self.shard_count = max(1, int(shard_count))
+        self._shards = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _get_shards(self):
+        # Threads do not survive a fork, so gunicorn workers get their own shards
+        with self._lock:
+            if self._shards is None or self._pid != os.getpid():
+                self._shards = [_Shard(i) for i in range(self.shard_count)]
+                self._pid = os.getpid()
+            return self._shards
+
+    def submit(self, key, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) on the shard owning key, returns a Future"""
+        shards = self._get_shards()
+        future = Future()
+        shard = shards[shard_for_key(key, self.shard_count)]
+        shard.queue.put((future, fn, args, kwargs, time.monotonic()))
+        return future
+
+    def shutdown(self):
+        with self._lock:
+            if self._shards and self._pid == os.getpid():
+                for shard in self._shards:
+                    shard.queue.put(None)
+            self._shards = None
+
+    def get_metrics(self):
+        """Per-shard queue depth and latency figures"""
+        shards = self._shards if self._pid == os.getpid() and self._shards else []
+        shard_stats = [shard.stats() for shard in shards]
+        return {
+            'pid': os.getpid(),
+            'shard_count': self.shard_count,
+            'total_queue_depth': sum(stats['queue_depth'] for stats in shard_stats),
+            'total_processed': sum(stats['processed'] for stats in shard_stats),
+            'shards': shard_stats
+        }
+
+_conversation_executor = None
+_conversation_executor_lock = threading.Lock()
+
+def get_conversation_executor():
+    """Shared executor used for inbound conversation processing"""
+    global _conversation_executor
+    with _conversation_executor_lock:
+        if _conversation_executor is None:
+            _conversation_executor = ShardedExecutor(
+                shard_count=int(os.getenv('CONVERSATION_SHARDS', 8))
+            )
+        return _conversation_executor
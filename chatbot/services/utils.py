@@ -1,9 +1,19 @@
 import requests
 import os
+import sys
 import logging
 
 logger = logging.getLogger(__name__)
 
+def is_cli_command():
+    """
+    Whether this process is a `flask <command>` invocation (other than `flask run`)
+    Such processes exit when the command is done, so they must not start
+    background workers that claim queued work.
+    """
+    import click
+    return click.get_current_context(silent=True) is not None and 'run' not in sys.argv[1:]
+
 def format_phone_number(phone_number):
     """
     Format phone number while preserving international format
@@ -27,20 +37,21 @@ def format_phone_number(phone_number):
 def validate_whatsapp_webhook_data(data):
     """
     Validate the structure of incoming WhatsApp webhook data
+    Every entry and change is checked; the payload is valid when at least one
+    change carries messages or statuses.
     """
     if not data or 'entry' not in data:
         return False, "Missing 'entry'"
         
-    entry = data['entry'][0]
-    if 'changes' not in entry:
+    has_changes = False
+    for entry in data['entry']:
+        for change in entry.get('changes') or []:
+            has_changes = True
+            value = change.get('value')
+            if value and (value.get('messages') or value.get('statuses')):
+                return True, "Valid"
+                
+    if not has_changes:
         return False, "Missing 'changes'"
         
-    changes = entry['changes'][0]
-    if 'value' not in changes:
-        return False, "Missing 'value'"
-        
-    value = changes['value']
-    if 'messages' not in value:
-        return False, "Missing 'messages'"
-        
-    return True, "Valid"
+    return False, "Missing 'messages'"
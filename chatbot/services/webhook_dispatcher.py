@@ -0,0 +1,168 @@
+import logging
+from collections import OrderedDict
+from flask import current_app, has_app_context
+from services.sharded_executor import get_conversation_executor
+
+logger = logging.getLogger(__name__)
+
+# Batched WhatsApp webhook dispatcher
+# Meta can deliver several entries, changes, messages and statuses in a single
+# webhook call. Every event is extracted, grouped per (business, phone number)
+# and each group is handed to the conversation shard owning that key, so a
+# conversation is always processed serially (also across concurrent webhook
+# deliveries) while different conversations are processed in parallel.
+# Messages are recorded by their WhatsApp message id (wamid) once handled, so
+# a payload delivered or retried again skips the messages already handled.
+
+def _event_timestamp(item):
+    try:
+        return int(item.get('timestamp', 0))
+    except (TypeError, ValueError):
+        return 0
+
+def iter_webhook_events(data):
+    """Yield every message and status contained in a webhook payload"""
+    if not data or not isinstance(data, dict):
+        return
+
+    for entry in data.get('entry') or []:
+        for change in entry.get('changes') or []:
+            value = change.get('value') or {}
+            phone_number_id = (value.get('metadata') or {}).get('phone_number_id')
+
+            for message in value.get('messages') or []:
+                yield {
+                    'kind': 'message',
+                    'phone_number': message.get('from'),
+                    'phone_number_id': phone_number_id,
+                    'item': message
+                }
+
+            for status in value.get('statuses') or []:
+                yield {
+                    'kind': 'status',
+                    'phone_number': status.get('recipient_id'),
+                    'phone_number_id': phone_number_id,
+                    'item': status
+                }
+
+def group_webhook_events(data, business_key=None):
+    """
+    Group webhook events per (business, phone number)
+    Groups keep the order they first appear in; events inside a group are
+    sorted by their WhatsApp timestamp (stable for equal timestamps).
+    """
+    groups = OrderedDict()
+    for event in iter_webhook_events(data):
+        key = (business_key or event['phone_number_id'], event['phone_number'])
+        groups.setdefault(key, []).append(event)
+
+    for key in groups:
+        groups[key].sort(key=lambda event: _event_timestamp(event['item']))
+
+    return groups
+
+class WebhookBatchError(Exception):
+    """Some events of a webhook batch failed (raised only with raise_errors)"""
+
+def is_error_result(result):
+    """Whether a handler returned a server error response (status >= 500)"""
+    status = None
+    if isinstance(result, tuple) and len(result) > 1 and isinstance(result[1], int):
+        status = result[1]
+    elif hasattr(result, 'status_code'):
+        status = result.status_code
+    return status is not None and status >= 500
+
+def _message_key(key, event):
+    """Key a handled message is recorded under, None for statuses and messages without a wamid"""
+    wamid = event['item'].get('id') if event['kind'] == 'message' else None
+    return f"{key[0]}:{wamid}" if wamid else None
+
+def _claim_message(message_key):
+    """Whether a message still has to be handled (also when its record cannot be checked)"""
+    from models import ProcessedWebhookMessage
+    try:
+        return ProcessedWebhookMessage.claim(message_key)
+    except Exception as e:
+        logger.error(f"Error checking processed message {message_key}: {str(e)}")
+        return True
+
+def _finish_message(message_key, handled):
+    """Record a handled message, or release a failed one so a retry handles it"""
+    from models import ProcessedWebhookMessage
+    try:
+        if handled:
+            ProcessedWebhookMessage.mark_done(message_key)
+        else:
+            ProcessedWebhookMessage.release(message_key)
+    except Exception as e:
+        logger.error(f"Error recording processed message {message_key}: {str(e)}")
+
+def _process_group(app, key, events, handle_message, handle_status, raise_errors=False):
+    """Process the events of one conversation sequentially, skipping messages already handled"""
+    processed = 0
+    with app.app_context():
+        for event in events:
+            message_key = _message_key(key, event)
+            if message_key and not _claim_message(message_key):
+                logger.info(f"Skipping already handled message {message_key}")
+                continue
+            try:
+                if event['kind'] == 'message':
+                    result = handle_message(event['item'])
+                elif handle_status:
+                    result = handle_status(event['item'])
+                else:
+                    result = None
+                if is_error_result(result):
+                    raise RuntimeError(f"handler returned status {result[1] if isinstance(result, tuple) else result.status_code}")
+                if message_key:
+                    _finish_message(message_key, True)
+                processed += 1
+            except Exception as e:
+                if message_key:
+                    _finish_message(message_key, False)
+                logger.error(f"Error processing webhook {event['kind']} for {key}: {str(e)}", exc_info=True)
+                if raise_errors:
+                    # Stop this conversation; it is retried from the queue in order
+                    raise
+                # Otherwise one bad event must not stop the rest of the conversation
+    return processed
+
+def dispatch_webhook_batch(data, handle_message, handle_status=None, business_key=None, raise_errors=False):
+    """
+    Process every message and status in a webhook payload
+    handle_message/handle_status are called with the raw WhatsApp item.
+    Returns a summary dict with the number of conversations and events handled.
+    With raise_errors, a failing event (an exception or a status >= 500)
+    stops its conversation and WebhookBatchError is raised once every
+    conversation has finished.
+    """
+    groups = group_webhook_events(data, business_key)
+    summary = {'conversations': len(groups), 'events': 0, 'processed': 0}
+    if not groups:
+        return summary
+
+    summary['events'] = sum(len(events) for events in groups.values())
+    app = current_app._get_current_object() if has_app_context() else None
+    if app is None:
+        raise RuntimeError("dispatch_webhook_batch requires an application context")
+
+    executor = get_conversation_executor()
+    futures = [
+        (key, executor.submit(key, _process_group, app, key, events, handle_message, handle_status, raise_errors))
+        for key, events in groups.items()
+    ]
+    errors = []
+    for key, future in futures:
+        try:
+            summary['processed'] += future.result()
+        except Exception as e:
+            errors.append(f"{key}: {str(e)}")
+
+    if errors:
+        raise WebhookBatchError(f"{len(errors)} of {len(futures)} conversations failed: {'; '.join(errors)}"[:1000])
+
+    logger.info(f"Dispatched webhook batch: {summary}")
+    return summary
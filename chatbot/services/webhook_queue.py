@@ -0,0 +1,281 @@
+import os
+import queue
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta
+from mongoengine import Q
+
+logger = logging.getLogger(__name__)
+
+# Asynchronous inbound webhook pipeline
+# When WEBHOOK_ASYNC_MODE is enabled the WhatsApp webhook routes only validate
+# the payload, enqueue it and return 200 straight away. A pool of worker threads
+# in each gunicorn worker consumes the queue and runs the existing
+# process_whatsapp_message / process_business_whatsapp_message logic. An event
+# whose processing raises or returns a 5xx status is retried with backoff up to
+# WEBHOOK_MAX_ATTEMPTS times. A retried payload is dispatched again as a whole,
+# but messages already handled are recorded by their WhatsApp message id
+# (processed_webhook_messages) and skipped, so only the failed ones run again.
+
+def is_async_mode_enabled():
+    """Whether inbound webhooks should be queued instead of processed inline"""
+    return os.getenv('WEBHOOK_ASYNC_MODE', 'false').lower() in ('1', 'true', 'yes')
+
+class MongoQueueBackend:
+    """Durable queue stored in the inbound_webhooks collection"""
+
+    def __init__(self, visibility_timeout=300, max_attempts=3):
+        # Events stuck in 'processing' longer than this are handed out again
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+
+    def enqueue(self, source, payload, business_id=None):
+        from models import InboundWebhook
+        event = InboundWebhook(
+            source=source,
+            business_id=str(business_id) if business_id else None,
+            payload=payload
+        )
+        event.save()
+        return str(event.id)
+
+    def claim(self):
+        """Atomically lock the oldest available event, or return None"""
+        from models import InboundWebhook
+        now = datetime.utcnow()
+        stale_before = now - timedelta(seconds=self.visibility_timeout)
+
+        # A stalled event that used up its attempts (e.g. it kills the worker
+        # every time) is failed instead of being handed out again
+        InboundWebhook.objects(
+            status='processing', locked_at__lt=stale_before, attempts__gte=self.max_attempts
+        ).update(
+            set__status='failed',
+            set__last_error='Worker stopped while processing the event',
+            set__processed_at=now
+        )
+
+        event = InboundWebhook.objects(
+            (Q(status='pending') & Q(available_at__lte=now)) |
+            (Q(status='processing') & Q(locked_at__lt=stale_before) & Q(attempts__lt=self.max_attempts))
+        ).order_by('available_at').modify(
+            new=True,
+            set__status='processing',
+            set__locked_at=now,
+            inc__attempts=1
+        )
+
+        if not event:
+            return None
+
+        return {
+            'id': str(event.id),
+            'source': event.source,
+            'business_id': event.business_id,
+            'payload': event.payload,
+            'attempts': event.attempts
+        }
+
+    def complete(self, event_id):
+        from models import InboundWebhook
+        InboundWebhook.objects(id=event_id).update_one(
+            set__status='done',
+            set__processed_at=datetime.utcnow(),
+            unset__payload=True
+        )
+
+    def fail(self, event_id, attempts, error):
+        from models import InboundWebhook
+        if attempts >= self.max_attempts:
+            InboundWebhook.objects(id=event_id).update_one(
+                set__status='failed',
+                set__last_error=error[:1000],
+                set__processed_at=datetime.utcnow()
+            )
+            return
+
+        # Retry with exponential backoff: 2s, 4s, 8s...
+        retry_at = datetime.utcnow() + timedelta(seconds=2 ** attempts)
+        InboundWebhook.objects(id=event_id).update_one(
+            set__status='pending',
+            set__last_error=error[:1000],
+            set__available_at=retry_at
+        )
+
+class MemoryQueueBackend:
+    """Non-durable in-process queue, useful for local development"""
+
+    def __init__(self, max_attempts=3):
+        self.max_attempts = max_attempts
+        self._queue = queue.Queue()
+        # Claimed events by id, so a failed one can be put back
+        self._in_flight = {}
+
+    def enqueue(self, source, payload, business_id=None):
+        event_id = uuid.uuid4().hex
+        self._queue.put({
+            'id': event_id,
+            'source': source,
+            'business_id': str(business_id) if business_id else None,
+            'payload': payload,
+            'attempts': 0
+        })
+        return event_id
+
+    def claim(self):
+        try:
+            event = self._queue.get_nowait()
+        except queue.Empty:
+            return None
+        event['attempts'] += 1
+        self._in_flight[event['id']] = event
+        return event
+
+    def complete(self, event_id):
+        self._in_flight.pop(event_id, None)
+
+    def fail(self, event_id, attempts, error):
+        event = self._in_flight.pop(event_id, None)
+        if event is None or attempts >= self.max_attempts:
+            logger.error(f"In-memory webhook event {event_id} failed on attempt {attempts}: {error}")
+            return
+
+        # Retry with the same backoff as the Mongo backend: 2s, 4s, 8s...
+        logger.warning(f"In-memory webhook event {event_id} failed on attempt {attempts}, retrying: {error}")
+        timer = threading.Timer(2 ** attempts, self._queue.put, args=(event,))
+        timer.daemon = True
+        timer.start()
+
+def create_queue_backend():
+    """Build the queue backend selected by WEBHOOK_QUEUE_BACKEND"""
+    backend_name = os.getenv('WEBHOOK_QUEUE_BACKEND', 'mongo').lower()
+    max_attempts = int(os.getenv('WEBHOOK_MAX_ATTEMPTS', 3))
+
+    if backend_name == 'memory':
+        return MemoryQueueBackend(max_attempts=max_attempts)
+
+    return MongoQueueBackend(
+        visibility_timeout=int(os.getenv('WEBHOOK_VISIBILITY_TIMEOUT', 300)),
+        max_attempts=max_attempts
+    )
+
+def process_webhook_event(event):
+    """
+    Run the existing processing logic for one queued event
+    Waits until every conversation in the payload has been processed and
+    raises if any event failed, so the worker can retry the event.
+    """
+    from services.webhook_dispatcher import is_error_result
+    payload = event['payload']
+
+    if event['source'] == 'business':
+        from services.business_cache import get_cached_business
+        from services.business_messaging_service import process_business_whatsapp_message
+
+        business = get_cached_business(event['business_id'])
+        if not business:
+            logger.error(f"Business not found for queued webhook: {event['business_id']}")
+            return
+        result = process_business_whatsapp_message(payload, business, raise_errors=True)
+    else:
+        from services.messaging_service import process_whatsapp_message
+        result = process_whatsapp_message(payload, raise_errors=True)
+
+    if is_error_result(result):
+        raise RuntimeError(f"Webhook processing returned status {result[1] if isinstance(result, tuple) else result.status_code}")
+    return result
+
+class WebhookWorkerPool:
+    """Pool of daemon threads consuming the inbound webhook queue"""
+
+    def __init__(self, app, backend, size=4, poll_interval=1.0):
+        self.app = app
+        self.backend = backend
+        self.size = size
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the worker threads (again after a fork)"""
+        with self._lock:
+            if self._pid == os.getpid() and self._threads:
+                return
+
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._threads = []
+            for i in range(self.size):
+                thread = threading.Thread(
+                    target=self._run,
+                    name=f"webhook-worker-{i}",
+                    daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+            logger.info(f"Started {self.size} webhook worker threads in process {self._pid}")
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def enqueue(self, source, payload, business_id=None):
+        self.start()
+        event_id = self.backend.enqueue(source, payload, business_id)
+        self._wakeup.set()
+        return event_id
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                event = self.backend.claim()
+            except Exception as e:
+                logger.error(f"Error claiming webhook event: {str(e)}")
+                event = None
+
+            if not event:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            try:
+                with self.app.app_context():
+                    process_webhook_event(event)
+                self.backend.complete(event['id'])
+            except Exception as e:
+                logger.error(f"Error processing queued webhook {event['id']}: {str(e)}", exc_info=True)
+                try:
+                    self.backend.fail(event['id'], event['attempts'], str(e))
+                except Exception as fail_error:
+                    logger.error(f"Error recording webhook failure: {str(fail_error)}")
+
+_worker_pool = None
+
+def init_webhook_pipeline(app):
+    """Create and start the worker pool when async mode is enabled"""
+    from services.utils import is_cli_command
+    global _worker_pool
+
+    # CLI commands exit when done and would abandon any event they claimed
+    if not is_async_mode_enabled() or is_cli_command():
+        return None
+
+    _worker_pool = WebhookWorkerPool(
+        app,
+        create_queue_backend(),
+        size=int(os.getenv('WEBHOOK_WORKER_THREADS', 4)),
+        poll_interval=float(os.getenv('WEBHOOK_POLL_INTERVAL', 1.0))
+    )
+    _worker_pool.start()
+    return _worker_pool
+
+def enqueue_webhook(source, payload, business_id=None):
+    """Queue a webhook payload for background processing"""
+    if _worker_pool is None:
+        raise RuntimeError("Webhook pipeline is not initialised")
+    return _worker_pool.enqueue(source, payload, business_id)
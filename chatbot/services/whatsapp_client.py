@@ -0,0 +1,138 @@
+import os
+import time
+import random
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Shared WhatsApp Graph API client
+# All system and business senders go through this client so they reuse one
+# keep-alive connection pool per worker process instead of opening a new
+# TCP+TLS connection for every message.
+
+GRAPH_API_VERSION = os.getenv('WHATSAPP_GRAPH_API_VERSION', 'v17.0')
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+class WhatsAppClient:
+    """Pooled HTTP client for the WhatsApp Cloud API"""
+
+    def __init__(self, pool_size=20, connect_timeout=3.05, read_timeout=15,
+                 max_retries=3, backoff_base=0.5, backoff_max=8):
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        # Sockets must not be shared with a forked child, so each process
+        # builds its own session on first use
+        with self._lock:
+            if self._session is None or self._pid != os.getpid():
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=self.pool_size,
+                    pool_maxsize=self.pool_size,
+                    max_retries=0
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._session = session
+                self._pid = os.getpid()
+            return self._session
+
+    def _backoff(self, attempt, response=None):
+        """Full-jitter exponential backoff, honouring Retry-After when present"""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after:
+                try:
+                    return min(float(retry_after), self.backoff_max)
+                except ValueError:
+                    pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def post(self, url, payload, access_token):
+        """
+        POST a JSON payload with retries on 429/5xx and connection failures
+        Returns the final requests.Response; raises requests exceptions when
+        the request could not be completed at all.
+        """
+        headers = {
+            "Authorization": f"Bearer {access_token}",
+            "Content-Type": "application/json"
+        }
+
+        attempt = 0
+        while True:
+            try:
+                response = self.session.post(url, json=payload, headers=headers, timeout=self.timeout)
+            except requests.exceptions.ConnectionError as e:
+                # Only connection failures are retried; a read timeout is raised
+                # because the message may already have been delivered
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"WhatsApp API connection error, retrying in {delay:.2f}s: {str(e)}")
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                delay = self._backoff(attempt, response)
+                logger.warning(f"WhatsApp API returned {response.status_code}, retrying in {delay:.2f}s")
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            return response
+
+    def send_message(self, phone_id, access_token, payload):
+        """Send a message payload from the given WhatsApp phone number ID"""
+        url = f"https://graph.facebook.com/{GRAPH_API_VERSION}/{phone_id}/messages"
+        return self.post(url, payload, access_token)
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_whatsapp_client():
+    """Process-wide WhatsApp client configured from the environment"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = WhatsAppClient(
+                pool_size=int(os.getenv('WHATSAPP_POOL_SIZE', 20)),
+                connect_timeout=float(os.getenv('WHATSAPP_CONNECT_TIMEOUT', 3.05)),
+                read_timeout=float(os.getenv('WHATSAPP_READ_TIMEOUT', 15)),
+                max_retries=int(os.getenv('WHATSAPP_MAX_RETRIES', 3)),
+                backoff_base=float(os.getenv('WHATSAPP_BACKOFF_BASE', 0.5)),
+                backoff_max=float(os.getenv('WHATSAPP_BACKOFF_MAX', 8))
+            )
+        return _client
+
+def get_system_credentials():
+    """(phone_id, access_token) of the platform's own WhatsApp number"""
+    return os.getenv('WHATSAPP_PHONE_ID'), os.getenv('WHATSAPP_ACCESS_TOKEN')
+
+def get_business_credentials(business):
+    """
+    (phone_id, access_token) of a business, falling back to the platform number
+    business may be a loaded Business or just its id, which is resolved
+    through the business routing cache.
+    """
+    if not hasattr(business, 'whatsapp_phone_id'):
+        from services.business_cache import get_business_route
+        business = get_business_route(getattr(business, 'id', business))
+    phone_id = (business and business.whatsapp_phone_id) or os.getenv('WHATSAPP_PHONE_ID')
+    access_token = (business and business.whatsapp_api_token) or os.getenv('WHATSAPP_ACCESS_TOKEN')
+    return phone_id, access_token
@@ -0,0 +1,58 @@
+import os
+import sys
+
+import pytest
+
+try:
+    from pymongo.monitoring import CommandListener
+except ImportError:
+    # Tests needing Mongo are skipped without pymongo
+    CommandListener = object
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+class QueryCounter(CommandListener):
+    """Counts the queries sent to the server"""
+
+    QUERY_COMMANDS = {'find', 'aggregate', 'count', 'distinct', 'getMore'}
+
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        if event.command_name in self.QUERY_COMMANDS:
+            self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def queries(self, fn):
+        """fn's result and the number of queries it issued"""
+        before = self.count
+        result = fn()
+        return result, self.count - before
+
+@pytest.fixture(scope='session')
+def mongo():
+    """Throwaway database on MONGODB_TEST_URI (default localhost), skips when no server is reachable"""
+    pytest.importorskip('mongoengine')
+    from mongoengine import connect, disconnect
+    from pymongo.errors import PyMongoError
+
+    counter = QueryCounter()
+    uri = os.getenv('MONGODB_TEST_URI', 'mongodb://localhost:27017/sasabot_test')
+    client = connect(host=uri, event_listeners=[counter], serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command('ping')
+    except PyMongoError:
+        disconnect()
+        pytest.skip(f"No MongoDB server at {uri}")
+
+    db = client.get_default_database()
+    client.drop_database(db.name)
+    yield db, counter
+    client.drop_database(db.name)
+    disconnect()
@@ -0,0 +1,94 @@
+"""
+Query-count guards for the system dashboard analytics
+
+The top businesses and the revenue chart must stay a single aggregation
+however many orders and businesses match (no per-business/per-day queries),
+and give the same figures from the raw orders and from the daily rollups.
+Needs a MongoDB server, see the `mongo` fixture.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('mongoengine')
+from bson import ObjectId
+
+@pytest.fixture
+def seeded(mongo):
+    """
+    Paid and pending orders spread over several businesses and days, with
+    the rollups rebuilt from them. Yields the business ids, the query
+    counter and the expected paid revenue per business and per day.
+    """
+    from services.daily_stats import rebuild_daily_stats
+    db, counter = mongo
+    now = datetime.utcnow()
+    business_ids = [ObjectId() for _ in range(5)]
+    orders = [
+        {
+            'order_number': f"TEST{i:06d}",
+            'business': business_ids[i % 5],
+            'customer': ObjectId(),
+            # Business n sells at 100 * (n + 1), so revenue ranks them in reverse
+            'total_amount': 100.0 * (i % 5 + 1),
+            'status': 'completed',
+            'payment_status': 'paid' if i % 4 else 'pending',
+            'created_at': now - timedelta(days=i % 20, minutes=i),
+            'order_items': []
+        }
+        for i in range(200)
+    ]
+    db.businesses.insert_many([{'_id': business_id, 'name': f"Business {i}"} for i, business_id in enumerate(business_ids)])
+    db.orders.insert_many(orders)
+    rebuild_daily_stats()
+
+    by_business, by_day = {}, {}
+    for order in orders:
+        if order['payment_status'] == 'paid':
+            by_business[order['business']] = by_business.get(order['business'], 0) + order['total_amount']
+            day = order['created_at'].date()
+            by_day[day] = by_day.get(day, 0) + order['total_amount']
+
+    yield business_ids, counter, by_business, by_day
+    for collection in ('businesses', 'orders', 'daily_business_stats'):
+        db[collection].delete_many({})
+
+def _chart_by_day(chart, days):
+    """{date: revenue} of a revenue chart covering the last `days` days"""
+    start = (datetime.utcnow() - timedelta(days=days)).date()
+    dates = [start + timedelta(days=i) for i in range(len(chart['labels']))]
+    assert [date.strftime('%b %d') for date in dates] == chart['labels']
+    return dict(zip(dates, chart['data']))
+
+def test_top_businesses_is_one_query(seeded, monkeypatch):
+    from services.analytics_service import AnalyticsService
+    business_ids, counter, by_business, _ = seeded
+    start_date = datetime.utcnow() - timedelta(days=30)
+
+    results = {}
+    for rollups in ('false', 'true'):
+        monkeypatch.setenv('ANALYTICS_USE_ROLLUPS', rollups)
+        results[rollups], queries = counter.queries(lambda: AnalyticsService._get_top_businesses(start_date))
+        assert queries == 1, f"rollups={rollups}"
+
+    raw = results['false']
+    assert [row['business_id'] for row in raw] == [str(business_id) for business_id in reversed(business_ids)]
+    assert [row['business_name'] for row in raw] == [f"Business {i}" for i in range(4, -1, -1)]
+    for row in raw:
+        assert row['revenue'] == pytest.approx(by_business[ObjectId(row['business_id'])])
+    assert results['true'] == raw
+
+def test_revenue_chart_is_one_query(seeded, monkeypatch):
+    from services.analytics_service import AnalyticsService
+    _, counter, _, by_day = seeded
+
+    results = {}
+    for rollups in ('false', 'true'):
+        monkeypatch.setenv('ANALYTICS_USE_ROLLUPS', rollups)
+        chart, queries = counter.queries(lambda: AnalyticsService._get_revenue_chart_data(30))
+        assert queries == 1, f"rollups={rollups}"
+        results[rollups] = _chart_by_day(chart, 30)
+
+    raw = results['false']
+    assert {date: revenue for date, revenue in raw.items() if revenue} == pytest.approx(by_day)
+    assert results['true'] == pytest.approx(raw)